@@ -1,17 +1,10 @@
-import wcag_contrast_ratio as contrast
-from webcolors import name_to_hex, hex_to_rgb
+from ckanext.pose_theme.base.palette import contrast_ratio, parse_color, relative_luminance
 
 
 def get_rgb_from_color(color):
-    try:
-        hex_color = name_to_hex(color)
-    except ValueError:
-        hex_color = color
-
-    rgb_normalized = [round(float(float(i) / 255), 2) for i in hex_to_rgb(hex_color)]
-    return rgb_normalized
+    return list(parse_color(color))
 
 
 def get_contrast(color_1, color_2):
-
-    return contrast.rgb(get_rgb_from_color(color_1), get_rgb_from_color(color_2))
+    luminance = relative_luminance([parse_color(color_1), parse_color(color_2)])
+    return float(contrast_ratio(luminance[0], luminance[1]))
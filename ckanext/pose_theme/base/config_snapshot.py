@@ -0,0 +1,43 @@
+"""Objects built once per revision of a config value saved by the admin forms.
+
+The forms save a dict with ``config_option_update``, which replaces the
+config value of this worker, and the app globals refresh it in the others,
+so the raw value identifies the revision.
+"""
+import ast
+
+import ckan.plugins.toolkit as tk
+
+
+def parse_config_value(raw):
+    """Return the dict of a saved config value, or None when unset or invalid."""
+    if not raw:
+        return None
+    if isinstance(raw, dict):
+        return raw
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return None
+
+
+class ConfigSnapshot(object):
+    """The result of ``build`` for the current revision of the config ``key``.
+
+    ``build`` is called with the parsed value, None when it is unset, and
+    again only when the raw value changes.
+    """
+
+    def __init__(self, key, build):
+        self.key = key
+        self.build = build
+        # Replaced as a whole, a request never sees a value with the object of another
+        self._snapshot = (object(), None)
+
+    def get(self):
+        raw = tk.config.get(self.key)
+        cached_raw, snapshot = self._snapshot
+        if snapshot is None or cached_raw != raw:
+            snapshot = self.build(parse_config_value(raw))
+            self._snapshot = (raw, snapshot)
+        return snapshot
@@ -0,0 +1,168 @@
+import gzip
+import io
+
+import tinycss2
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# At-rules whose block contains rules rather than declarations
+NESTED_AT_RULES = {
+    'media', 'supports', 'document', '-moz-document', 'layer', 'container',
+    'keyframes', '-webkit-keyframes', '-moz-keyframes', '-o-keyframes',
+}
+# Tokens that never need whitespace around them. ``+`` needs its spaces in
+# ``calc()`` and a space before ``:`` is a descendant combinator in selectors.
+SELECTOR_LITERALS = {',', '>', '+', '~'}
+VALUE_LITERALS = {',', '/', ':'}
+
+
+def _minify_tokens(tokens, tight_literals=VALUE_LITERALS):
+    """Serialize component values with comments and redundant whitespace removed."""
+    parts = []
+    pending_space = False
+    for token in tokens:
+        if token.type == 'comment':
+            continue
+        if token.type == 'whitespace':
+            pending_space = True
+            continue
+        tight = token.type == 'literal' and token.value in tight_literals
+        if pending_space and parts and not tight and parts[-1] not in tight_literals:
+            parts.append(' ')
+        pending_space = False
+
+        if token.type == 'function':
+            parts.append('{}({})'.format(token.serialize().split('(', 1)[0], _minify_tokens(token.arguments, tight_literals)))
+        elif token.type in ('() block', '[] block', '{} block'):
+            opening = token.type[0]
+            closing = token.type[1]
+            parts.append(opening + _minify_tokens(token.content, tight_literals) + closing)
+        elif tight:
+            parts.append(token.value)
+        else:
+            parts.append(token.serialize())
+    return ''.join(parts).strip()
+
+
+def _error_message(error):
+    return 'Line {}, column {}: {}'.format(error.source_line, error.source_column, error.message)
+
+
+def _add_declaration(declarations, declaration):
+    # An exact repeat only matters in its last position
+    if declaration in declarations:
+        declarations.remove(declaration)
+    declarations.append(declaration)
+
+
+def _minify_declarations(tokens, errors):
+    declarations = []
+    for node in tinycss2.parse_declaration_list(tokens, skip_comments=True, skip_whitespace=True):
+        if node.type == 'error':
+            errors.append(_error_message(node))
+        elif node.type == 'declaration':
+            value = _minify_tokens(node.value)
+            if not value:
+                errors.append('Line {}, column {}: Empty value for "{}"'.format(
+                    node.source_line, node.source_column, node.name))
+                continue
+            # Custom property names are case-sensitive
+            name = node.name if node.name.startswith('--') else node.lower_name
+            _add_declaration(declarations, '{}:{}{}'.format(
+                name, value, '!important' if node.important else ''))
+    return declarations
+
+
+def _minify_rules(nodes, errors):
+    rules = []
+    for node in nodes:
+        if node.type == 'error':
+            errors.append(_error_message(node))
+        elif node.type == 'qualified-rule':
+            selector = _minify_tokens(node.prelude, SELECTOR_LITERALS)
+            declarations = _minify_declarations(node.content, errors)
+            if selector and declarations:
+                rules.append([selector, declarations])
+        elif node.type == 'at-rule':
+            prelude = _minify_tokens(node.prelude)
+            at_rule = '@{}{}'.format(node.at_keyword, ' ' + prelude if prelude else '')
+            if node.content is None:
+                rules.append([at_rule + ';', None])
+            elif node.lower_at_keyword in NESTED_AT_RULES:
+                nested = tinycss2.parse_rule_list(node.content, skip_comments=True, skip_whitespace=True)
+                rules.append([at_rule, '{' + _serialize(_minify_rules(nested, errors)) + '}'])
+            else:
+                rules.append([at_rule, '{' + ';'.join(_minify_declarations(node.content, errors)) + '}'])
+    return _deduplicate(rules)
+
+
+def _deduplicate(rules):
+    """Merge adjacent rules with the same selector and drop repeated rules.
+
+    Both keep the cascade intact: an identical rule that appears again later
+    always wins over the earlier copy.
+    """
+    merged = []
+    for selector, block in rules:
+        previous = merged[-1] if merged else None
+        if previous and previous[0] == selector and isinstance(block, list):
+            for declaration in block:
+                _add_declaration(previous[1], declaration)
+        else:
+            merged.append([selector, list(block) if isinstance(block, list) else block])
+
+    result = []
+    for selector, block in reversed(merged):
+        rule = [selector, ';'.join(block) if isinstance(block, list) else block]
+        if rule not in result:
+            result.insert(0, rule)
+    return result
+
+
+def _serialize(rules):
+    css = []
+    for selector, block in rules:
+        if block is None:
+            css.append(selector)
+        elif selector.startswith('@'):
+            css.append(selector + block)
+        else:
+            css.append('{}{{{}}}'.format(selector, block))
+    return ''.join(css)
+
+
+def minify_css(css):
+    """Parse, validate and minify a stylesheet.
+
+    Returns the minified CSS and a list of syntax error messages, invalid
+    parts are left out of the result.
+    """
+    errors = []
+    nodes = tinycss2.parse_stylesheet(css or '', skip_comments=True, skip_whitespace=True)
+    return _serialize(_minify_rules(nodes, errors)), errors
+
+
+def serialize_rules(rules):
+    """Serialize ``(selector, {property: value})`` pairs as minified CSS."""
+    css = ''.join(
+        '{}{{{}}}'.format(selector, ';'.join(
+            '{}:{}'.format(name, value) for name, value in declarations.items()))
+        for selector, declarations in rules
+    )
+    return minify_css(css)[0]
+
+
+def compress(data):
+    """Return the gzip and, when brotli is installed, brotli encoded ``data``."""
+    buffer = io.BytesIO()
+    # mtime=0 so that the same CSS always produces the same bytes
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(data)
+    variants = {'gzip': buffer.getvalue()}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return variants
@@ -0,0 +1,219 @@
+"""Build time removal of selectors no template or script uses.
+
+Every class and id of a selector must appear as a word in one of the
+templates or JavaScript files of the extension (and of CKAN core, whose
+templates the theme styles too) or match the safelist, otherwise the
+selector is dropped. Rules without selectors left are dropped as well.
+"""
+import fnmatch
+import os
+import posixpath
+import re
+from collections import namedtuple
+
+import tinycss2
+import yaml
+from ckan.lib.uploader import get_storage_path
+from ckan.plugins.toolkit import aslist, config
+
+from ckanext.pose_theme.base.css_minifier import minify_css
+
+
+SAFELIST = 'ckanext.pose_theme.css_safelist'
+LEAN_CSS_DIR = 'ckanext.pose_theme.lean_css_dir'
+# Classes added at runtime by CKAN modules, bootstrap and the vendored plugins
+DEFAULT_SAFELIST = (
+    'active', 'show', 'showing', 'open', 'in', 'fade', 'collapse', 'collapsing', 'collapsed',
+    'disabled', 'hidden', 'error', 'focus', 'hover', 'selected', 'loading', 'dropdown-*',
+    'modal-*', 'tooltip*', 'popover*', 'is-*', 'has-*', 'js-*', 'layout-*',
+    'slick-*', 'select2-*', 'sp-*', 'cke*', 'fa-*', 'icon-*',
+)
+SOURCE_EXTENSIONS = ('.html', '.js')
+WORD = re.compile(r'[A-Za-z_][\w-]*')
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The webassets library of the main bundle, served as a public directory too
+ASSETS_DIR = os.path.join(PACKAGE_DIR, 'custom_themes', 'pose_theme', 'assets')
+MAIN_BUNDLE = 'main-css'
+# Stylesheets of the main bundle that are pruned, the others are used as they are
+PRUNED = ('css/theme.css', 'css/style.css')
+# Name of the webassets library of the lean bundle
+LEAN_LIBRARY = 'pose_theme_lean'
+
+CSS_URL = re.compile(r'url\((["\']?)([^"\')]+)\1\)')
+
+PruneResult = namedtuple('PruneResult', ['path', 'lean_path', 'size', 'lean_size', 'removed'])
+
+
+def get_lean_css_dir():
+    directory = config.get(LEAN_CSS_DIR)
+    if directory:
+        return directory
+    storage_path = get_storage_path()
+    if storage_path:
+        return os.path.join(storage_path, 'storage', 'pose_lean_css')
+
+
+def lean_name(path):
+    return '{}.lean.css'.format(os.path.splitext(os.path.basename(path))[0])
+
+
+def get_source_dirs(include_core=True):
+    """Directories with the templates and scripts that may use a selector."""
+    directories = [PACKAGE_DIR]
+    if include_core:
+        try:
+            import ckan
+        except ImportError:
+            pass
+        else:
+            ckan_dir = os.path.dirname(ckan.__file__)
+            directories += [os.path.join(ckan_dir, 'templates'), os.path.join(ckan_dir, 'public')]
+    return directories
+
+
+def collect_used_names(directories):
+    """Return every word of the templates and scripts under ``directories``.
+
+    Words rather than parsed ``class`` attributes, so that classes put
+    together in Jinja or JavaScript are kept as long as their name appears.
+    """
+    names = set()
+    for directory in directories:
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if not filename.endswith(SOURCE_EXTENSIONS) or filename.endswith('.min.js'):
+                    continue
+                with open(os.path.join(root, filename), encoding='utf-8', errors='ignore') as source:
+                    names.update(WORD.findall(source.read()))
+    return names
+
+
+def get_safelist(extra=()):
+    return tuple(aslist(config.get(SAFELIST, ''))) + DEFAULT_SAFELIST + tuple(extra)
+
+
+class SelectorFilter(object):
+    def __init__(self, used_names, safelist):
+        self.used_names = used_names
+        self.safelist = safelist
+
+    def is_used(self, name):
+        return name in self.used_names or any(
+            fnmatch.fnmatchcase(name, pattern) for pattern in self.safelist)
+
+    def keeps(self, selector_tokens):
+        """Whether every class and id of a selector is used.
+
+        Only the top level is checked, arguments such as the ones of
+        ``:not()`` can not make a selector unused.
+        """
+        previous = None
+        for token in selector_tokens:
+            if token.type == 'ident' and previous is not None \
+                    and previous.type == 'literal' and previous.value == '.':
+                if not self.is_used(token.value):
+                    return False
+            elif token.type == 'hash' and token.is_identifier and not self.is_used(token.value):
+                return False
+            previous = token
+        return True
+
+
+def split_selectors(prelude):
+    """Split the tokens of a selector list on its top level commas only, e.g. not in ``:not()``."""
+    selectors = [[]]
+    for token in prelude:
+        if token.type == 'literal' and token.value == ',':
+            selectors.append([])
+        else:
+            selectors[-1].append(token)
+    return selectors
+
+
+def _prune_rules(nodes, selector_filter, counter):
+    pruned = []
+    for node in nodes:
+        if node.type == 'qualified-rule':
+            selectors = split_selectors(node.prelude)
+            kept = [tokens for tokens in selectors if selector_filter.keeps(tokens)]
+            counter[0] += len(selectors) - len(kept)
+            if kept:
+                pruned.append('{}{{{}}}'.format(
+                    ','.join(tinycss2.serialize(tokens) for tokens in kept),
+                    tinycss2.serialize(node.content)))
+        elif node.type == 'at-rule' and node.lower_at_keyword in ('media', 'supports') \
+                and node.content is not None:
+            nested = tinycss2.parse_rule_list(node.content, skip_comments=True, skip_whitespace=True)
+            nested = _prune_rules(nested, selector_filter, counter)
+            if nested:
+                pruned.append('@{} {}{{{}}}'.format(
+                    node.at_keyword, tinycss2.serialize(node.prelude).strip(), ''.join(nested)))
+        elif node.type == 'at-rule':
+            pruned.append(node.serialize())
+    return pruned
+
+
+def prune_css(css, used_names, safelist=DEFAULT_SAFELIST):
+    """Return ``css`` minified and without unused selectors, and the number removed."""
+    counter = [0]
+    nodes = tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True)
+    pruned = ''.join(_prune_rules(nodes, SelectorFilter(used_names, safelist), counter))
+    return minify_css(pruned)[0], counter[0]
+
+
+def rebase_urls(css, path):
+    """Make the relative ``url()`` of the stylesheet at ``path`` (relative to
+    the assets directory) absolute, the lean copy is stored somewhere else."""
+    base = '/' + posixpath.dirname(path) + '/'
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('/', '#', 'data:')) or ':' in url.split('/')[0]:
+            return match.group(0)
+        return 'url({0}{1}{0})'.format(quote, posixpath.normpath(posixpath.join(base, url)))
+    return CSS_URL.sub(rebase, css)
+
+
+def lean_bundle(webassets_path=os.path.join(ASSETS_DIR, 'webassets.yml')):
+    """Return the main bundle of ``webassets_path`` as it is served from the
+    lean directory: the pruned stylesheets by name, the others by absolute path."""
+    with open(webassets_path, encoding='utf-8') as webassets_file:
+        bundle = dict(yaml.safe_load(webassets_file)[MAIN_BUNDLE])
+    bundle['output'] = 'pose_theme/assets_main_lean.css'
+    bundle['contents'] = [
+        lean_name(item) if item in PRUNED else os.path.join(os.path.dirname(webassets_path), item)
+        for item in bundle['contents']]
+    return bundle
+
+
+def prune_bundles(used_names, safelist, output_dir, dry_run=False):
+    """Write the lean copy of the stylesheets of the main bundle to ``output_dir``.
+
+    A ``webassets.yml`` with a ``main-css`` bundle of the lean copies and
+    the other stylesheets of the bundle is written next to them, CKAN
+    registers it as ``pose_theme_lean/main-css`` on start when
+    ``ckanext.pose_theme.lean_css`` is enabled.
+
+    :returns: ``{bundle: [PruneResult, ...]}``
+    """
+    results = []
+    for item in PRUNED:
+        path = os.path.join(ASSETS_DIR, item)
+        with open(path, encoding='utf-8') as css_file:
+            css = css_file.read()
+        lean_css, removed = prune_css(css, used_names, safelist)
+        lean_css = rebase_urls(lean_css, item)
+        lean_path = os.path.join(output_dir, lean_name(item))
+        if not dry_run:
+            os.makedirs(output_dir, exist_ok=True)
+            with open(lean_path, 'w', encoding='utf-8') as lean_file:
+                lean_file.write(lean_css)
+        results.append(PruneResult(
+            path, lean_path, len(css.encode('utf-8')), len(lean_css.encode('utf-8')), removed))
+    if not dry_run:
+        # Written last, the bundle is only registered once every file exists
+        with open(os.path.join(output_dir, 'webassets.yml'), 'w', encoding='utf-8') as webassets_file:
+            yaml.safe_dump({MAIN_BUNDLE: lean_bundle()}, webassets_file, default_flow_style=False)
+    return {'pose_theme/' + MAIN_BUNDLE: results}
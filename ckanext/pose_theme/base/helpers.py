@@ -252,6 +252,18 @@ def get_data(key):
     return BaseCompatibilityController.get_data(key)
 
 
+def use_lean_css():
+    """Whether to serve the stylesheets built by ``ckan pose-theme prune-css``.
+
+    The full bundle is served until the lean one was registered on start,
+    i.e. when prune-css was not run yet.
+    """
+    if not toolkit.asbool(config.get('ckanext.pose_theme.lean_css', False)):
+        return False
+    from ckan.lib import webassets_tools
+    return 'pose_theme_lean/main-css' in webassets_tools.env
+
+
 def version_builder(text_version):
     return Version(text_version)
 
@@ -0,0 +1,123 @@
+"""Vectorized WCAG contrast checks for whole colour palettes.
+
+Colours are parsed once per process and kept at full precision, the
+luminance and contrast ratios of all colours of one or many palettes are
+computed in a single NumPy pass.
+"""
+from functools import lru_cache
+
+import numpy as np
+from webcolors import hex_to_rgb, name_to_hex, rgb_to_hex
+
+
+# WCAG 2.x minimum contrast ratios
+AA = 4.5
+AA_LARGE = 3.0
+AAA = 7.0
+AAA_LARGE = 4.5
+
+# Candidates per direction when looking for the nearest passing colour
+SEARCH_STEPS = 256
+
+
+@lru_cache(maxsize=1024)
+def parse_color(color):
+    """Return the sRGB channels of a CSS colour name or hex value in 0..1."""
+    color = color.strip().lower()
+    try:
+        hex_color = name_to_hex(color)
+    except ValueError:
+        hex_color = color
+    return tuple(channel / 255.0 for channel in hex_to_rgb(hex_color))
+
+
+def to_rgb_array(colors):
+    """Parse a (nested) sequence of colours into an array of shape (..., 3)."""
+    colors = np.asarray(colors, dtype=object)
+    parsed = np.array([parse_color(color) for color in colors.ravel()], dtype=float)
+    return parsed.reshape(colors.shape + (3,))
+
+
+def to_hex(rgb):
+    return rgb_to_hex(tuple(int(round(channel * 255)) for channel in rgb))
+
+
+def relative_luminance(rgb):
+    """WCAG relative luminance of an array of sRGB colours of shape (..., 3)."""
+    rgb = np.asarray(rgb, dtype=float)
+    linear = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def contrast_ratio(luminance_1, luminance_2):
+    lighter = np.maximum(luminance_1, luminance_2)
+    darker = np.minimum(luminance_1, luminance_2)
+    return (lighter + 0.05) / (darker + 0.05)
+
+
+def contrast_matrix(colors):
+    """Return the contrast ratio of every pair of ``colors`` as an N x N matrix."""
+    luminance = relative_luminance(to_rgb_array(colors))
+    return contrast_ratio(luminance[:, None], luminance[None, :])
+
+
+def batch_contrast(palettes, pairs):
+    """Contrast ratios of the index ``pairs`` for many palettes at once.
+
+    :param palettes: P palettes, each a sequence of N colours
+    :param pairs: K ``(i, j)`` index pairs into a palette
+    :returns: array of shape (P, K)
+    """
+    luminance = relative_luminance(to_rgb_array(palettes))
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+    return contrast_ratio(luminance[:, pairs[:, 0]], luminance[:, pairs[:, 1]])
+
+
+def nearest_passing_color(color, against, minimum_ratio=AA):
+    """Return the colour closest to ``color`` that reaches ``minimum_ratio`` against ``against``.
+
+    Candidates are ``color`` mixed towards black and towards white, the one
+    with the smallest RGB distance wins. ``None`` when nothing passes.
+    """
+    rgb = np.array(parse_color(color))
+    steps = np.linspace(0, 1, SEARCH_STEPS)[:, None]
+    candidates = np.concatenate([rgb * (1 - steps), rgb + (1 - rgb) * steps])
+    # Snap to the colours a hex value can express before checking them
+    candidates = np.round(candidates * 255) / 255
+    ratios = contrast_ratio(relative_luminance(candidates),
+                            relative_luminance(parse_color(against)))
+    passing = ratios >= minimum_ratio
+    if not passing.any():
+        return None
+    distances = np.linalg.norm(candidates - rgb, axis=1)
+    return to_hex(candidates[passing][np.argmin(distances[passing])])
+
+
+def failing_pairs(palette, pairs, minimum_ratio=AA, suggest=True):
+    """Check ``pairs`` of a ``{name: colour}`` palette.
+
+    :returns: a list with a dict for every pair below ``minimum_ratio``, with
+        the nearest passing replacement of the second colour of the pair.
+    """
+    pairs = [(name_1, name_2) for name_1, name_2 in pairs
+             if palette.get(name_1) and palette.get(name_2)]
+    if not pairs:
+        return []
+    names = sorted({name for pair in pairs for name in pair})
+    index = {name: i for i, name in enumerate(names)}
+    ratios = batch_contrast([[palette[name] for name in names]],
+                            [(index[name_1], index[name_2]) for name_1, name_2 in pairs])[0]
+
+    failing = []
+    for (name_1, name_2), ratio in zip(pairs, ratios):
+        if ratio >= minimum_ratio:
+            continue
+        failure = {
+            'pair': [name_1, name_2],
+            'colors': [palette[name_1], palette[name_2]],
+            'ratio': round(float(ratio), 2),
+        }
+        if suggest:
+            failure['suggestion'] = nearest_passing_color(palette[name_2], palette[name_1], minimum_ratio)
+        failing.append(failure)
+    return failing
@@ -1,27 +1,47 @@
 import abc
+from collections import namedtuple
 from six import ensure_str
 
 
+ParsedValue = namedtuple('ParsedValue', ['form_name', 'title', 'value'])
+
+
 class AbstractParser(object):
+    """Immutable description of one form field.
+
+    Parsing never stores anything on the parser, it returns a ``ParsedValue``
+    so the same parser can serve concurrent requests.
+    """
     __metaclass__ = abc.ABCMeta
     class_name = ''
     form_name = ''
     title = ''
     location = ''
-    value = ''
+    variable = ''
     _default_value = ''
 
+    def __setattr__(self, name, value):
+        raise AttributeError('{} is immutable'.format(type(self).__name__))
+
     @property
     def default_value(self):
         return self._default_value
 
     @classmethod
     def get_css_from_data(cls, data):
-        cls.parse_form_data(data)
-        if cls.value:
-            return {cls.location: ensure_str(cls.value)}
+        return cls.get_css_declaration(cls.parse_form_data(data))
+
+    @classmethod
+    def get_css_declaration(cls, parsed):
+        if parsed.value:
+            return {cls.location: ensure_str(parsed.value)}
+
+    @classmethod
+    def get_css_variable(cls, parsed):
+        if parsed.value:
+            return {cls.variable: ensure_str(parsed.value)}
 
     @classmethod
     def parse_form_data(cls, data):
         value = data.get(cls.form_name, cls._default_value)
-        cls.value = value
+        return ParsedValue(cls.form_name, cls.title, value)
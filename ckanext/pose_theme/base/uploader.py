@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+
+import ckan.lib.uploader as uploader
+import ckan.model as model
+from ckan.plugins.toolkit import ValidationError, config, aslist
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def content_addressed_upload_types():
+    return aslist(config.get('ckanext.pose_theme.content_addressed_upload_types', 'hero showcase'))
+
+
+def is_content_addressed(filename):
+    return bool(CONTENT_ADDRESSED_NAME.match(os.path.basename(filename or '')))
+
+
+def file_digest(fileobj):
+    """Return the SHA-256 hex digest of ``fileobj`` and rewind it."""
+    sha256 = hashlib.sha256()
+    fileobj.seek(0)
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+        sha256.update(chunk)
+    fileobj.seek(0)
+    return sha256.hexdigest()
+
+
+class ContentAddressedUpload(uploader.Upload):
+    """Stores uploads under the SHA-256 of their content.
+
+    Identical files share one blob, so a blob is never removed when a form
+    replaces or clears its image, ``ckan pose-theme gc-uploads`` deletes the
+    ones nothing references anymore.
+    """
+
+    def update_data_dict(self, data_dict, url_field, file_field, clear_field):
+        super(ContentAddressedUpload, self).update_data_dict(
+            data_dict, url_field, file_field, clear_field)
+        if not (self.storage_path and self.filename):
+            return
+
+        extension = os.path.splitext(self.filename)[1].lower()
+        self.filename = file_digest(self.upload_file) + extension
+        self.filepath = os.path.join(self.storage_path, self.filename)
+        data_dict[url_field] = self.filename
+
+    def upload(self, max_size=2):
+        if not self.filename:
+            return
+        if os.path.exists(self.filepath):
+            logger.debug('[pose_theme] Upload %s already stored', self.filename)
+            self.upload_file.close()
+            # Referenced again, gc-uploads leaves it alone for its minimum age
+            os.utime(self.filepath)
+            return
+
+        if hasattr(self, 'verify_type'):
+            self.verify_type()
+        # Unique so that concurrent uploads of the same file do not collide
+        tmp_filepath = '{}~{}'.format(self.filepath, uuid.uuid4().hex)
+        with open(tmp_filepath, 'wb+') as output_file:
+            try:
+                uploader._copy_file(self.upload_file, output_file, max_size)
+            except ValidationError:
+                os.remove(tmp_filepath)
+                raise
+            finally:
+                self.upload_file.close()
+        os.rename(tmp_filepath, self.filepath)
+
+
+def referenced_uploads():
+    """Return the file names of all uploads still referenced in the DB."""
+    from ckanext.pose_theme.pose_custom_heroslider import db as hero_db
+
+    urls = set()
+    if hero_db.hero_slide_table is not None:
+        urls.update(url for (url,) in model.Session.query(hero_db.Hero_Slide.image_url))
+    urls.update(
+        url for (url,) in model.Session.query(model.PackageExtra.value)
+        .filter(model.PackageExtra.key == 'image_url')
+    )
+    urls.update(url for (url,) in model.Session.query(model.Group.image_url))
+    return {os.path.basename(url) for url in urls if url}
+
+
+def unreferenced_uploads(min_age=0):
+    """Yield the paths of content-addressed blobs nothing references.
+
+    Blobs stored or reused in the last ``min_age`` seconds are skipped, the
+    row referencing them may not be committed yet.
+    """
+    storage_path = uploader.get_storage_path()
+    if not storage_path:
+        return
+    cutoff = time.time() - min_age
+    referenced = referenced_uploads()
+    for upload_to in content_addressed_upload_types():
+        directory = os.path.join(storage_path, 'storage', 'uploads', upload_to)
+        if not os.path.isdir(directory):
+            continue
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if (is_content_addressed(filename) and filename not in referenced
+                    and os.path.getmtime(path) < cutoff):
+                yield path
@@ -0,0 +1,21 @@
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.pose_theme.routes import rate_limit
+
+
+@toolkit.side_effect_free
+def pose_theme_contact_rejections(context, data_dict):
+    """Number of contact form submissions turned away, by reason.
+
+    The counts are per worker process with the ``memory`` rate limit
+    backend and for the whole site with ``redis``.
+
+    :returns: ``rate_limited_user``, ``rate_limited_ip`` and ``duplicate``
+        counts and the backend they come from
+    :rtype: dict
+    """
+    toolkit.check_access('pose_theme_contact_rejections', context, data_dict)
+
+    counters = rate_limit.get_guard().counters()
+    counters['backend'] = rate_limit.get_backend_name()
+    return counters
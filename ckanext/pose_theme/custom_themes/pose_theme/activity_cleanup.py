@@ -0,0 +1,196 @@
+# encoding: utf-8
+"""Deletion of activity records in small batches.
+
+The rows of a batch are found in the order of their id, starting after the
+last id of the previous batch, and every batch is committed on its own.
+Locks are held only for one batch, the WAL grows one batch at a time and an
+interrupted run resumes after the last deleted id.
+
+The optional expression index on the type of the package of an activity
+makes finding the rows of a dataset type a range scan of the index instead
+of a cast of the data of every activity to JSONB.
+
+The retention policy gives the age after which the activities of each
+dataset type are pruned, e.g. ``extension:180d site:365d dataset:keep``.
+"""
+import datetime
+import logging
+import re
+import time
+from collections import namedtuple
+
+import sqlalchemy as sa
+
+import ckan.model as model
+from ckan.plugins import toolkit
+from ckanext.activity.model.activity import Activity, ActivityDetail
+
+log = logging.getLogger(__name__)
+
+KEEP = 'keep'
+AGE_UNITS = {'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+# Key of the advisory lock held while activities are pruned
+PRUNE_LOCK_KEY = 0x706f7365  # "pose"
+
+Batch = namedtuple('Batch', ['ids', 'size'])
+
+INDEX_NAME = 'idx_pose_activity_package_type'
+
+# Inlined, not bound, so that PostgreSQL matches it with the index expression
+PACKAGE_TYPE_SQL = "(CAST(activity.data AS jsonb) -> 'package' ->> 'type')"
+
+CREATE_INDEX_SQL = (
+    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} '
+    f"ON activity ((CAST(data AS jsonb) -> 'package' ->> 'type'), id)"
+)
+DROP_INDEX_SQL = f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'
+
+
+def package_type():
+    """Type of the package of an activity, as the index stores it."""
+    return sa.literal_column(PACKAGE_TYPE_SQL)
+
+
+def _run_outside_transaction(sql):
+    # CONCURRENTLY does not lock the table but can not run in a transaction
+    with model.meta.engine.connect() as connection:
+        connection.execution_options(isolation_level='AUTOCOMMIT').execute(sa.text(sql))
+
+
+def create_index():
+    _run_outside_transaction(CREATE_INDEX_SQL)
+
+
+def drop_index():
+    _run_outside_transaction(DROP_INDEX_SQL)
+
+
+def has_index():
+    return bool(model.Session.execute(
+        sa.text('SELECT 1 FROM pg_indexes WHERE indexname = :name'), {'name': INDEX_NAME}).first())
+
+
+def count(criterion, after=None):
+    query = model.Session.query(sa.func.count(Activity.id)).filter(criterion)
+    if after:
+        query = query.filter(Activity.id > after)
+    return query.scalar()
+
+
+def find_batch(criterion, after=None, batch_size=1000):
+    """Ids of the next ``batch_size`` activities matching ``criterion`` after the id ``after``."""
+    query = model.Session.query(Activity.id).filter(criterion)
+    if after:
+        query = query.filter(Activity.id > after)
+    return [activity_id for activity_id, in query.order_by(Activity.id).limit(batch_size)]
+
+
+def rows_size(ids):
+    """Bytes taken by the activity rows of ``ids``, before compression of the table."""
+    return model.Session.query(
+        sa.func.coalesce(sa.func.sum(sa.func.pg_column_size(sa.literal_column('activity.*'))), 0)
+    ).filter(Activity.id.in_(ids)).scalar()
+
+
+def delete_batch(ids, lock_timeout=None):
+    """Delete the activities of ``ids`` in one transaction, return the bytes of their rows."""
+    if lock_timeout:
+        # Give up on the batch rather than queue behind the site for the locks
+        model.Session.execute(sa.text(f"SET LOCAL lock_timeout = '{int(lock_timeout * 1000)}ms'"))
+    size = rows_size(ids)
+    # Activity details of old CKAN versions reference their activity
+    model.Session.query(ActivityDetail).filter(
+        ActivityDetail.activity_id.in_(ids)).delete(synchronize_session=False)
+    model.Session.query(Activity).filter(Activity.id.in_(ids)).delete(synchronize_session=False)
+    model.Session.commit()
+    return size
+
+
+def delete_in_batches(criterion, batch_size=1000, after=None, sleep=0, dry_run=False, lock_timeout=None):
+    """Delete the activities matching ``criterion`` batch after batch.
+
+    Yields a ``Batch`` of the ids and the bytes of the rows of every batch
+    once it is committed, or found only when ``dry_run``. ``sleep`` seconds
+    are waited between two batches to leave room for the site and the
+    replicas.
+    """
+    while True:
+        ids = find_batch(criterion, after, batch_size)
+        if not ids:
+            model.Session.commit()
+            return
+        if dry_run:
+            size = rows_size(ids)
+            model.Session.rollback()
+        else:
+            size = delete_batch(ids, lock_timeout)
+        yield Batch(ids, size)
+        after = ids[-1]
+        if len(ids) < batch_size:
+            return
+        if sleep:
+            time.sleep(sleep)
+
+
+def parse_policy(value):
+    """``{dataset_type: max_age}`` of a policy like ``extension:180d, dataset:keep``.
+
+    The age is a number of hours, days or weeks, ``keep`` keeps the
+    activities forever and is stored as None.
+    """
+    policy = {}
+    for rule in (value or '').replace(',', ' ').split():
+        dataset_type, _, age = rule.partition(':')
+        if not dataset_type or not age:
+            raise ValueError(f'Invalid activity retention rule "{rule}", expected <dataset type>:<age>')
+        if age == KEEP:
+            policy[dataset_type] = None
+            continue
+        match = re.match(r'^(\d+)([hdw])$', age)
+        if not match:
+            raise ValueError(f'Invalid age "{age}" of dataset type "{dataset_type}", expected e.g. 180d or keep')
+        policy[dataset_type] = datetime.timedelta(**{AGE_UNITS[match.group(2)]: int(match.group(1))})
+    return policy
+
+
+def format_age(max_age):
+    hours = int(max_age.total_seconds() // 3600)
+    return f'{hours // 24}d' if hours % 24 == 0 else f'{hours}h'
+
+
+def get_retention_policy():
+    return parse_policy(toolkit.config.get('ckanext.pose_theme.activity_retention', ''))
+
+
+def expired(dataset_type, max_age, now=None):
+    """Criterion of the activities of ``dataset_type`` older than ``max_age``."""
+    cutoff = (now or datetime.datetime.utcnow()) - max_age
+    return sa.and_(package_type() == dataset_type, Activity.timestamp < cutoff)
+
+
+class PruneLock(object):
+    """Advisory lock that keeps two runs of prune-activities apart.
+
+    It is held by a connection of its own, the session returns its
+    connection to the pool after every batch.
+    """
+
+    def __init__(self):
+        self.connection = None
+
+    def acquire(self):
+        # Session level lock, the connection does not stay in a transaction
+        self.connection = model.meta.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        acquired = self.connection.execute(
+            sa.text('SELECT pg_try_advisory_lock(:key)'), {'key': PRUNE_LOCK_KEY}).scalar()
+        if not acquired:
+            self.connection.close()
+            self.connection = None
+        return bool(acquired)
+
+    def release(self):
+        if self.connection is not None:
+            self.connection.execute(sa.text('SELECT pg_advisory_unlock(:key)'), {'key': PRUNE_LOCK_KEY})
+            self.connection.close()
+            self.connection = None
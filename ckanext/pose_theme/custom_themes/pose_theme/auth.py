@@ -0,0 +1,3 @@
+def pose_theme_contact_rejections(context, data_dict):
+    # Sysadmins only
+    return {'success': False}
@@ -0,0 +1,328 @@
+# encoding: utf-8
+"""Benchmark of the pages of the theme on a synthetic catalog.
+
+``seed`` creates organizations, groups, datasets, extensions, sites and
+showcases named ``bench-*``, with featured extensions and sites and the
+story tags of the homepage, so that every section of the pages has
+something to render. ``bench`` then renders every page through a test client
+and reports, per page, the latency percentiles and how many SQL queries,
+action calls and Solr requests one request made.
+
+The report is JSON, to compare two commits run against the same catalog.
+"""
+import contextlib
+import datetime
+import functools
+import logging
+import math
+import os
+import statistics
+import subprocess
+import time
+from collections import Counter
+
+import sqlalchemy as sa
+
+import ckan
+import ckan.logic as logic
+import ckan.model as model
+from ckan.plugins import toolkit
+
+log = logging.getLogger(__name__)
+
+PREFIX = 'bench-'
+
+# Number of each kind of entity seeded by default
+DEFAULT_COUNTS = {
+    'organizations': 5,
+    'groups': 5,
+    'datasets': 50,
+    'extensions': 50,
+    'sites': 50,
+    'showcases': 12,
+}
+
+# Every FEATURED_EVERY-th extension and site is featured
+FEATURED_EVERY = 4
+
+# Tags of the showcases, in turn, as the story helpers of the homepage read them
+STORY_TAGS = (['story'], ['story-1'], ['story-2'], ['story banner'], ['other'])
+
+PAGES = (
+    '/',
+    '/extension/',
+    '/site/',
+    '/dataset/',
+    '/organization/',
+    f'/organization/{PREFIX}organization-0',
+    f'/extension/{PREFIX}extension-0',
+)
+
+
+def _name(kind, index):
+    return f'{PREFIX}{kind}-{index}'
+
+
+def _site_context():
+    site_user = toolkit.get_action('get_site_user')({'ignore_auth': True}, {})
+    return {'user': site_user['name'], 'ignore_auth': True}
+
+
+def _exists(show_action, name):
+    try:
+        toolkit.get_action(show_action)(_site_context(), {'id': name})
+        return True
+    except toolkit.ObjectNotFound:
+        return False
+
+
+def _create(create_action, show_action, data_dict):
+    """Create ``data_dict`` unless an entity of its name exists, return True when created."""
+    if _exists(show_action, data_dict['name']):
+        return False
+    toolkit.get_action(create_action)(_site_context(), data_dict)
+    return True
+
+
+def showcases_available():
+    try:
+        toolkit.get_action('ckanext_showcase_create')
+        return True
+    except KeyError:
+        return False
+
+
+def seed(counts=None):
+    """Create the entities of the catalog that do not exist yet.
+
+    :param counts: ``{kind: number}``, the missing kinds fall back to
+        ``DEFAULT_COUNTS``
+    :returns: ``{kind: number created}``
+    """
+    counts = dict(DEFAULT_COUNTS, **(counts or {}))
+    organizations = [_name('organization', i) for i in range(max(counts['organizations'], 1))]
+    groups = [_name('group', i) for i in range(counts['groups'])]
+    created = Counter()
+
+    def owner(index):
+        return organizations[index % len(organizations)]
+
+    for name in organizations:
+        created['organizations'] += _create('organization_create', 'organization_show', {
+            'name': name, 'title': name.replace('-', ' ').title()})
+    for name in groups:
+        created['groups'] += _create('group_create', 'group_show', {
+            'name': name, 'title': name.replace('-', ' ').title()})
+
+    for i in range(counts['datasets']):
+        created['datasets'] += _create('package_create', 'package_show', {
+            'name': _name('dataset', i),
+            'title': f'Bench dataset {i}',
+            'notes': f'Synthetic dataset {i} of the benchmark.',
+            'owner_org': owner(i),
+            'groups': [{'name': groups[i % len(groups)]}] if groups and i % 2 == 0 else [],
+            'tag_string': f'bench,tag-{i % 10}',
+            'resources': [{'url': f'https://example.com/bench/{i}.csv', 'name': f'Data {i}', 'format': 'CSV'}],
+        })
+    for i in range(counts['extensions']):
+        created['extensions'] += _create('package_create', 'package_show', {
+            'type': 'extension',
+            'name': _name('extension', i),
+            'title': f'Bench extension {i}',
+            'notes': f'Synthetic extension {i} of the benchmark.',
+            'owner_org': owner(i),
+            'contact_name': 'Bench',
+            'extension_type': 'theme' if i % 2 else 'dataset_type',
+            'is_featured': 'TRUE' if i % FEATURED_EVERY == 0 else 'FALSE',
+            'tag_string': f'bench,tag-{i % 10}',
+        })
+    for i in range(counts['sites']):
+        created['sites'] += _create('package_create', 'package_show', {
+            'type': 'site',
+            'name': _name('site', i),
+            'title': f'Bench site {i}',
+            'notes': f'Synthetic site {i} of the benchmark.',
+            'owner_org': owner(i),
+            'is_featured': 'TRUE' if i % FEATURED_EVERY == 0 else 'FALSE',
+        })
+
+    if counts['showcases'] and not showcases_available():
+        log.warning('The showcase plugin is not enabled, no showcase is seeded')
+    elif counts['showcases']:
+        for i in range(counts['showcases']):
+            created['showcases'] += _create('ckanext_showcase_create', 'package_show', {
+                'name': _name('showcase', i),
+                'title': f'Bench showcase {i}',
+                'notes': f'Synthetic showcase {i} of the benchmark.',
+                'owner_org': owner(i),
+                'tag_string': ','.join(STORY_TAGS[i % len(STORY_TAGS)]),
+            })
+    return dict(created)
+
+
+def purge():
+    """Purge every ``bench-*`` entity, return how many were purged."""
+    context = _site_context()
+    pattern = f'{PREFIX}%'
+    packages = [name for name, in model.Session.query(model.Package.name).filter(model.Package.name.like(pattern))]
+    groups = model.Session.query(model.Group.name, model.Group.is_organization).filter(model.Group.name.like(pattern))
+    groups = list(groups)
+    for name in packages:
+        toolkit.get_action('dataset_purge')(dict(context), {'id': name})
+    # The organizations go last, once they own no dataset
+    for name, is_organization in sorted(groups, key=lambda group: group[1]):
+        action = 'organization_purge' if is_organization else 'group_purge'
+        toolkit.get_action(action)(dict(context), {'id': name})
+    return len(packages) + len(groups)
+
+
+class Counts(object):
+    """SQL queries, action calls and Solr requests made since the last ``reset``."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sql = 0
+        self.solr = 0
+        self.actions = Counter()
+
+    def add_sql(self, *args, **kwargs):
+        self.sql += 1
+
+    def add_solr(self):
+        self.solr += 1
+
+    def add_action(self, name):
+        self.actions[name] += 1
+
+
+def _counted_action(counts, name, action):
+    @functools.wraps(action)
+    def wrapper(*args, **kwargs):
+        counts.add_action(name)
+        return action(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrumented():
+    """Count the SQL queries, action calls and Solr requests made in the block.
+
+    The action functions are wrapped in the registry that ``get_action``
+    returns them from, the Solr requests are counted on the pysolr client
+    and the SQL queries with an event of the engine. Everything is put back
+    on exit.
+
+    :returns: the ``Counts``
+    """
+    import pysolr
+    from sqlalchemy import event
+
+    counts = Counts()
+    # Fills the registry of the actions of the enabled plugins
+    logic.get_action('package_show')
+    actions = dict(logic._actions)
+    send_request = pysolr.Solr._send_request
+
+    def counted_send_request(*args, **kwargs):
+        counts.add_solr()
+        return send_request(*args, **kwargs)
+
+    for name, action in actions.items():
+        logic._actions[name] = _counted_action(counts, name, action)
+    pysolr.Solr._send_request = counted_send_request
+    event.listen(model.meta.engine, 'before_cursor_execute', counts.add_sql)
+    try:
+        yield counts
+    finally:
+        event.remove(model.meta.engine, 'before_cursor_execute', counts.add_sql)
+        pysolr.Solr._send_request = send_request
+        logic._actions.update(actions)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[max(int(math.ceil(percent / 100.0 * len(ordered))) - 1, 0)]
+
+
+def bench_page(client, counts, path, runs=20, warmup=2):
+    """Render ``path`` ``warmup`` times, then ``runs`` times and return its statistics.
+
+    The latencies are in milliseconds, the counts are the median of the
+    measured requests and the actions those of the last one.
+    """
+    for _ in range(warmup):
+        client.get(path)
+    timings, sql, solr, actions = [], [], [], []
+    status = None
+    for _ in range(runs):
+        counts.reset()
+        start = time.perf_counter()
+        response = client.get(path)
+        response.get_data()
+        timings.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+        sql.append(counts.sql)
+        solr.append(counts.solr)
+        actions.append(counts.actions.copy())
+        model.Session.remove()
+    return {
+        'status': status,
+        'runs': runs,
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'sql_queries': int(statistics.median_low(sql)),
+        'action_calls': int(statistics.median_low([sum(calls.values()) for calls in actions])),
+        'solr_calls': int(statistics.median_low(solr)),
+        'actions': dict(sorted(actions[-1].items())),
+    }
+
+
+def git_commit():
+    """Commit of the checkout of the extension, None outside of a git checkout."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench(app, pages=PAGES, runs=20, warmup=2):
+    """Render ``pages`` through a test client of the CKAN WSGI ``app``.
+
+    :returns: the report, ``{'meta': {...}, 'pages': {path: statistics}}``
+    """
+    from werkzeug.test import Client
+
+    client = Client(app)
+    report = {'meta': {
+        'commit': git_commit(),
+        'ckan_version': ckan.__version__,
+        'timestamp': datetime.datetime.utcnow().replace(microsecond=0).isoformat() + 'Z',
+        'runs': runs,
+        'warmup': warmup,
+        'catalog': catalog_size(),
+    }, 'pages': {}}
+    with instrumented() as counts:
+        for path in pages:
+            report['pages'][path] = bench_page(client, counts, path, runs, warmup)
+    return report
+
+
+def catalog_size():
+    """Number of active datasets of every type and of organizations and groups."""
+    size = Counter(dict(
+        model.Session.query(model.Package.type, sa.func.count(model.Package.id))
+        .filter(model.Package.state == 'active').group_by(model.Package.type)))
+    for is_organization, number in (
+            model.Session.query(model.Group.is_organization, sa.func.count(model.Group.id))
+            .filter(model.Group.state == 'active').group_by(model.Group.is_organization)):
+        size['organization' if is_organization else 'group'] += number
+    model.Session.remove()
+    return dict(sorted(size.items()))
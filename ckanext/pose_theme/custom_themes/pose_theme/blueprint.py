@@ -1,18 +1,50 @@
-from flask import Blueprint, make_response
+import re
+
+from flask import Blueprint, request
+from ckan.plugins.toolkit import asbool
+import ckanext.pose_theme.base.uploader as uploader
 import ckanext.pose_theme.custom_themes.pose_theme.utils as utils
 
 datastore_dictionary = Blueprint(u'datastore_dictionary', __name__)
+content_addressed_uploads = Blueprint(u'content_addressed_uploads', __name__)
+
+UPLOAD_PATH = re.compile(r'^/uploads/(?P<upload_to>[^/]+)/(?P<filename>[^/]+)$')
 
 
 def dictionary_download(resource_id):
-    response = make_response()
-    response.headers[u'content-type'] = u'application/octet-stream'
-    return utils.dictionary_download(resource_id, response)
+    fmt = request.args.get(u'format', u'csv')
+    bom = asbool(request.args.get(u'bom', False))
+    return utils.dictionary_download(resource_id, fmt, bom)
 
 
 datastore_dictionary.add_url_rule(u'/datastore/dictionary_download/<resource_id>', view_func=dictionary_download)
 
 
+def dictionary_bundle_download(kind, id):
+    fmt = request.args.get(u'format', u'csv')
+    bom = asbool(request.args.get(u'bom', False))
+    return utils.dictionary_bundle_download(kind, id, fmt, bom)
+
+
+datastore_dictionary.add_url_rule(u'/datastore/dictionary_export/<any(dataset, organization):kind>/<id>',
+                                  view_func=dictionary_bundle_download)
+
+
+def cache_content_addressed_upload(response):
+    # Whichever uploader serves the file, CKAN core from the storage path
+    # or another IUploader, only its cache headers are changed
+    match = UPLOAD_PATH.match(request.path)
+    if (match and response.status_code in (200, 304)
+            and match.group(u'upload_to') in uploader.content_addressed_upload_types()
+            and uploader.is_content_addressed(match.group(u'filename'))):
+        # The name changes with the content, so the file can be cached forever
+        response.headers[u'Cache-Control'] = uploader.IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+content_addressed_uploads.after_app_request(cache_content_addressed_upload)
+
+
 def get_blueprints():
-    return [datastore_dictionary]
+    return [datastore_dictionary, content_addressed_uploads]
  
\ No newline at end of file
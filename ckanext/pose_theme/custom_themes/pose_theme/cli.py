@@ -1,10 +1,22 @@
+import datetime
+import json
+import os
+import time
+
 import click
 import traceback  
 import ckan.model as model
-from ckanext.activity.model import Activity 
-
-from sqlalchemy import cast
-from sqlalchemy.dialects.postgresql import JSONB
+import ckan.plugins.toolkit as toolkit
+import ckanext.pose_theme.base.css_pruner as css_pruner
+import ckanext.pose_theme.base.uploader as uploader
+import ckanext.pose_theme.custom_themes.pose_theme.activity_cleanup as activity_cleanup
+import ckanext.pose_theme.custom_themes.pose_theme.bench as bench
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_bundle as dictionary_bundle
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
+import ckanext.pose_theme.custom_themes.pose_theme.warmup as warmup
+import ckanext.pose_theme.pose_custom_homepage.critical_css as critical_css
+from ckanext.pose_theme.pose_custom_homepage.constants import LAYOUTS
+from ckanext.pose_theme.routes import outbox
 
 
 @click.group()
@@ -15,24 +27,33 @@ def pose_theme():
 
 @pose_theme.command(name='cleanup-activities')
 @click.argument('dataset_type')
-def cleanup_activities(dataset_type):
+@click.option('--batch-size', type=click.IntRange(1), default=1000, show_default=True,
+              help='Activity records deleted per transaction.')
+@click.option('--sleep', type=click.FloatRange(0), default=0, show_default=True,
+              help='Seconds to wait between two batches.')
+@click.option('--dry-run', is_flag=True, help='Go through the batches without deleting anything.')
+@click.option('--after', default=None, help='Resume after this activity id, printed when a run stops.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def cleanup_activities(dataset_type, batch_size, sleep, dry_run, after, yes):
     """
     Permanently delete activity stream records for a given dataset type.
 
     This is useful for cleaning up orphaned activities after a custom dataset
-    type extension has been removed.
+    type extension has been removed. The records are deleted in batches, each
+    one in its own transaction. Run activity-index first on large sites.
 
     Example:
-    ckan -c /etc/ckan/default/ckan.ini pose-theme cleanup-activities application
+    ckan -c /etc/ckan/default/ckan.ini pose-theme cleanup-activities application --batch-size 5000 --sleep 0.5
     """
     click.echo(f'Searching for activity records with dataset_type="{dataset_type}"...')
-
+    criterion = activity_cleanup.package_type() == dataset_type
+    last_id = after
     try:
-        activities_to_delete = model.Session.query(Activity).filter(
-            cast(Activity.data, JSONB).op('->')('package').op('->>')('type') == dataset_type
-        )
+        if not activity_cleanup.has_index():
+            click.secho('No index on the package type of activities, every batch scans the activity table. '
+                        'See "ckan pose-theme activity-index".', fg='yellow')
 
-        count = activities_to_delete.count()
+        count = activity_cleanup.count(criterion, after)
 
         if count == 0:
             click.secho(f'No activity records found for type "{dataset_type}". Nothing to do.', fg='green')
@@ -40,17 +61,445 @@ def cleanup_activities(dataset_type):
 
         click.secho(f'Found {count} activity record(s) to delete.', fg='yellow')
 
-        if not click.confirm(f'Are you sure you want to permanently delete these {count} records?'):
+        if dry_run:
+            click.echo('Dry run, nothing is deleted.')
+        elif not yes and not click.confirm(f'Are you sure you want to permanently delete these {count} records?'):
             click.echo('Cleanup cancelled.')
             return
 
-        activities_to_delete.delete(synchronize_session=False)
-        model.Session.commit()
-        click.secho(f'Successfully deleted {count} activity record(s).', fg='green')
+        deleted = 0
+        batches = activity_cleanup.delete_in_batches(criterion, batch_size, after, sleep, dry_run)
+        with click.progressbar(length=count, label='Checking' if dry_run else 'Deleting') as bar:
+            for batch in batches:
+                deleted += len(batch.ids)
+                last_id = batch.ids[-1]
+                bar.update(len(batch.ids))
+
+        if dry_run:
+            click.secho(f'{deleted} activity record(s) would be deleted.', fg='green')
+        else:
+            click.secho(f'Successfully deleted {deleted} activity record(s).', fg='green')
 
+    except KeyboardInterrupt:
+        model.Session.rollback()
+        click.secho('\nInterrupted.', fg='yellow')
+        if last_id:
+            click.echo(f'Resume with --after {last_id}')
     except Exception as e:
         model.Session.rollback()
         click.secho(f'An error occurred: {e}', fg='red')
         traceback.print_exc()
+        if last_id:
+            click.echo(f'Resume with --after {last_id}')
+    finally:
+        model.Session.remove()
+
+
+@pose_theme.command(name='activity-index')
+@click.option('--drop', is_flag=True, help='Drop the index instead.')
+def activity_index(drop):
+    """
+    Create the index on the package type of activity records.
+
+    With it, cleanup-activities finds the records of a dataset type without
+    casting the data of every activity to JSONB. The index is built without
+    locking the activity table against writes.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme activity-index
+    """
+    try:
+        if drop:
+            activity_cleanup.drop_index()
+            click.secho(f'Dropped the index {activity_cleanup.INDEX_NAME}.', fg='green')
+        else:
+            click.echo(f'Creating the index {activity_cleanup.INDEX_NAME}, this can take a while...')
+            activity_cleanup.create_index()
+            click.secho(f'Created the index {activity_cleanup.INDEX_NAME}.', fg='green')
+    finally:
+        model.Session.remove()
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024.0
+    return f'{size:.1f} GB'
+
+
+@pose_theme.command(name='prune-activities')
+@click.option('--policy', default=None,
+              help='Retention policy, e.g. "extension:180d, site:365d, dataset:keep". '
+                   'Defaults to ckanext.pose_theme.activity_retention.')
+@click.option('--batch-size', type=click.IntRange(1), default=1000, show_default=True,
+              help='Activity records deleted per transaction.')
+@click.option('--sleep', type=click.FloatRange(0), default=0.1, show_default=True,
+              help='Seconds to wait between two batches.')
+@click.option('--lock-timeout', type=click.FloatRange(0), default=5, show_default=True,
+              help='Seconds a batch waits for its locks before the run stops.')
+@click.option('--dry-run', is_flag=True, help='Report what would be deleted without deleting anything.')
+def prune_activities(policy, batch_size, sleep, lock_timeout, dry_run):
+    """
+    Delete the activity records older than the retention policy of their dataset type.
+
+    The policy gives an age in hours, days or weeks (12h, 180d, 52w) or keep
+    for every dataset type. The activities of types missing from the policy
+    are kept. The records are deleted in small batches, each one in a short
+    transaction, and a run exits right away when another one is still
+    pruning, so the command can be scheduled while the site is live.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme prune-activities --policy "extension:180d, site:365d, dataset:keep"
+    """
+    try:
+        if policy is None:
+            rules = activity_cleanup.get_retention_policy()
+        else:
+            rules = activity_cleanup.parse_policy(policy)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--policy')
+
+    if not any(rules.values()):
+        click.secho('The retention policy keeps every activity record. Nothing to do.', fg='green')
+        return
+
+    verb = 'would delete' if dry_run else 'deleted'
+    lock = activity_cleanup.PruneLock()
+    total_rows = total_size = 0
+    try:
+        if not lock.acquire():
+            click.secho('Activity records are already being pruned by another run.', fg='yellow')
+            return
+
+        now = datetime.datetime.utcnow()
+        for dataset_type, max_age in rules.items():
+            if max_age is None:
+                click.echo(f'{dataset_type}: kept')
+                continue
+            rows = size = 0
+            try:
+                for batch in activity_cleanup.delete_in_batches(
+                        activity_cleanup.expired(dataset_type, max_age, now), batch_size,
+                        sleep=sleep, dry_run=dry_run, lock_timeout=lock_timeout):
+                    rows += len(batch.ids)
+                    size += batch.size
+            finally:
+                total_rows += rows
+                total_size += size
+                click.echo(f'{dataset_type}: {verb} {rows} activity record(s) older than '
+                           f'{activity_cleanup.format_age(max_age)}, {_format_size(size)}')
+
+        click.secho(f'Total: {verb} {total_rows} activity record(s), {_format_size(total_size)}.', fg='green')
+        if total_rows and not dry_run:
+            click.echo('The space is reused by new rows after the next (auto)vacuum of the activity table.')
+
+    except Exception as e:
+        model.Session.rollback()
+        click.secho(f'An error occurred: {e}', fg='red')
+        traceback.print_exc()
+        raise click.ClickException(f'Stopped after deleting {total_rows} activity record(s).')
+    finally:
+        lock.release()
+        model.Session.remove()
+
+
+@pose_theme.command(name='gc-uploads')
+@click.option('--min-age', type=click.FloatRange(0), default=24, show_default=True,
+              help='Hours since a file was stored or reused before it can be deleted.')
+@click.option('--dry-run', is_flag=True, help='Only list the files that would be deleted.')
+def gc_uploads(min_age, dry_run):
+    """
+    Delete content-addressed uploads that are no longer referenced.
+
+    Hero slider and showcase images are stored under the SHA-256 of their
+    content and shared between uploads, so they are never deleted when an
+    image is replaced. Run this command from time to time to reclaim space.
+    Files younger than --min-age are kept, the form storing them may not
+    have saved its reference yet.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme gc-uploads --dry-run
+    """
+    removed = 0
+    reclaimed = 0
+    try:
+        for path in uploader.unreferenced_uploads(min_age * 3600):
+            size = os.path.getsize(path)
+            if dry_run:
+                click.echo(f'Would delete {path}')
+            else:
+                os.remove(path)
+            removed += 1
+            reclaimed += size
+    finally:
+        model.Session.remove()
+
+    action = 'Would delete' if dry_run else 'Deleted'
+    click.secho(f'{action} {removed} unreferenced upload(s), {reclaimed} bytes.', fg='green')
+
+
+@pose_theme.command(name='build-critical-css')
+@click.option('--layout', 'layouts', type=click.IntRange(1, len(LAYOUTS)), multiple=True,
+              help='Homepage layout to build, all layouts by default. Can be repeated.')
+@click.pass_context
+def build_critical_css(ctx, layouts):
+    """
+    Extract the CSS needed above the fold of each homepage layout.
+
+    Every layout is rendered with the current site data, the rules of its
+    stylesheets that match the header and the hero are written to one file
+    per layout. The homepage inlines the file and loads the full stylesheets
+    asynchronously. Run it again after theme or layout changes.
+
+    Needs the lxml and cssselect packages.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme build-critical-css --layout 1
+    """
+    from werkzeug.test import Client
+
+    client = Client(ctx.obj.app)
+    try:
+        for layout in layouts or [item['value'] for item in LAYOUTS]:
+            try:
+                css, stylesheets = critical_css.build_critical_css(client, layout)
+                path = critical_css.write_critical_css(layout, css)
+            except RuntimeError as e:
+                click.secho(f'Layout {layout}: {e}', fg='red')
+                continue
+            total = sum(len(stylesheet.encode('utf-8')) for _, stylesheet in stylesheets)
+            click.secho(f'Layout {layout}: {len(css.encode("utf-8"))} of {total} bytes '
+                        f'from {len(stylesheets)} stylesheet(s) written to {path}', fg='green')
+    finally:
+        model.Session.remove()
+
+
+@pose_theme.command(name='prune-css')
+@click.option('--safelist', multiple=True,
+              help='Class or id pattern to keep, e.g. "chart-*". Can be repeated.')
+@click.option('--no-core', is_flag=True, help='Do not scan the templates and scripts of CKAN core.')
+@click.option('--dry-run', is_flag=True, help='Only report the savings, do not write any file.')
+def prune_css(safelist, no_core, dry_run):
+    """
+    Write lean copies of the theme stylesheets without unused selectors.
+
+    Selectors whose classes or ids appear in no template or JavaScript file
+    of the extension or CKAN core are removed from the stylesheets of the
+    main bundle and the result is written to ckanext.pose_theme.lean_css_dir
+    (default <ckan.storage_path>/storage/pose_lean_css). Classes only added
+    at runtime must match the safelist, see ckanext.pose_theme.css_safelist.
+    Set ckanext.pose_theme.lean_css = true and restart CKAN to serve the
+    lean main bundle.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme prune-css --safelist "chart-*"
+    """
+    output_dir = css_pruner.get_lean_css_dir()
+    if not output_dir:
+        raise click.ClickException(f'Set ckan.storage_path or {css_pruner.LEAN_CSS_DIR} to prune the stylesheets.')
+    used_names = css_pruner.collect_used_names(css_pruner.get_source_dirs(include_core=not no_core))
+    report = css_pruner.prune_bundles(used_names, css_pruner.get_safelist(safelist), output_dir, dry_run=dry_run)
+
+    for bundle, results in report.items():
+        size = sum(result.size for result in results)
+        lean_size = sum(result.lean_size for result in results)
+        removed = sum(result.removed for result in results)
+        saved = 100 - lean_size * 100 // size if size else 0
+        click.secho(f'{bundle}: {size} -> {lean_size} bytes (-{saved}%), '
+                    f'{removed} unused selector(s) removed', fg='green')
+        for result in results:
+            click.echo(f'  {os.path.relpath(result.path, css_pruner.PACKAGE_DIR)}: '
+                       f'{result.size} -> {result.lean_size} bytes, {result.lean_path}')
+
+
+@pose_theme.command(name='initdb')
+def initdb():
+    """
+    Create the tables of the extension, currently the contact form outbox.
+
+    The plugin creates them when it is configured, this command creates
+    them ahead of the first start, e.g. from a deployment script.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme initdb
+    """
+    try:
+        outbox.init()
+    finally:
+        model.Session.remove()
+    click.secho(f'Created the {outbox.contact_outbox_table.name} table.', fg='green')
+
+
+@pose_theme.command(name='mail-worker')
+@click.option('--batch-size', type=click.IntRange(1), default=None,
+              help='Emails sent over one SMTP connection, see ckanext.pose_theme.contact.batch_size.')
+@click.option('--interval', type=click.FloatRange(0.1), default=10, show_default=True,
+              help='Seconds to wait when no email is due.')
+@click.option('--once', is_flag=True, help='Send the emails that are due and exit.')
+def mail_worker(batch_size, interval, once):
+    """
+    Send the contact form emails of the outbox.
+
+    The contact form only writes its emails to the outbox. They are sent by
+    a background job by default, set ckanext.pose_theme.contact.delivery =
+    worker to leave them to this command instead. Failed emails are retried
+    with an exponential backoff.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme mail-worker --once
+    """
+    try:
+        while True:
+            sent, failed = outbox.deliver_pending(batch_size)
+            if sent or failed:
+                click.secho(f'Sent {sent} email(s), {failed} failed.', fg='yellow' if failed else 'green')
+            if once:
+                break
+            model.Session.remove()
+            time.sleep(interval)
+    finally:
+        model.Session.remove()
+
+
+@pose_theme.command(name='export-dictionaries')
+@click.option('--dataset', 'dataset_id', help='Name or id of the dataset.')
+@click.option('--organization', 'organization_id', help='Name or id of the organization.')
+@click.option('--format', 'fmt', type=click.Choice(dictionary_export.available_formats()),
+              default=dictionary_export.CSV, show_default=True, help='Format of the dictionaries.')
+@click.option('--bom', is_flag=True, help='Start the CSV files with a UTF-8 byte order mark.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help='Zip file to write, - for stdout. Defaults to <name>-data-dictionaries-<format>.zip.')
+def export_dictionaries(dataset_id, organization_id, fmt, bom, output):
+    """
+    Write the data dictionaries of the datastore resources of a dataset or
+    an organization to a zip file.
+
+    Every dataset gets a folder holding one dictionary per datastore
+    resource. The columns of all the resources are read with one query on
+    the datastore database.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme export-dictionaries --organization my-org
+    """
+    if bool(dataset_id) == bool(organization_id):
+        raise click.UsageError('Pass either --dataset or --organization.')
+
+    site_user = toolkit.get_action('get_site_user')({'ignore_auth': True}, {})
+    context = {'user': site_user['name'], 'ignore_auth': True}
+    try:
+        if organization_id:
+            pairs = dictionary_bundle.organization_resources(context, organization_id)
+        else:
+            pairs = dictionary_bundle.dataset_resources(context, dataset_id)
+        entries = dictionary_bundle.dictionary_entries(pairs, fmt)
+
+        output = output or dictionary_bundle.archive_name(organization_id or dataset_id, fmt)
+        with click.open_file(output, 'wb') as archive:
+            for chunk in dictionary_bundle.iter_zip(entries, fmt, bom):
+                archive.write(chunk)
+        click.secho(f'Wrote {len(entries)} data dictionaries to {output}.', fg='green', err=True)
+    except toolkit.ObjectNotFound as e:
+        raise click.ClickException(f'Not found: {e}')
+    finally:
+        model.Session.remove()
+
+
+@pose_theme.command(name='warm')
+@click.pass_context
+def warm(ctx):
+    """
+    Render the homepage, the extension and site listings and the statistics
+    and report how long each step took.
+
+    Every template is compiled into the Jinja bytecode cache, so that new
+    workers load the templates without compiling them. To warm the other
+    caches of each worker, call the post-fork hook of the module
+    ckanext.pose_theme.custom_themes.pose_theme.warmup from the web server.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme warm
+    """
+    try:
+        steps = warmup.warm(ctx.obj.app)
+        for step in steps:
+            if step.error:
+                click.secho(f'{step.name:<20} {step.seconds:8.3f}s  failed: {step.error}', fg='red')
+            else:
+                click.secho(f'{step.name:<20} {step.seconds:8.3f}s  {step.detail}', fg='green')
+        click.echo(f'{"total":<20} {sum(step.seconds for step in steps):8.3f}s')
+        directory = warmup.get_bytecode_cache_dir()
+        if directory:
+            click.echo(f'Jinja bytecode cache: {directory}')
+        if any(step.error for step in steps):
+            ctx.exit(1)
+    finally:
+        model.Session.remove()
+
+
+@pose_theme.command(name='bench')
+@click.option('--organizations', type=click.IntRange(1), default=bench.DEFAULT_COUNTS['organizations'],
+              show_default=True, help='Organizations to seed.')
+@click.option('--groups', type=click.IntRange(0), default=bench.DEFAULT_COUNTS['groups'],
+              show_default=True, help='Groups to seed.')
+@click.option('--datasets', type=click.IntRange(0), default=bench.DEFAULT_COUNTS['datasets'],
+              show_default=True, help='Datasets to seed.')
+@click.option('--extensions', type=click.IntRange(1), default=bench.DEFAULT_COUNTS['extensions'],
+              show_default=True, help='Extensions to seed, every fourth one is featured.')
+@click.option('--sites', type=click.IntRange(0), default=bench.DEFAULT_COUNTS['sites'],
+              show_default=True, help='Sites to seed, every fourth one is featured.')
+@click.option('--showcases', type=click.IntRange(0), default=bench.DEFAULT_COUNTS['showcases'],
+              show_default=True, help='Showcases with story tags to seed.')
+@click.option('--runs', type=click.IntRange(1), default=20, show_default=True,
+              help='Measured requests per page.')
+@click.option('--warmup', type=click.IntRange(0), default=2, show_default=True,
+              help='Requests per page before the measured ones.')
+@click.option('--page', 'pages', multiple=True,
+              help='Path of a page to render instead of the default pages, can be repeated.')
+@click.option('--no-seed', is_flag=True, help='Render the pages of the catalog as it is.')
+@click.option('--purge', is_flag=True, help='Purge the bench-* entities once done.')
+@click.option('--output', '-o', type=click.Path(dir_okay=False, allow_dash=True), default='-',
+              help='JSON file to write the report to.')
+@click.pass_context
+def bench_pages(ctx, organizations, groups, datasets, extensions, sites, showcases, runs, warmup, pages,
+                no_seed, purge, output):
+    """
+    Seed a synthetic catalog and report how fast the pages of the theme render.
+
+    The catalog is made of bench-* organizations, groups, datasets,
+    extensions, sites and showcases, created when missing. Every page is
+    rendered through a test client and the report gives, per page, the p50
+    and p95 latency and the SQL queries, action calls and Solr requests of
+    one request, as JSON to compare across commits. Run it on a development
+    site, never in production.
+
+    Example:
+    ckan -c /etc/ckan/default/ckan.ini pose-theme bench --extensions 200 -o before.json
+    """
+    try:
+        if not no_seed:
+            created = bench.seed({
+                'organizations': organizations, 'groups': groups, 'datasets': datasets,
+                'extensions': extensions, 'sites': sites, 'showcases': showcases,
+            })
+            summary = ', '.join(f'{number} {kind}' for kind, number in created.items()) or 'nothing'
+            click.secho(f'Seeded {summary}.', fg='green', err=True)
+            model.Session.remove()
+
+        report = bench.bench(ctx.obj.app, pages or bench.PAGES, runs, warmup)
+        with click.open_file(output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+        for path, page in report['pages'].items():
+            color = 'red' if page['status'] >= 400 else None
+            click.secho(f'{path:<40} {page["status"]}  p50 {page["p50_ms"]:8.1f}ms  p95 {page["p95_ms"]:8.1f}ms  '
+                        f'sql {page["sql_queries"]:4}  actions {page["action_calls"]:4}  '
+                        f'solr {page["solr_calls"]:3}', fg=color, err=True)
+        failed = [path for path, page in report['pages'].items() if page['status'] >= 400]
     finally:
-        model.Session.remove()
\ No newline at end of file
+        if purge:
+            click.secho(f'Purged {bench.purge()} bench-* entities.', fg='green', err=True)
+        model.Session.remove()
+    if failed:
+        ctx.exit(1)
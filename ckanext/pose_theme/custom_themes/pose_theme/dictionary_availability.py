@@ -0,0 +1,88 @@
+# encoding: utf-8
+"""Which resources of a dataset have a data dictionary worth downloading.
+
+A dictionary is worth downloading when one of its columns has a label or a
+description. The columns of all the datastore resources of a dataset are
+read with one query on the datastore catalog. The answer for each resource
+is cached until the resource is modified, for ``data_dictionary_cache_ttl``
+seconds at most since editing the dictionary does not modify the resource.
+"""
+import logging
+import threading
+import time
+
+from ckan.plugins import toolkit
+
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_bundle as dictionary_bundle
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
+
+log = logging.getLogger(__name__)
+
+# Entries kept before the expired ones are dropped
+MAX_ENTRIES = 10000
+
+# resource id -> (version, has_dictionary, expires)
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_cache_ttl():
+    return int(toolkit.config.get('ckanext.pose_theme.data_dictionary_cache_ttl', 5 * 60))
+
+
+def _version(resource):
+    return resource.get('last_modified'), resource.get('metadata_modified')
+
+
+def has_dictionary(fields):
+    """Whether a column of the datastore ``fields`` has a label or a description."""
+    return any(field['label'] or field['description']
+               for field in dictionary_export.dictionary_fields(fields))
+
+
+def _store(resources, all_fields, now):
+    """Cache the answers for ``resources``, return the ids of the ones with a dictionary."""
+    expires = now + get_cache_ttl()
+    answers = {resource['id']: has_dictionary(all_fields.get(resource['id'], [])) for resource in resources}
+    with _cache_lock:
+        if len(_cache) >= MAX_ENTRIES:
+            for resource_id in [key for key, entry in _cache.items() if entry[2] <= now]:
+                del _cache[resource_id]
+            if len(_cache) >= MAX_ENTRIES:
+                _cache.clear()
+        for resource in resources:
+            _cache[resource['id']] = (_version(resource), answers[resource['id']], expires)
+    return {resource_id for resource_id, answer in answers.items() if answer}
+
+
+def resources_with_dictionary(package, connection=None):
+    """Ids of the resources of ``package`` that have a labelled or described column.
+
+    Only the resources that are not cached, or were modified since, are
+    looked up, all of them in one query.
+    """
+    now = time.monotonic()
+    found = set()
+    missing = []
+    for resource in package.get('resources', []):
+        if not toolkit.asbool(resource.get('datastore_active')):
+            continue
+        entry = _cache.get(resource['id'])
+        if entry is None or entry[0] != _version(resource) or entry[2] <= now:
+            missing.append(resource)
+        elif entry[1]:
+            found.add(resource['id'])
+
+    if missing:
+        try:
+            all_fields = dictionary_bundle.datastore_fields([resource['id'] for resource in missing], connection)
+        except Exception as e:
+            log.warning(f'Could not read the data dictionaries of {package.get("name")}: {e}')
+            return frozenset(found)
+        found.update(_store(missing, all_fields, now))
+    return frozenset(found)
+
+
+def clear():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,166 @@
+# encoding: utf-8
+"""Zip archive of the data dictionaries of a dataset or an organization.
+
+The columns of every datastore resource are read with a single query on the
+catalog of the datastore database, instead of one ``datastore_search`` per
+resource. The archive is written on the fly: each entry is sent as soon as
+it is compressed, nothing is written to disk.
+"""
+import json
+import logging
+import zipfile
+
+import sqlalchemy as sa
+
+from ckan.plugins import toolkit
+
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
+
+log = logging.getLogger(__name__)
+
+DATASET = 'dataset'
+ORGANIZATION = 'organization'
+
+# Datasets fetched per package_search call of an organization
+PAGE_SIZE = 1000
+
+# Columns of the datastore tables in the order of the table, like
+# datastore_search returns them. The data dictionary is kept in the column
+# comments, under "_info" since CKAN 2.10 and as the whole comment before.
+FIELDS_SQL = sa.text('''
+    SELECT c.relname AS resource_id, a.attname AS id, t.typname AS type, d.description AS comment
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid
+    JOIN pg_type t ON t.oid = a.atttypid
+    LEFT JOIN pg_description d ON d.objoid = c.oid AND d.objsubid = a.attnum
+    WHERE n.nspname = 'public'
+        AND c.relname = ANY(:resource_ids)
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+    ORDER BY c.relname, a.attnum
+''')
+
+
+def _field_info(comment):
+    if not comment:
+        return {}
+    try:
+        info = json.loads(comment)
+    except ValueError:
+        # Comments not written by the datastore
+        return {}
+    if not isinstance(info, dict):
+        return {}
+    return info.get('_info', info) or {}
+
+
+def datastore_fields(resource_ids, connection=None):
+    """``{resource_id: fields}`` of the datastore tables of ``resource_ids``, in one query.
+
+    The fields are ``{id, type, info}`` dicts like the ones of
+    ``datastore_search``, internal columns included.
+    """
+    fields = {}
+    if not resource_ids:
+        return fields
+    if connection is None:
+        from ckanext.datastore.backend.postgres import get_read_engine
+        with get_read_engine().connect() as connection:
+            return datastore_fields(resource_ids, connection)
+    for row in connection.execute(FIELDS_SQL, {'resource_ids': list(resource_ids)}):
+        fields.setdefault(row.resource_id, []).append({
+            'id': row.id,
+            'type': row.type,
+            'info': _field_info(row.comment),
+        })
+    return fields
+
+
+def _datastore_resources(packages):
+    for package in packages:
+        for resource in package.get('resources', []):
+            if toolkit.asbool(resource.get('datastore_active')):
+                yield package, resource
+
+
+def dataset_resources(context, dataset_id):
+    """``(dataset, resource)`` pairs of the datastore resources of a dataset the user can read."""
+    dataset = toolkit.get_action('package_show')(context, {'id': dataset_id})
+    return list(_datastore_resources([dataset]))
+
+
+def organization_resources(context, organization_id):
+    """``(dataset, resource)`` pairs of the datastore resources of the datasets of an
+    organization the user can read, private ones included."""
+    organization = toolkit.get_action('organization_show')(
+        context, {'id': organization_id, 'include_datasets': False})
+    pairs = []
+    start = 0
+    while True:
+        result = toolkit.get_action('package_search')(context, {
+            'fq': 'owner_org:"{}"'.format(organization['id']),
+            'include_private': True,
+            'rows': PAGE_SIZE,
+            'start': start,
+            'sort': 'name asc',
+        })
+        pairs.extend(_datastore_resources(result['results']))
+        start += PAGE_SIZE
+        if start >= result['count'] or not result['results']:
+            return pairs
+
+
+def dictionary_entries(pairs, fmt=dictionary_export.CSV, connection=None):
+    """``(name, fields)`` of the archive entries of ``(dataset, resource)`` pairs."""
+    all_fields = datastore_fields([resource['id'] for _, resource in pairs], connection)
+    filename = dictionary_export.FORMATS[fmt].filename
+    entries = []
+    for dataset, resource in pairs:
+        fields = all_fields.get(resource['id'])
+        if fields is None:
+            # datastore_active is set but the table is gone
+            log.warning(f'No datastore table for resource {resource["id"]}')
+            continue
+        name = '{}/{}'.format(dataset['name'], filename.format(resource['id']))
+        entries.append((name, dictionary_export.dictionary_fields(fields)))
+    return entries
+
+
+class _ZipStream(object):
+    """Write-only file for ``zipfile`` that keeps the written bytes until they are taken.
+
+    It can not seek or tell, so ``zipfile`` writes the sizes of every entry
+    after its data instead of going back to its header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries, fmt=dictionary_export.CSV, bom=False):
+    """Generator of the ``bytes`` chunks of a zip archive of the dictionaries of ``entries``."""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, fields in entries:
+            with archive.open(name, 'w') as entry:
+                for chunk in dictionary_export.export(fmt, fields, bom):
+                    entry.write(chunk)
+            yield stream.take()
+    yield stream.take()
+
+
+def archive_name(name, fmt=dictionary_export.CSV):
+    return '{}-data-dictionaries-{}.zip'.format(name, fmt)
@@ -0,0 +1,215 @@
+# encoding: utf-8
+"""Streaming exports of the data dictionary of a datastore resource.
+
+Every format is a generator of ``bytes`` chunks, the response starts before
+the dictionary is fully written. The ETag is a hash of the field definitions
+and the export options, so it changes with a column, its type, its label or
+its description, and repeated downloads of an unchanged dictionary get a 304.
+"""
+import codecs
+import csv
+import hashlib
+import io
+import json
+from collections import namedtuple
+
+CSV = 'csv'
+JSON = 'json'
+TABLE_SCHEMA = 'tableschema'
+XLSX = 'xlsx'
+
+HEADER = ['column', 'type', 'label', 'description']
+
+# Bytes written per chunk of the response
+CHUNK_SIZE = 16 * 1024
+
+# First characters that make a spreadsheet read a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# PostgreSQL types of the datastore to Frictionless Table Schema types
+TABLE_SCHEMA_TYPES = {
+    'text': 'string',
+    'varchar': 'string',
+    'char': 'string',
+    'citext': 'string',
+    'uuid': 'string',
+    'int': 'integer',
+    'int2': 'integer',
+    'int4': 'integer',
+    'int8': 'integer',
+    'integer': 'integer',
+    'smallint': 'integer',
+    'bigint': 'integer',
+    'numeric': 'number',
+    'float4': 'number',
+    'float8': 'number',
+    'real': 'number',
+    'double precision': 'number',
+    'bool': 'boolean',
+    'boolean': 'boolean',
+    'date': 'date',
+    'time': 'time',
+    'timestamp': 'datetime',
+    'timestamptz': 'datetime',
+    'interval': 'duration',
+    'json': 'object',
+    'jsonb': 'object',
+}
+
+Format = namedtuple('Format', ['content_type', 'filename'])
+
+FORMATS = {
+    CSV: Format('text/csv; charset=utf-8', '{}-data-dictionary.csv'),
+    JSON: Format('application/json', '{}-data-dictionary.json'),
+    TABLE_SCHEMA: Format('application/json', '{}-table-schema.json'),
+    XLSX: Format('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                 '{}-data-dictionary.xlsx'),
+}
+
+
+def is_available(fmt):
+    """Whether ``fmt`` can be exported, XLSX needs the optional openpyxl."""
+    if fmt == XLSX:
+        try:
+            import openpyxl  # noqa
+        except ImportError:
+            return False
+    return fmt in FORMATS
+
+
+def available_formats():
+    return [fmt for fmt in (CSV, JSON, TABLE_SCHEMA, XLSX) if is_available(fmt)]
+
+
+def dictionary_fields(datastore_fields):
+    """The dictionary rows of the ``fields`` of ``datastore_search``, internal columns left out."""
+    fields = []
+    for field in datastore_fields:
+        if field['id'].startswith('_'):
+            continue
+        info = field.get('info') or {}
+        fields.append({
+            'id': field['id'],
+            'type': field['type'],
+            'label': info.get('label') or '',
+            'description': info.get('notes') or '',
+        })
+    return fields
+
+
+def fields_etag(resource_id, fields, fmt, bom=False):
+    digest = hashlib.sha256(json.dumps(
+        [resource_id, fmt, bool(bom), fields], sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+
+def _rows(fields):
+    for field in fields:
+        yield [field['id'], field['type'], field['label'], field['description']]
+
+
+def csv_cell(value):
+    """``value`` with a leading quote when a spreadsheet would run it as a formula."""
+    if value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(fields, bom=False):
+    """CSV of the dictionary, starting with a UTF-8 BOM for Excel when ``bom``.
+
+    Cells starting with a formula character are prefixed with a quote, so
+    that a description such as ``=HYPERLINK(...)`` stays text in Excel.
+    """
+    if bom:
+        yield codecs.BOM_UTF8
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADER)
+    for row in _rows(fields):
+        writer.writerow([csv_cell(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _iter_json_list(items, prefix, suffix):
+    chunk = [prefix]
+    size = len(prefix)
+    for index, item in enumerate(items):
+        text = (',' if index else '') + json.dumps(item, ensure_ascii=False)
+        chunk.append(text)
+        size += len(text)
+        if size >= CHUNK_SIZE:
+            yield ''.join(chunk).encode('utf-8')
+            chunk, size = [], 0
+    chunk.append(suffix)
+    yield ''.join(chunk).encode('utf-8')
+
+
+def iter_json(fields):
+    """JSON list of ``{id, type, label, description}`` objects."""
+    return _iter_json_list(fields, '[', ']')
+
+
+def table_schema_field(field):
+    datastore_type = field['type']
+    if datastore_type.startswith('_'):
+        schema_type = 'array'
+    else:
+        schema_type = TABLE_SCHEMA_TYPES.get(datastore_type, 'any')
+    schema_field = {'name': field['id'], 'type': schema_type}
+    if field['label']:
+        schema_field['title'] = field['label']
+    if field['description']:
+        schema_field['description'] = field['description']
+    return schema_field
+
+
+def iter_table_schema(fields):
+    """Frictionless Table Schema of the resource, labels as titles."""
+    return _iter_json_list((table_schema_field(field) for field in fields), '{"fields":[', ']}')
+
+
+def iter_xlsx(fields):
+    """XLSX workbook of the dictionary, written by openpyxl in write-only mode.
+
+    An XLSX file is a zip archive which is only complete once it is closed,
+    so the rows are streamed into the workbook and the workbook is sent in
+    chunks after it is saved.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Data dictionary')
+    sheet.append(HEADER)
+    for row in _rows(fields):
+        cells = []
+        for value in row:
+            cell = WriteOnlyCell(sheet, value=value)
+            # Descriptions starting with "=" are text, not formulas
+            cell.data_type = 's'
+            cells.append(cell)
+        sheet.append(cells)
+
+    output = io.BytesIO()
+    workbook.save(output)
+    output.seek(0)
+    for chunk in iter(lambda: output.read(CHUNK_SIZE), b''):
+        yield chunk
+
+
+def export(fmt, fields, bom=False):
+    """Generator of the ``bytes`` chunks of the dictionary in ``fmt``."""
+    if fmt == CSV:
+        return iter_csv(fields, bom)
+    if fmt == JSON:
+        return iter_json(fields)
+    if fmt == TABLE_SCHEMA:
+        return iter_table_schema(fields)
+    if fmt == XLSX:
+        return iter_xlsx(fields)
+    raise ValueError('Unknown data dictionary format: {}'.format(fmt))
@@ -1,16 +1,30 @@
+import os
+
 import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
+import ckanext.pose_theme.base.css_pruner as css_pruner
 import ckanext.pose_theme.base.helpers as helper
+import ckanext.pose_theme.base.uploader as uploader
+import ckanext.pose_theme.custom_themes.pose_theme.actions as actions
+import ckanext.pose_theme.custom_themes.pose_theme.auth as auth
 import ckanext.pose_theme.custom_themes.pose_theme.blueprint as view
 import ckanext.pose_theme.custom_themes.pose_theme.cli as cli
-from ckanext.pose_theme.routes import contact
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_availability as dictionary_availability
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
+import ckanext.pose_theme.custom_themes.pose_theme.warmup as warmup
+from ckanext.pose_theme.routes import contact, outbox
 
 class PoseThemePlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IConfigurer)
+    plugins.implements(plugins.IConfigurable)
     plugins.implements(plugins.ITemplateHelpers)
     plugins.implements(plugins.IBlueprint)
     plugins.implements(plugins.IFacets, inherit=True)
     plugins.implements(plugins.IClick)
+    plugins.implements(plugins.IUploader, inherit=True)
+    plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
+    plugins.implements(plugins.IMiddleware, inherit=True)
 
     # IFacets
     def dataset_facets(self, facets_dict, package_type):
@@ -34,6 +48,15 @@ class PoseThemePlugin(plugins.SingletonPlugin):
         toolkit.add_public_directory(ckan_config, 'public')
         toolkit.add_resource('assets', 'pose_theme')
         toolkit.add_public_directory(ckan_config, "assets")
+        if toolkit.asbool(ckan_config.get('ckanext.pose_theme.lean_css', False)):
+            lean_css_dir = css_pruner.get_lean_css_dir()
+            # Built by prune-css, the full bundle is served until then
+            if lean_css_dir and os.path.exists(os.path.join(lean_css_dir, 'webassets.yml')):
+                toolkit.add_resource(lean_css_dir, css_pruner.LEAN_LIBRARY)
+
+    # IConfigurable
+    def configure(self, config):
+        outbox.init()
 
     def update_config_schema(self, schema):
         ignore_missing = toolkit.get_validator('ignore_missing')
@@ -44,6 +67,14 @@ class PoseThemePlugin(plugins.SingletonPlugin):
         })
         return schema
 
+    # IMiddleware
+    def make_middleware(self, app, config):
+        # Only the Flask app has templates, it is wrapped when an earlier
+        # plugin added its own middleware
+        if hasattr(app, 'jinja_env'):
+            warmup.install_bytecode_cache(app)
+        return app
+
     # ITemplateHelpers
     def get_helpers(self):
         return {
@@ -51,9 +82,32 @@ class PoseThemePlugin(plugins.SingletonPlugin):
             'pose_theme_organization_alias': helper.get_organization_alias,
             'pose_theme_get_default_extent': helper.get_default_extent,
             'pose_theme_is_data_dict_active': helper.is_data_dict_active,
+            'pose_theme_dictionary_formats': dictionary_export.available_formats,
+            'pose_theme_resources_with_dictionary': dictionary_availability.resources_with_dictionary,
+            'pose_theme_use_lean_css': helper.use_lean_css,
             'version': helper.version_builder,
         }
 
+    # IUploader
+    def get_uploader(self, upload_to, old_filename=None):
+        if upload_to in uploader.content_addressed_upload_types():
+            return uploader.ContentAddressedUpload(upload_to, old_filename)
+
+    def get_resource_uploader(self, data_dict):
+        return None
+
+    # IActions
+    def get_actions(self):
+        return {
+            'pose_theme_contact_rejections': actions.pose_theme_contact_rejections,
+        }
+
+    # IAuthFunctions
+    def get_auth_functions(self):
+        return {
+            'pose_theme_contact_rejections': auth.pose_theme_contact_rejections,
+        }
+
     def get_commands(self):
         return [cli.pose_theme]
 
@@ -1,40 +1,70 @@
-import csv
+from flask import Response, stream_with_context
 from ckan.plugins.toolkit import (
     ObjectNotFound,
     NotAuthorized,
     abort,
-    check_ckan_version,
     get_action,
+    request,
     _
 )
 
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_bundle as dictionary_bundle
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
 
-def dictionary_download(resource_id, response):
+
+def get_dictionary_fields(resource_id):
     try:
         resource_datastore = get_action('datastore_search')(None, {
             'resource_id': resource_id,
-            'limit': 0
+            'limit': 0,
+            'include_total': False,
         })
     except (ObjectNotFound, NotAuthorized):
         abort(404, _('Resource not found'))
+    return dictionary_export.dictionary_fields(resource_datastore['fields'])
 
-    fields = [f for f in resource_datastore['fields'] if not f['id'].startswith('_')]
-    header = ['column', 'type', 'label', 'description']
 
-    if hasattr(response, u'headers'):
-        response.headers['Content-Type'] = 'text/csv; charset=utf-8'
-        response.headers['Content-disposition'] = (
-            'attachment; filename="{name}-data-dictionary.csv"'.format(name=resource_id))
+def _check_format(fmt):
+    if fmt not in dictionary_export.FORMATS:
+        abort(400, _('Unknown data dictionary format'))
+    if not dictionary_export.is_available(fmt):
+        abort(400, _('This data dictionary format is not available'))
 
-    if check_ckan_version(min_version='2.9.0'):
-        wr = csv.writer(response.stream, encoding='utf-8')
+
+def dictionary_download(resource_id, fmt=dictionary_export.CSV, bom=False):
+    _check_format(fmt)
+    fields = get_dictionary_fields(resource_id)
+    etag = dictionary_export.fields_etag(resource_id, fields, fmt, bom)
+    if etag in request.if_none_match:
+        response = Response(status=304)
     else:
-        wr = csv.writer(response, encoding='utf-8')
+        export_format = dictionary_export.FORMATS[fmt]
+        response = Response(
+            stream_with_context(dictionary_export.export(fmt, fields, bom)),
+            content_type=export_format.content_type)
+        response.headers['Content-disposition'] = (
+            'attachment; filename="{}"'.format(export_format.filename.format(resource_id)))
+    response.set_etag(etag)
+    # The dictionary of a private resource must not be kept by shared caches
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 
-    wr.writerow(col for col in header)
-    for field in fields:
-        field_info = field.get('info', {})
-        row = [field['id'], field['type'], field_info.get('label', ''), field_info.get('notes', '')]
-        wr.writerow(item for item in row)
+def dictionary_bundle_download(kind, id, fmt=dictionary_export.CSV, bom=False):
+    _check_format(fmt)
+    try:
+        if kind == dictionary_bundle.ORGANIZATION:
+            pairs = dictionary_bundle.organization_resources({}, id)
+        else:
+            pairs = dictionary_bundle.dataset_resources({}, id)
+    except (ObjectNotFound, NotAuthorized):
+        abort(404, _('Organization not found') if kind == dictionary_bundle.ORGANIZATION else _('Dataset not found'))
 
+    entries = dictionary_bundle.dictionary_entries(pairs, fmt)
+    response = Response(
+        stream_with_context(dictionary_bundle.iter_zip(entries, fmt, bom)),
+        content_type='application/zip')
+    response.headers['Content-disposition'] = (
+        'attachment; filename="{}"'.format(dictionary_bundle.archive_name(id, fmt)))
+    response.headers['Cache-Control'] = 'private, no-cache'
     return response
@@ -0,0 +1,146 @@
+# encoding: utf-8
+"""Warm-up of a CKAN process before it serves its first visitors.
+
+The first requests of a new worker compile the Jinja templates, import the
+helpers and fill the caches of the theme: the header navigation, the footer
+and the critical CSS. ``warm`` does all of it in-process by rendering the
+pages through a test client, and reports how long every step took.
+
+Compiled templates are also written to a Jinja bytecode cache on disk, so
+the workers started after a warm-up, or the ``ckan pose-theme warm``
+command, load them without compiling them again.
+"""
+import logging
+import os
+import time
+from collections import namedtuple
+
+from ckan.plugins import toolkit
+
+log = logging.getLogger(__name__)
+
+BYTECODE_CACHE_DIR = 'ckanext.pose_theme.jinja_bytecode_cache_dir'
+
+# Pages rendered by the warm-up, in this order
+PAGES = (
+    ('homepage', '/'),
+    ('extension listing', '/extension/'),
+    ('site listing', '/site/'),
+)
+
+STATISTICS_SNIPPET = 'home/snippets/statistics.html'
+
+Step = namedtuple('Step', ['name', 'seconds', 'detail', 'error'])
+
+
+def get_bytecode_cache_dir():
+    """Directory of the Jinja bytecode cache, under ``cache_dir`` by default, None when disabled."""
+    directory = toolkit.config.get(BYTECODE_CACHE_DIR)
+    if directory is None:
+        cache_dir = toolkit.config.get('cache_dir')
+        return os.path.join(cache_dir, 'pose_theme_jinja') if cache_dir else None
+    if directory.lower() in ('', 'false', 'off'):
+        return None
+    return directory
+
+
+def install_bytecode_cache(flask_app):
+    """Give the Jinja environment of ``flask_app`` a bytecode cache on disk, return its directory."""
+    from jinja2 import FileSystemBytecodeCache
+
+    directory = get_bytecode_cache_dir()
+    if not directory:
+        return None
+    if isinstance(flask_app.jinja_env.bytecode_cache, FileSystemBytecodeCache):
+        return flask_app.jinja_env.bytecode_cache.directory
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError as e:
+        log.warning(f'Jinja bytecode cache disabled, can not create {directory}: {e}')
+        return None
+    flask_app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory, '__pose_theme_jinja_%s.cache')
+    return directory
+
+
+def _flask_app(app):
+    # The CKAN app keeps the Flask app below its middleware
+    return getattr(app, '_wsgi_app', app)
+
+
+def prime_templates(flask_app):
+    """Compile every HTML template, which writes them to the bytecode cache."""
+    env = flask_app.jinja_env
+    compiled = failed = 0
+    for name in env.list_templates(extensions=('html',)):
+        try:
+            env.get_template(name)
+            compiled += 1
+        except Exception as e:
+            # Templates of disabled plugins extending missing blocks
+            log.debug(f'Template {name} was not compiled: {e}')
+            failed += 1
+    return f'{compiled} compiled, {failed} skipped'
+
+
+def render_page(client, path):
+    response = client.get(path)
+    if response.status_code >= 400:
+        raise RuntimeError(f'{path} responded with {response.status}')
+    return f'{response.status_code}, {len(response.get_data())} bytes'
+
+
+def render_statistics(flask_app):
+    with flask_app.test_request_context('/'):
+        flask_app.preprocess_request()
+        html = toolkit.render_snippet(STATISTICS_SNIPPET)
+    return f'{len(html)} characters'
+
+
+def _timed(name, function, *args):
+    start = time.perf_counter()
+    try:
+        detail, error = function(*args), None
+    except Exception as e:
+        detail, error = None, e
+    return Step(name, time.perf_counter() - start, detail, error)
+
+
+def warm(app):
+    """Render the pages and the snippets of the theme in this process.
+
+    :param app: the CKAN WSGI app
+    :returns: a ``Step`` for every step, in the order they ran
+    """
+    from werkzeug.test import Client
+
+    flask_app = _flask_app(app)
+    install_bytecode_cache(flask_app)
+    client = Client(app)
+    steps = [_timed('templates', prime_templates, flask_app)]
+    steps.extend(_timed(name, render_page, client, path) for name, path in PAGES)
+    steps.append(_timed('statistics', render_statistics, flask_app))
+    return steps
+
+
+def warm_worker(app):
+    """Warm a new worker and log the steps, never raises.
+
+    Call it from the post-fork hook of the server, e.g. ``@postfork`` of
+    uWSGI in the WSGI script.
+    """
+    try:
+        steps = warm(app)
+    except Exception as e:
+        log.warning(f'Warm-up of worker {os.getpid()} failed: {e}')
+        return []
+    for step in steps:
+        if step.error:
+            log.warning(f'Warm-up {step.name} failed after {step.seconds:.3f}s: {step.error}')
+        else:
+            log.info(f'Warm-up {step.name} took {step.seconds:.3f}s ({step.detail})')
+    return steps
+
+
+def post_worker_init(worker):
+    """Gunicorn hook, set ``post_worker_init`` to it in the gunicorn configuration file."""
+    warm_worker(worker.wsgi)
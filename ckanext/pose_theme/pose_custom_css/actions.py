@@ -0,0 +1,71 @@
+import ckan.plugins.toolkit as toolkit
+
+from ckanext.pose_theme.base import palette
+from ckanext.pose_theme.pose_custom_css.constants import CSS_FILE, CSS_SOURCE, SITE_CUSTOM_CSS
+from ckanext.pose_theme.pose_custom_css.controller import CustomCSSController
+from ckanext.pose_theme.pose_custom_css.processor import custom_style_processor
+
+MINIMUM_RATIOS = {
+    'AA': palette.AA,
+    'AA_large': palette.AA_LARGE,
+    'AAA': palette.AAA,
+    'AAA_large': palette.AAA_LARGE,
+}
+
+
+@toolkit.side_effect_free
+def pose_theme_palette_check(context, data_dict):
+    """Check the contrast of a Custom CSS palette, e.g. for a live preview.
+
+    :param colors: form field names of the Custom CSS page and their colours,
+        missing fields use their defaults
+    :type colors: dict
+    :param level: one of ``AA``, ``AA_large`` (default), ``AAA`` and
+        ``AAA_large``
+    :type level: string
+
+    :returns: the failing pairs, each with its colours, contrast ratio and
+        the nearest colour for the second field of the pair that passes
+    :rtype: dict
+    """
+    toolkit.check_access('pose_theme_palette_check', context, data_dict)
+
+    colors = data_dict.get('colors') or {}
+    level = data_dict.get('level', 'AA_large')
+    errors = {}
+    if not isinstance(colors, dict):
+        errors['colors'] = ['Must be a dict of field names and colours']
+    if level not in MINIMUM_RATIOS:
+        errors['level'] = ['Must be one of {}'.format(', '.join(MINIMUM_RATIOS))]
+    if errors:
+        raise toolkit.ValidationError(errors)
+
+    for name, color in colors.items():
+        try:
+            palette.parse_color(color)
+        except (AttributeError, TypeError, ValueError):
+            errors[name] = ['Invalid color {}'.format(color)]
+    if errors:
+        raise toolkit.ValidationError(errors)
+
+    minimum_ratio = MINIMUM_RATIOS[level]
+    return {
+        'level': level,
+        'minimum_ratio': minimum_ratio,
+        'failing': custom_style_processor.check_palette(colors, minimum_ratio),
+    }
+
+
+@toolkit.chained_action
+def config_option_update(up_func, context, data_dict):
+    """Publish the custom CSS file again when ``ckan.site_custom_css`` changes.
+
+    The file holds ``ckan.site_custom_css`` too, which can also be changed
+    on the config page of CKAN core or through the API.
+    """
+    result = up_func(context, data_dict)
+    if (SITE_CUSTOM_CSS in data_dict and toolkit.config.get(CSS_FILE)
+            and toolkit.config.get(CSS_SOURCE) != CustomCSSController.site_css_digest(
+                toolkit.config.get(SITE_CUSTOM_CSS))):
+        CustomCSSController().publish_css()
+    return result
@@ -0,0 +1,3 @@
+def pose_theme_palette_check(context, data_dict):
+    # Sysadmins only, they are the ones editing the palette
+    return {'success': False}
@@ -1,5 +1,14 @@
 RAW_CSS = 'ckanext.pose_theme.custom_raw_css'
 CSS_METADATA = 'ckanext.pose_theme.custom_css_metadata'
+CSS_FILE = 'ckanext.pose_theme.custom_css_file'
+# Digest of the ckan.site_custom_css the file was published with
+CSS_SOURCE = 'ckanext.pose_theme.custom_css_source'
+SITE_CUSTOM_CSS = 'ckan.site_custom_css'
+
+CSS_MODE = 'ckanext.pose_theme.custom_css_mode'
+CSS_MODE_RULES = 'rules'
+CSS_MODE_VARIABLES = 'variables'
+CSS_MODES = (CSS_MODE_RULES, CSS_MODE_VARIABLES)
 
 ACCOUNT_HEADER_FIELDS = [
     'account-header-background-color',
@@ -1,17 +1,32 @@
 # encoding: utf-8
+import hashlib
+import logging
+import os
+import re
+import uuid
 from collections import OrderedDict
 
 import ckan.plugins.toolkit as tk
 from ckan import model
+from flask import send_from_directory
+from ckan.lib.uploader import get_storage_path
 
 from ckanext.pose_theme.base.compatibility_controller import BaseCompatibilityController
+from ckanext.pose_theme.base.css_minifier import compress, minify_css
 from ckanext.pose_theme.pose_custom_css.processor import custom_style_processor
 from ckanext.pose_theme.pose_custom_css.constants import (
-    CSS_METADATA, RAW_CSS,
+    CSS_FILE, CSS_METADATA, CSS_SOURCE, RAW_CSS, SITE_CUSTOM_CSS,
     ACCOUNT_HEADER_FIELDS, NAVIGATION_HEADER_FIELDS,
     MODULE_HEADER_FIELDS, FOOTER_FIELDS
 )
 
+log = logging.getLogger(__name__)
+
+CSS_FILE_NAME = re.compile(r'^[0-9a-f]{32}\.css$')
+CSS_FILE_VARIANT = re.compile(r'^([0-9a-f]{32}\.css)(\.gz|\.br)?$')
+# Precompressed variants, in order of preference
+CSS_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
 
 class CustomCSSController(BaseCompatibilityController):
     def custom_css(self):
@@ -25,33 +40,43 @@ class CustomCSSController(BaseCompatibilityController):
             # This case can happen only during the cold start on empty DB.
             default_raw_css, css_metadata = custom_style_processor.get_custom_css({})
             self.save_css_metadata(default_raw_css, css_metadata)
+            self.publish_css()
 
         if tk.request.method == 'POST':
             form_data = self.get_form_data(tk.request)
             custom_css, css_metadata = custom_style_processor.get_custom_css(form_data)
 
             try:
-                custom_style_processor.check_contrast()
+                custom_style_processor.check_contrast(form_data)
+                self.check_site_custom_css(form_data.get(SITE_CUSTOM_CSS))
                 self.save_css_metadata(custom_css, css_metadata)
 
                 tk.get_action('config_option_update')(context, {
-                    'ckan.site_custom_css': form_data.get('ckan.site_custom_css')
+                    SITE_CUSTOM_CSS: form_data.get(SITE_CUSTOM_CSS)
                 })
+                self.publish_css()
             except tk.ValidationError as e:
                 errors = e.error_dict
-                extra_vars = {'data': form_data, 'errors': errors}
+                extra_vars = {'data': form_data, 'errors': errors, 'css_stats': self.get_css_stats()}
                 extra_vars.update(self.get_form_fields(css_metadata))
                 return tk.render('admin/custom_css_form.html', extra_vars=extra_vars)
 
         site_custom_css = tk.get_action('config_option_show')(context, {
-            'key': 'ckan.site_custom_css'
+            'key': SITE_CUSTOM_CSS
         })
 
-        data = {'ckan.site_custom_css': site_custom_css}
-        extra_vars = {'data': data, 'errors': {}}
+        data = {SITE_CUSTOM_CSS: site_custom_css}
+        extra_vars = {'data': data, 'errors': {}, 'css_stats': self.get_css_stats()}
         extra_vars.update(self.get_form_fields(css_metadata))
         return tk.render('admin/custom_css_form.html', extra_vars=extra_vars)
 
+    @staticmethod
+    def check_site_custom_css(css):
+        """Reject custom CSS that does not parse instead of publishing half of it."""
+        _, errors = minify_css(css)
+        if errors:
+            raise tk.ValidationError({SITE_CUSTOM_CSS: errors})
+
     def reset_custom_css(self):
         try:
             context = {'model': model, 'user': tk.c.user}
@@ -61,6 +86,7 @@ class CustomCSSController(BaseCompatibilityController):
 
         default_raw_css, default_css_metadata = custom_style_processor.get_custom_css({})
         self.save_css_metadata(default_raw_css, default_css_metadata)
+        self.publish_css()
 
         if tk.check_ckan_version(min_version='2.9.0'):
             custom_css_route = 'custom-css.custom_css'
@@ -77,6 +103,120 @@ class CustomCSSController(BaseCompatibilityController):
     def get_raw_css():
         return tk.get_action('config_option_show')({'ignore_auth': True}, {'key': RAW_CSS})
 
+    @staticmethod
+    def get_site_custom_css():
+        return tk.get_action('config_option_show')({'ignore_auth': True}, {'key': SITE_CUSTOM_CSS})
+
+    @staticmethod
+    def get_combined_css(site_custom_css=None):
+        if site_custom_css is None:
+            site_custom_css = CustomCSSController.get_site_custom_css()
+        return '\n'.join(css for css in (site_custom_css, CustomCSSController.get_raw_css()) if css)
+
+    @staticmethod
+    def site_css_digest(site_custom_css):
+        return hashlib.sha256((site_custom_css or '').encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def get_css_directory():
+        storage_path = get_storage_path()
+        if storage_path:
+            return os.path.join(storage_path, 'storage', 'pose_custom_css')
+
+    @staticmethod
+    def _write_file(filepath, data):
+        tmp_filepath = '{}~{}'.format(filepath, uuid.uuid4().hex)
+        with open(tmp_filepath, 'wb') as css_file:
+            css_file.write(data)
+        os.rename(tmp_filepath, filepath)
+
+    @staticmethod
+    def write_css_file(css):
+        """Minify ``css`` and write it to a file named after its content.
+
+        The gzip and brotli encoded variants are written next to it, so they
+        are never compressed per request. Returns the file name.
+        """
+        directory = CustomCSSController.get_css_directory()
+        css = minify_css(css)[0]
+        if not directory or not css:
+            return ''
+        data = css.encode('utf-8')
+        filename = '{}.css'.format(hashlib.sha256(data).hexdigest()[:32])
+        filepath = os.path.join(directory, filename)
+        if not os.path.exists(filepath):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            for encoding, encoded in compress(data).items():
+                suffix = dict(CSS_ENCODINGS)[encoding]
+                CustomCSSController._write_file(filepath + suffix, encoded)
+            # Written last, an existing file means its variants exist too
+            CustomCSSController._write_file(filepath, data)
+        return filename
+
+    def get_css_stats(self):
+        """Return the byte size of the custom CSS before and after minification."""
+        directory = self.get_css_directory()
+        filename = tk.config.get(CSS_FILE)
+        if not directory or not filename:
+            return {}
+        stats = {'source': len(self.get_combined_css().encode('utf-8'))}
+        for name, suffix in (('minified', ''),) + CSS_ENCODINGS:
+            filepath = os.path.join(directory, filename + suffix)
+            if os.path.exists(filepath):
+                stats[name] = os.path.getsize(filepath)
+        return stats
+
+    def publish_css(self):
+        """Write the site and generated CSS to a content-hashed file.
+
+        Pages link the file instead of inlining the CSS. The previous file is
+        kept for pages rendered before the change, older ones are removed.
+        """
+        previous = tk.config.get(CSS_FILE, '')
+        site_custom_css = self.get_site_custom_css()
+        filename = self.write_css_file(self.get_combined_css(site_custom_css))
+        # Also published after ckan.site_custom_css is changed elsewhere, e.g.
+        # on the config page of CKAN core
+        tk.get_action('config_option_update')({'ignore_auth': True}, {
+            CSS_FILE: filename,
+            CSS_SOURCE: self.site_css_digest(site_custom_css),
+        })
+        if filename == previous:
+            return
+
+        directory = self.get_css_directory()
+        if not directory or not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            match = CSS_FILE_VARIANT.match(name)
+            if match and match.group(1) not in (filename, previous):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    log.debug('[pose_theme] Could not remove custom CSS file %s', name)
+
+    def custom_css_file(self, filename):
+        directory = self.get_css_directory()
+        if not directory or not CSS_FILE_NAME.match(filename):
+            return tk.abort(404)
+        if not os.path.exists(os.path.join(directory, filename)):
+            # E.g. storage was wiped, rebuild the file when it is the current one
+            if self.write_css_file(self.get_combined_css()) != filename:
+                return tk.abort(404)
+
+        accepted = tk.request.accept_encodings
+        for encoding, suffix in CSS_ENCODINGS:
+            if accepted[encoding] and os.path.exists(os.path.join(directory, filename + suffix)):
+                response = send_from_directory(directory, filename + suffix, mimetype='text/css')
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, mimetype='text/css')
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
     @staticmethod
     def get_form_fields(css_metadata):
         account_header_fields = OrderedDict()
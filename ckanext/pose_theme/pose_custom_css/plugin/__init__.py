@@ -4,8 +4,12 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
 import ckanext.pose_theme.base.helpers as helper
+import ckanext.pose_theme.pose_custom_css.actions as actions
+import ckanext.pose_theme.pose_custom_css.auth as auth
 from ckanext.pose_theme.pose_custom_css.controller import CustomCSSController
-from ckanext.pose_theme.pose_custom_css.constants import CSS_METADATA, RAW_CSS
+from ckanext.pose_theme.pose_custom_css.constants import (
+    CSS_FILE, CSS_METADATA, CSS_SOURCE, RAW_CSS, SITE_CUSTOM_CSS
+)
 
 if toolkit.check_ckan_version(min_version='2.9.0'):
     from ckanext.pose_theme.pose_custom_css.plugin.flask_plugin import MixinPlugin
@@ -18,6 +22,8 @@ class PoseThemeCustomCSSPlugin(MixinPlugin):
     plugins.implements(plugins.IConfigurer)
     plugins.implements(plugins.ITemplateHelpers)
     plugins.implements(plugins.IValidators)
+    plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IAuthFunctions)
 
     # IConfigurer
     def update_config(self, ckan_config):
@@ -33,6 +39,8 @@ class PoseThemeCustomCSSPlugin(MixinPlugin):
         schema.update({
             RAW_CSS: [ignore_missing, unicode_safe, custom_css_validator],
             CSS_METADATA: [ignore_missing, dict_validator, css_meta_validator],
+            CSS_FILE: [ignore_missing, unicode_safe],
+            CSS_SOURCE: [ignore_missing, unicode_safe],
         })
         return schema
 
@@ -43,10 +51,24 @@ class PoseThemeCustomCSSPlugin(MixinPlugin):
             u'css_meta_validator': css_meta_validator,
         }
 
+    # IActions
+    def get_actions(self):
+        return {
+            'pose_theme_palette_check': actions.pose_theme_palette_check,
+            'config_option_update': actions.config_option_update,
+        }
+
+    # IAuthFunctions
+    def get_auth_functions(self):
+        return {
+            'pose_theme_palette_check': auth.pose_theme_palette_check,
+        }
+
     # ITemplateHelpers
     def get_helpers(self):
         return {
             'get_custom_css': get_custom_raw_css,
+            'get_custom_css_url': get_custom_css_url,
             'version': helper.version_builder,
         }
 
@@ -55,6 +77,18 @@ def get_custom_raw_css():
     return CustomCSSController.get_raw_css()
 
 
+def get_custom_css_url():
+    """URL of the published custom CSS file, read from the cached config."""
+    filename = toolkit.config.get(CSS_FILE)
+    if not filename or not toolkit.check_ckan_version(min_version='2.9.0'):
+        return None
+    if toolkit.config.get(CSS_SOURCE) != CustomCSSController.site_css_digest(toolkit.config.get(SITE_CUSTOM_CSS)):
+        # ckan.site_custom_css changed since the file was published, the
+        # page inlines it until the file is published again
+        return None
+    return toolkit.url_for('custom-css-file.custom_css_file', filename=filename)
+
+
 def custom_css_validator(value):
     return value
     # remove all html from css is not working well as > is allowed css symbol
@@ -9,7 +9,7 @@ class MixinPlugin(p.SingletonPlugin):
 
     # IBlueprint
     def get_blueprint(self):
-        return api
+        return [api, css_file]
 
 
 api = Blueprint('custom-css', __name__, url_prefix='/ckan-admin')
@@ -17,3 +17,7 @@ api.add_url_rule('/custom_css', methods=['GET', 'POST'],
                  view_func=CustomCSSController().custom_css)
 api.add_url_rule('/reset_custom_css', methods=['GET', 'POST'],
                  view_func=CustomCSSController().reset_custom_css)
+
+css_file = Blueprint('custom-css-file', __name__)
+css_file.add_url_rule('/pose_custom_css/<filename>', methods=['GET'],
+                      view_func=CustomCSSController().custom_css_file)
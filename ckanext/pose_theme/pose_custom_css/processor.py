@@ -1,11 +1,16 @@
-from collections import defaultdict, OrderedDict
-import wcag_contrast_ratio as contrast
-from ckan.plugins.toolkit import ValidationError
-from ckanext.pose_theme.base.processor import AbstractParser
-from ckanext.pose_theme.base.color_contrast import get_contrast
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+from ckan.plugins.toolkit import ValidationError, config
+from ckanext.pose_theme.base.processor import AbstractParser, ParsedValue
+from ckanext.pose_theme.base.palette import AA_LARGE, failing_pairs
+from ckanext.pose_theme.base.css_minifier import serialize_rules
+from ckanext.pose_theme.pose_custom_css.constants import CSS_MODE, CSS_MODE_RULES, CSS_MODE_VARIABLES, CSS_MODES
 
+log = logging.getLogger(__name__)
 
-__all__ = ['custom_style_processor']
+
+__all__ = ['custom_style_processor', 'compile_custom_css', 'get_css_mode']
 
 
 class AccountHeaderBackGroundColor(AbstractParser):
@@ -13,6 +18,7 @@ class AccountHeaderBackGroundColor(AbstractParser):
     form_name = 'account-header-background-color'
     title = 'Account Header Background Color'
     location = 'background'
+    variable = '--pose-account-bg'
     _default_value = '#165cab'
 
 
@@ -21,6 +27,7 @@ class AccountHeaderHoverBackgroundColor(AbstractParser):
     form_name = 'account-header-hover-background-color'
     title = 'Account Header Hover Background Color'
     location = 'background'
+    variable = '--pose-account-hover-bg'
     _default_value = '#1f76d8'
 
 
@@ -29,6 +36,7 @@ class AccountHeaderTextColor(AbstractParser):
     form_name = 'account-header-text-color'
     title = 'Account Header Text Color'
     location = 'color'
+    variable = '--pose-account-text'
     _default_value = '#ffffff'
 
 
@@ -37,6 +45,7 @@ class NavigationHeaderBackGroundColor(AbstractParser):
     form_name = 'nav-header-background-color'
     title = 'Navigation Header Background Color'
     location = 'background'
+    variable = '--pose-nav-bg'
     _default_value = '#ffffff'
 
 
@@ -47,6 +56,7 @@ class NavigationHeaderHoverBackgroundColor(AbstractParser):
     form_name = 'nav-header-hover-background-color'
     title = 'Navigation Header Hover Background Color'
     location = 'background-color'
+    variable = '--pose-nav-hover-bg'
     _default_value = '#1f76d8'
 
 
@@ -58,6 +68,7 @@ class NavigationHeaderTextColor(AbstractParser):
     form_name = 'nav-header-text-color'
     title = 'Navigation Header Text Color'
     location = 'color'
+    variable = '--pose-nav-text'
     _default_value = '#07305c'
 
 
@@ -66,6 +77,7 @@ class ModuleHeaderBackgroundColor(AbstractParser):
     form_name = 'module-header-background-color'
     title = 'Side Menu Header Background Color'
     location = 'background'
+    variable = '--pose-module-bg'
     _default_value = '#165cab'
 
 
@@ -75,6 +87,7 @@ class ModuleHeaderTextColor(AbstractParser):
     form_name = 'module-header-text-color'
     title = 'Side Menu Header Text Color'
     location = 'color'
+    variable = '--pose-module-text'
     _default_value = '#ffffff'
 
 
@@ -83,6 +96,7 @@ class FooterBackGroundColor(AbstractParser):
     form_name = 'footer-background-color'
     title = 'Footer Background Color'
     location = 'background'
+    variable = '--pose-footer-bg'
     _default_value = '#07305c'
 
 
@@ -93,6 +107,7 @@ class FooterLinkColor(AbstractParser):
     form_name = 'footer-link-text-color'
     title = 'Footer Link Color'
     location = 'color'
+    variable = '--pose-footer-link'
     _default_value = '#ffffff'
 
 
@@ -104,84 +119,122 @@ class FooterTextColor(AbstractParser):
     form_name = 'footer-text-color'
     title = 'Footer Text Color'
     location = 'color'
+    variable = '--pose-footer-text'
     _default_value = '#ffffff'
 
 
-class CustomStyleProcessor:
-    def __init__(self):
-        self.processor_account_header_background_color = AccountHeaderBackGroundColor()
-        self.processor_account_header_text_color = AccountHeaderTextColor()
-        self.processor_account_header_hover_background_color = AccountHeaderHoverBackgroundColor()
+PROCESSORS = (
+    AccountHeaderBackGroundColor(),
+    AccountHeaderHoverBackgroundColor(),
+    AccountHeaderTextColor(),
 
-        self.processor_navigation_header_background_color = NavigationHeaderBackGroundColor()
-        self.processor_navigation_header_text_color = NavigationHeaderTextColor()
-        self.processor_navigation_header_hover_background_color = NavigationHeaderHoverBackgroundColor()
+    NavigationHeaderBackGroundColor(),
+    NavigationHeaderHoverBackgroundColor(),
+    NavigationHeaderTextColor(),
 
-        self.processor_module_header_background_color = ModuleHeaderBackgroundColor()
-        self.processor_module_header_text_color = ModuleHeaderTextColor()
+    ModuleHeaderBackgroundColor(),
+    ModuleHeaderTextColor(),
 
-        self.processor_footer_background_color = FooterBackGroundColor()
-        self.processor_footer_text_color = FooterTextColor()
-        self.processor_footer_link_color = FooterLinkColor()
+    FooterBackGroundColor(),
+    FooterLinkColor(),
+    FooterTextColor()
+)
 
-        self.processors = (
-            self.processor_account_header_background_color,
-            self.processor_account_header_hover_background_color,
-            self.processor_account_header_text_color,
+CONTRAST_PAIRS = (
+    (AccountHeaderBackGroundColor.form_name, AccountHeaderTextColor.form_name),
+    (NavigationHeaderBackGroundColor.form_name, NavigationHeaderTextColor.form_name),
+    (ModuleHeaderBackgroundColor.form_name, ModuleHeaderTextColor.form_name),
+    (FooterBackGroundColor.form_name, FooterTextColor.form_name),
+    (FooterBackGroundColor.form_name, FooterLinkColor.form_name)
+)
 
-            self.processor_navigation_header_background_color,
-            self.processor_navigation_header_hover_background_color,
-            self.processor_navigation_header_text_color,
 
-            self.processor_module_header_background_color,
-            self.processor_module_header_text_color,
+def _cache_key(parsed_values):
+    key = tuple(parsed.value for parsed in parsed_values)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
 
-            self.processor_footer_background_color,
-            self.processor_footer_link_color,
-            self.processor_footer_text_color
-        )
 
-    def get_custom_css(self, data):
-        result_css = defaultdict(dict)
-        css_metadata = OrderedDict()
+def get_css_mode():
+    mode = config.get(CSS_MODE, CSS_MODE_RULES)
+    if mode not in CSS_MODES:
+        log.warning('[pose_theme] Unknown %s "%s", using "%s"', CSS_MODE, mode, CSS_MODE_RULES)
+        return CSS_MODE_RULES
+    return mode
+
+
+def compile_custom_css(values, mode=CSS_MODE_RULES):
+    """Build the CSS and its metadata from the processor values, in order.
+
+    In the ``variables`` mode only a ``:root`` block with the custom
+    properties the theme stylesheet consumes is generated, instead of the
+    selectors that override it.
+    """
+    result_css = OrderedDict()
+    css_metadata = OrderedDict()
+
+    for processor, value in zip(PROCESSORS, values):
+        parsed = ParsedValue(processor.form_name, processor.title, value)
+        if mode == CSS_MODE_VARIABLES:
+            class_name, css_declaration = ':root', processor.get_css_variable(parsed)
+        else:
+            class_name, css_declaration = processor.class_name, processor.get_css_declaration(parsed)
+        if css_declaration is not None:
+            result_css.setdefault(class_name, OrderedDict()).update(css_declaration)
 
-        for processor in self.processors:
-            css_declaration = processor.get_css_from_data(data)
-            if css_declaration is not None:
-                result_css[processor.class_name].update(css_declaration)
+        css_metadata[processor.form_name] = {
+            'title': processor.title,
+            'value': value,
+        }
 
-            css_metadata[processor.form_name] = {
-                'title': processor.title,
-                'value': processor.value,
-            }
+    return serialize_rules(result_css.items()), css_metadata
 
-        raw_css = '\n'
-        for class_name, css_declaration in result_css.items():
-            css_declaration = str(css_declaration).replace(',', ';').replace("'", "")
-            raw_css = '{previous_block}\n {css_selector} {css_declaration}'.format(
-                previous_block=raw_css,
-                css_selector=class_name,
-                css_declaration=css_declaration)
 
+_cached_compile_custom_css = lru_cache(maxsize=128)(compile_custom_css)
+
+
+class CustomStyleProcessor:
+    """Stateless CSS generator, safe to share between threads.
+
+    The generated CSS only depends on the form values, so it is memoized
+    and a palette is compiled once per process.
+    """
+    processors = PROCESSORS
+
+    def parse(self, data):
+        return tuple(processor.parse_form_data(data) for processor in self.processors)
+
+    def get_custom_css(self, data, mode=None):
+        mode = mode or get_css_mode()
+        parsed_values = self.parse(data)
+        key = _cache_key(parsed_values)
+        if key is None:
+            raw_css, css_metadata = compile_custom_css(
+                tuple(parsed.value for parsed in parsed_values), mode)
+        else:
+            raw_css, css_metadata = _cached_compile_custom_css(key, mode)
+        # The cached metadata must not be changed by the callers
+        css_metadata = OrderedDict(
+            (form_name, dict(metadata)) for form_name, metadata in css_metadata.items()
+        )
         return raw_css, css_metadata
 
-    def check_contrast(self):
+    def get_palette(self, data):
+        return OrderedDict((parsed.form_name, parsed.value) for parsed in self.parse(data))
+
+    def check_palette(self, data, minimum_ratio=AA_LARGE, suggest=True):
+        """Return every contrast pair of ``data`` below ``minimum_ratio``."""
+        return failing_pairs(self.get_palette(data), CONTRAST_PAIRS, minimum_ratio, suggest)
+
+    def check_contrast(self, data):
+        titles = {processor.form_name: processor.title for processor in self.processors}
         errors = {}
-        color_pairs = [
-            (self.processor_account_header_background_color, self.processor_account_header_text_color),
-            (self.processor_navigation_header_background_color, self.processor_navigation_header_text_color),
-            (self.processor_module_header_background_color, self.processor_module_header_text_color),
-            (self.processor_footer_background_color, self.processor_footer_text_color),
-            (self.processor_footer_background_color, self.processor_footer_link_color)
-        ]
-        for pair in color_pairs:
-            pr_1 = pair[0]
-            pr_2 = pair[1]
-            if pr_1.value and pr_2.value:
-                contrast_value = get_contrast(pr_1.value, pr_2.value)
-                if not contrast.passes_AA(contrast_value, large=True):
-                    key = '{} and {}'.format(pr_1.title, pr_2.title)
-                    errors[key] = 'Contrast ratio is not high enough.'
+        for failure in self.check_palette(data, suggest=False):
+            key = ' and '.join(titles[form_name] for form_name in failure['pair'])
+            errors[key] = 'Contrast ratio is not high enough.'
         if errors:
             raise ValidationError(errors)
 
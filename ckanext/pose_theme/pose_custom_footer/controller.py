@@ -1,29 +1,14 @@
 # encoding: utf-8
-import bleach
 import ckan.plugins.toolkit as tk
 from ckan import model
 
-from ckanext.pose_theme.pose_custom_footer.constants import (
-    CONFIG_KEY,
-    ALLOWED_TAGS_SET,
-    ALLOWED_TAGS_LIST,
-    ALLOWED_ATTRIBUTES,
-    ALLOWED_CSS_PROPERTIES
-)
+from ckanext.pose_theme.pose_custom_footer.constants import CONFIG_KEY
+from ckanext.pose_theme.pose_custom_footer.sanitizer import DEFAULT_FOOTER, clean_footer, clean_html  # noqa: F401
 from ckanext.pose_theme.base.compatibility_controller import BaseCompatibilityController
 
 
-def clean_html(text):
-    try:
-        from bleach.css_sanitizer import CSSSanitizer
-        CSS_Sanitizer = CSSSanitizer(allowed_css_properties=ALLOWED_CSS_PROPERTIES)
-        return bleach.clean(text, tags=ALLOWED_TAGS_SET, attributes=ALLOWED_ATTRIBUTES, css_sanitizer=CSS_Sanitizer)
-    except ImportError:
-        return bleach.clean(text, tags=ALLOWED_TAGS_LIST, attributes=ALLOWED_ATTRIBUTES, styles=ALLOWED_CSS_PROPERTIES)
-
-
 class CustomFooterController(BaseCompatibilityController):
-    default_footer = {'layout_type': 'default', 'content_0': '', 'content_1': '', 'content_2': ''}
+    default_footer = DEFAULT_FOOTER
 
     def custom_footer(self):
         try:
@@ -36,13 +21,7 @@ class CustomFooterController(BaseCompatibilityController):
 
         if tk.request.method == 'POST':
             data = self.get_form_data(tk.request)
-            custom_footer = {
-                'layout_type': data.get('layout_type', 'default'),
-                'content_0': clean_html(data.get('content_0', '')),
-                'content_1': clean_html(data.get('content_1', '')),
-                'content_2': clean_html(data.get('content_2', '')),
-                'content_3': clean_html(data.get('content_3', ''))
-            }
+            custom_footer = clean_footer(data)
             error = self.save_footer_metadata(custom_footer)
             custom_footer['errors'] = error
 
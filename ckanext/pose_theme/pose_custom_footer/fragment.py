@@ -0,0 +1,76 @@
+"""Footer fragment rendered once per revision of its config.
+
+The footer is the same on every page of a language, so it is rendered the
+first time a worker needs it and reused until the footer config changes.
+The columns are read as Markup from a snapshot of the same revision.
+Every request checks that the config of the worker is up to date with the
+one saved by any other worker, so the raw values identify the revision: the
+footer config, the column count and the site title the footer shows.
+"""
+import ckan.plugins.toolkit as tk
+from ckan.lib.helpers import literal
+
+import ckanext.pose_theme.base.helpers as helper
+from ckanext.pose_theme.base.config_snapshot import ConfigSnapshot
+from ckanext.pose_theme.pose_custom_footer.constants import CONFIG_KEY
+from ckanext.pose_theme.pose_custom_footer.sanitizer import CONTENT_KEYS, DEFAULT_FOOTER
+
+FOOTER_CACHE = 'ckanext.pose_theme.footer_cache'
+
+
+class FooterSnapshot(object):
+    """Layout type and columns as Markup of one revision of the footer config."""
+
+    __slots__ = ('layout_type', 'columns')
+
+    def __init__(self, custom_footer):
+        self.layout_type = custom_footer.get('layout_type') or 'default'
+        # Sanitized when saved, so only marked as safe here
+        self.columns = {key: literal(custom_footer[key]) for key in CONTENT_KEYS if custom_footer.get(key)}
+
+    def get(self, section):
+        if section == 'layout_type':
+            return self.layout_type
+        return self.columns.get(section, '')
+
+
+_footer = ConfigSnapshot(CONFIG_KEY, lambda custom_footer: FooterSnapshot(custom_footer or DEFAULT_FOOTER))
+
+# (revision, {(layout_type, language): Markup}), replaced as a whole when the
+# revision changes, so a render of an older revision that finishes late only
+# fills the dict of its own revision
+_fragments = (object(), {})
+
+
+def get_footer_snapshot():
+    """Return the footer of the current config revision."""
+    return _footer.get()
+
+
+def is_footer_cache_enabled():
+    # Templates are reloaded in debug mode, so should the footer
+    return tk.asbool(tk.config.get(FOOTER_CACHE, True)) and not tk.asbool(tk.config.get('debug', False))
+
+
+def _render(layout_type):
+    template = 'custom_footer.html' if layout_type == 'custom' else 'default_footer.html'
+    return literal(tk.render_snippet(template))
+
+
+def render_footer():
+    """Return the footer of the current page as Markup."""
+    global _fragments
+    layout_type = get_footer_snapshot().layout_type
+    if not is_footer_cache_enabled():
+        return _render(layout_type)
+
+    revision = (tk.config.get(CONFIG_KEY), helper.get_column_count(), tk.config.get('ckan.site_title'))
+    cached_revision, fragments = _fragments
+    if cached_revision != revision:
+        fragments = {}
+        _fragments = (revision, fragments)
+    key = (layout_type, tk.h.lang())
+    fragment = fragments.get(key)
+    if fragment is None:
+        fragment = fragments[key] = _render(layout_type)
+    return fragment
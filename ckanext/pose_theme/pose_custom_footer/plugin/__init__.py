@@ -2,15 +2,13 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
 import ckanext.pose_theme.base.helpers as helper
-from ckanext.pose_theme.pose_custom_footer.controller import CustomFooterController
 from ckanext.pose_theme.pose_custom_footer.constants import CONFIG_KEY
+from ckanext.pose_theme.pose_custom_footer.fragment import get_footer_snapshot, render_footer
 
 if toolkit.check_ckan_version(min_version='2.9.0'):
     from ckanext.pose_theme.pose_custom_footer.plugin.flask_plugin import MixinPlugin
-    from ckan.lib.helpers import literal
 else:
     from ckanext.pose_theme.pose_custom_footer.plugin.pylons_plugin import MixinPlugin
-    from webhelpers.html import literal
 
 
 class PoseThemeFooterPlugin(MixinPlugin):
@@ -46,16 +44,14 @@ class PoseThemeFooterPlugin(MixinPlugin):
     def get_helpers(self):
         return {
             'pose_theme_get_footer_data': get_footer_data,
+            'pose_theme_render_footer': render_footer,
             'version': helper.version_builder,
             'get_column_count': helper.get_column_count,
         }
 
 
 def get_footer_data(section):
-    data_dict = CustomFooterController.get_custom_footer_metadata()
-    if data_dict.get(section):
-        return literal(data_dict.get(section))
-    return ''
+    return get_footer_snapshot().get(section)
 
 
 def custom_footer_validator(value):
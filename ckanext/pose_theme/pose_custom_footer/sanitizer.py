@@ -0,0 +1,43 @@
+"""Footer HTML sanitized once when it is saved.
+
+The bleach cleaner (and its CSS sanitizer) is built once per process. The
+columns are cleaned in the admin form, so the page only marks them as safe,
+see ``fragment.get_footer_snapshot``.
+"""
+import bleach
+
+from ckanext.pose_theme.pose_custom_footer.constants import (
+    ALLOWED_TAGS_SET,
+    ALLOWED_TAGS_LIST,
+    ALLOWED_ATTRIBUTES,
+    ALLOWED_CSS_PROPERTIES
+)
+
+CONTENT_KEYS = ('content_0', 'content_1', 'content_2', 'content_3')
+DEFAULT_FOOTER = {'layout_type': 'default', 'content_0': '', 'content_1': '', 'content_2': ''}
+
+
+def _build_cleaner():
+    try:
+        from bleach.css_sanitizer import CSSSanitizer
+    except ImportError:
+        # bleach < 5 sanitizes styles itself
+        return bleach.Cleaner(tags=ALLOWED_TAGS_LIST, attributes=ALLOWED_ATTRIBUTES,
+                              styles=ALLOWED_CSS_PROPERTIES)
+    css_sanitizer = CSSSanitizer(allowed_css_properties=ALLOWED_CSS_PROPERTIES)
+    return bleach.Cleaner(tags=ALLOWED_TAGS_SET, attributes=ALLOWED_ATTRIBUTES, css_sanitizer=css_sanitizer)
+
+
+CLEANER = _build_cleaner()
+
+
+def clean_html(text):
+    return CLEANER.clean(text or '')
+
+
+def clean_footer(data):
+    """Return the footer of the submitted form ``data`` with every column sanitized."""
+    custom_footer = {'layout_type': data.get('layout_type', 'default')}
+    for key in CONTENT_KEYS:
+        custom_footer[key] = clean_html(data.get(key, ''))
+    return custom_footer
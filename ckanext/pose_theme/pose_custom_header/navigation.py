@@ -0,0 +1,92 @@
+"""Main navigation compiled once per revision of the header config.
+
+The links are sorted, escaped and rendered when the config changes, a
+request only looks up which item to mark as active in a trie of the link
+paths.
+"""
+from collections import namedtuple
+
+from six.moves.urllib.parse import urlparse
+
+from ckanext.pose_theme.base.config_snapshot import ConfigSnapshot
+from ckanext.pose_theme.pose_custom_header.constants import CONFIG_SECTION
+from ckanext.pose_theme.pose_custom_header.controller import CustomHeaderController
+
+try:
+    from html import escape as html_escape
+except ImportError:
+    from cgi import escape as html_escape  # noqa: F401
+
+NavItem = namedtuple('NavItem', ['html', 'active_html'])
+
+# Marks the end of a path in the trie
+_LINK = None
+
+
+class HeaderSnapshot(object):
+    """Immutable compiled header: layout type, rendered items and path trie."""
+
+    __slots__ = ('layout_type', 'items', 'trie')
+
+    def __init__(self, custom_header):
+        links = sorted(custom_header.get('links', []), key=lambda link: int(link.get('position', 0)))
+        self.layout_type = custom_header.get('layout_type', 'default')
+        self.items = tuple(self._render(link) for link in links)
+        self.trie = self._build_trie(links)
+
+    @staticmethod
+    def _render(link):
+        url = html_escape(link.get('url', ''), quote=True)
+        title = html_escape(link.get('title', ''))
+        html = '<a href="{}">{}</a></li>'.format(url, title)
+        return NavItem('<li>' + html, '<li class="active">' + html)
+
+    @staticmethod
+    def _segments(path):
+        return [segment for segment in path.split('/') if segment]
+
+    def _build_trie(self, links):
+        trie = {}
+        for index, link in enumerate(links):
+            url = urlparse(link.get('url', ''))
+            if url.netloc:
+                # Links to other sites are never the current page
+                continue
+            node = trie
+            for segment in self._segments(url.path):
+                node = node.setdefault(segment, {})
+            # The first link wins when two point at the same path
+            node.setdefault(_LINK, index)
+        return trie
+
+    def active_index(self, path):
+        """Index of the link with the longest path prefix of ``path``.
+
+        ``/dataset`` is active on ``/dataset/my-dataset`` but not on
+        ``/datasets``, a link to ``/`` only on the front page.
+        """
+        segments = self._segments(path or '')
+        node = self.trie
+        active = node.get(_LINK) if not segments else None
+        for segment in segments:
+            node = node.get(segment)
+            if node is None:
+                break
+            active = node.get(_LINK, active)
+        return active
+
+    def render(self, path):
+        active = self.active_index(path)
+        return ''.join(
+            item.active_html if index == active else item.html
+            for index, item in enumerate(self.items)
+        )
+
+
+_header = ConfigSnapshot(
+    CONFIG_SECTION, lambda custom_header: HeaderSnapshot(custom_header or CustomHeaderController.default_header))
+
+
+def get_header_snapshot():
+    """Return the compiled header of the current config revision."""
+    return _header.get()
@@ -5,13 +5,8 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as tk
 
 import ckanext.pose_theme.base.helpers as helper
-from ckanext.pose_theme.pose_custom_header.controller import CustomHeaderController
 from ckanext.pose_theme.pose_custom_header.constants import CONFIG_SECTION
-
-try:
-    from html import escape as html_escape
-except ImportError:
-    from cgi import escape as html_escape  # noqa: F401
+from ckanext.pose_theme.pose_custom_header.navigation import get_header_snapshot
 
 from ckanext.pose_theme.pose_custom_header.plugin.flask_plugin import MixinPlugin
 from ckan.lib.helpers import literal
@@ -56,29 +51,11 @@ class PoseThemeHeaderPlugin(MixinPlugin):
 
 
 def build_nav_main(*args):
-    controller = CustomHeaderController()
-    custom_header = controller.get_custom_header_metadata()
-    header_links = [item for item in custom_header.get("links", [])]
-    header_links.sort(key=lambda x: int(x.get("position", 0)))
-
-    nav_output = ""
-    for nav_link in header_links:
-        url = nav_link.get("url", "")
-        title = html_escape(nav_link.get("title", ""))
-        link = tk.literal('<a href="{}">{}</a>'.format(url, title))
-        if url.endswith(tk.request.path):
-            li = tk.literal('<li class="active">') + link + tk.literal("</li>")
-        else:
-            li = tk.literal("<li>") + link + tk.literal("</li>")
-        nav_output = nav_output + li
-    return nav_output
+    return literal(get_header_snapshot().render(tk.request.path))
 
 
 def get_header_layout():
-    controller = CustomHeaderController()
-    custom_header = controller.get_custom_header_metadata()
-    layout_type = custom_header.get("layout_type", "default")
-    return layout_type
+    return get_header_snapshot().layout_type
 
 
 def custom_header_validator(value):
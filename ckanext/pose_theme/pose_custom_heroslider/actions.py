@@ -1,12 +1,8 @@
-import datetime
-import json
 import logging
 
-import ckan.lib.uploader as uploader
 import ckan.lib.helpers as h
 import ckan.plugins.toolkit as toolkit
 import ckan.lib.navl.dictization_functions as dict_fns
-from ckan import model
 
 from ckanext.pose_theme.pose_custom_heroslider import db
 
@@ -15,30 +11,33 @@ unicode_safe = toolkit.get_validator('unicode_safe')
 
 ignore_empty = toolkit.get_validator('ignore_empty')
 ignore_missing = toolkit.get_validator('ignore_missing')
-not_empty = toolkit.get_validator('not_empty')
-isodate = toolkit.get_validator('isodate')
+int_validator = toolkit.get_validator('int_validator')
 
 log = logging.getLogger(__name__)
 
 
-hero_slider_schema = {
+hero_slide_schema = {
     'id': [ignore_empty, unicode_safe],
-    'image_url_1': [ignore_empty, unicode_safe],
-    'hero_text_1': [ignore_empty, unicode_safe],
-    'image_url_2': [ignore_empty, unicode_safe],
-    'hero_text_2': [ignore_empty, unicode_safe],
-    'image_url_3': [ignore_empty, unicode_safe],
-    'hero_text_3': [ignore_empty, unicode_safe],
-    'image_url_4': [ignore_empty, unicode_safe],
-    'hero_text_4': [ignore_empty, unicode_safe],
-    'image_url_5': [ignore_empty, unicode_safe],
-    'hero_text_5': [ignore_empty, unicode_safe],
-    'created': [ignore_missing, isodate],
-    'modified': [ignore_missing, isodate]
+    'image_url': [ignore_empty, unicode_safe],
+    'text': [ignore_empty, unicode_safe],
+    'width': [ignore_empty, int_validator],
+    'height': [ignore_empty, int_validator],
+    'variants': [ignore_missing],
+}
+
+hero_slider_schema = {
+    'slides': hero_slide_schema,
 }
 
 
 def hero_slider_update(context, data_dict):
+    """Replace all hero slides, in the given order, with one bulk upsert.
+
+    :param slides: the slides, each a dict with ``image_url`` and optional
+        ``id``, ``text``, ``width``, ``height`` and ``variants`` keys. Slides
+        without an image are dropped.
+    :type slides: list of dicts
+    """
     session = context['session']
 
     toolkit.check_access('hero_slider_update', context, data_dict)
@@ -51,48 +50,39 @@ def hero_slider_update(context, data_dict):
     if errors:
         raise toolkit.ValidationError(errors)
 
-    hero = db.Hero_Slider.get_hero_images()
-    if not hero:
-        hero = db.Hero_Slider()
+    slides = [
+        slide for slide in validated_data_dict.get('slides', [])
+        if slide.get('image_url')
+    ]
 
-    for i in range(1,6):
-        field_url = 'image_url_{}'.format(i)
-        setattr(hero, field_url, data_dict.get(field_url))
+    # Keep the image metadata of slides whose image did not change
+    existing = {slide.id: slide for slide in db.Hero_Slide.get_slides()}
+    for slide in slides:
+        previous = existing.get(slide.get('id'))
+        if previous is not None and previous.image_url == slide['image_url']:
+            for field in ('width', 'height', 'variants'):
+                slide.setdefault(field, getattr(previous, field))
 
-        hero_text = 'hero_text_{}'.format(i)
-        setattr(hero, hero_text, data_dict.get(hero_text))
-
-    hero.modified = datetime.datetime.utcnow()
-
-    hero.save()
-    session.add(hero)
+    db.Hero_Slide.replace_slides(slides)
     session.commit()
 
-    return hero
+    return hero_slider_list(context, {})
 
 
 @toolkit.side_effect_free
 def hero_slider_list(context, data_dict):
-    hero = db.Hero_Slider.get_hero_images()
-    if hero:
-        hero = db.table_dictize(hero, context)
-
-        for i in range(1,6):
-            field_url = 'image_url_{}'.format(i)
-            image_display_url = 'image_display_url_{}'.format(i)
-
-            image_url = hero.get(field_url)
-            if not image_url:
-                continue
-
-            if image_url.startswith('http'):
-                hero[image_display_url] = image_url
-            else:
-                if not image_url.startswith('/uploads'):
-                    image_url = '/uploads/hero/{}'.format(image_url)
-                hero[image_display_url] = h.url_for_static(
-                    image_url,
-                    qualified=True
-                )
-
-    return hero
+    """Return all hero slides ordered by position."""
+    slides = []
+    for slide in db.Hero_Slide.get_slides():
+        slide = db.table_dictize(slide, context)
+
+        image_url = slide.get('image_url')
+        if image_url and not image_url.startswith('http'):
+            if not image_url.startswith('/uploads'):
+                image_url = '/uploads/hero/{}'.format(image_url)
+            image_url = h.url_for_static(image_url, qualified=True)
+        slide['image_display_url'] = image_url
+
+        slides.append(slide)
+
+    return slides
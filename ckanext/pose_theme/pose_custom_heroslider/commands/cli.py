@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function
+import datetime
+import timeit
+
 import click
+from ckanext.pose_theme.pose_custom_heroslider import db
 from ckanext.pose_theme.pose_custom_heroslider.db import init as db_setup
 
 
@@ -16,9 +20,41 @@ def heroslideradmin():
 def initdb():
     '''
         heroslideradmin initdb
+
+    Create the hero_slide table and copy the slides of the legacy
+    hero_slider table into it while it is empty.
     '''
     db_setup()
     print('DB tables created')
+    migrated = db.migrate_legacy_hero_slider()
+    if migrated:
+        print('{} slides migrated from the hero_slider table'.format(migrated))
+
+
+@heroslideradmin.command(name='bench-dictize')
+@click.option('--number', default=100000, help='Number of dictize calls to time.')
+def bench_dictize(number):
+    '''
+        heroslideradmin bench-dictize
+
+    Compare the compiled slide dictizer with the generic one.
+    '''
+    if db.hero_slide_table is None:
+        db.define_hero_slide_table()
+
+    now = datetime.datetime.utcnow()
+    slide = db.Hero_Slide(
+        id=db._make_uuid(), position=0, image_url='hero.jpg', text='Hero',
+        width=1600, height=400, variants={}, created=now, modified=now
+    )
+    fields = [column.name for column in db.hero_slide_table.c]
+    dictize = db.make_dictizer(db.Hero_Slide)
+
+    generic = timeit.timeit(lambda: db._generic_dictize(slide, fields, {}), number=number)
+    compiled = timeit.timeit(lambda: dictize(slide, {}), number=number)
+    print('generic:  {:.2f} us/call'.format(generic / number * 1e6))
+    print('compiled: {:.2f} us/call ({:.1f}x)'.format(
+        compiled / number * 1e6, generic / compiled))
 
 
 def get_commands():
@@ -5,13 +5,31 @@ import json
 from six import text_type
 import sqlalchemy as sa
 from sqlalchemy.orm import class_mapper
+from sqlalchemy.dialects.postgresql import insert
 
 from sqlalchemy.engine.result import Row
 
 import ckan.model as model
 
 
-hero_slider_table = None
+hero_slide_table = None
+
+# The pre-normalization single-row table. It is only read by the migration,
+# so it lives on its own metadata and is never created by ``init()``.
+legacy_hero_slider_table = sa.Table(
+    "hero_slider",
+    sa.MetaData(),
+    sa.Column("id", sa.types.UnicodeText, primary_key=True),
+    *[
+        sa.Column("{}_{}".format(name, i), sa.types.UnicodeText)
+        for i in range(1, 6)
+        for name in ("image_url", "hero_text")
+    ],
+    sa.Column("created", sa.types.DateTime),
+    sa.Column("modified", sa.types.DateTime)
+)
+
+SLIDE_FIELDS = ("position", "image_url", "text", "width", "height", "variants")
 
 
 def _make_uuid():
@@ -19,61 +37,195 @@ def _make_uuid():
 
 
 def init():
-    if hero_slider_table is None:
-        define_hero_slider_table()
+    if hero_slide_table is None:
+        define_hero_slide_table()
 
-    if not hero_slider_table.exists():
-        hero_slider_table.create()
+    if not hero_slide_table.exists():
+        hero_slide_table.create()
 
 
-class Hero_Slider(model.DomainObject):
+class Hero_Slide(model.DomainObject):
 
     @classmethod
-    def get_hero_images(self):
-        query = model.Session.query(self).autoflush(False)
-        return query.first()
-
+    def get_slides(cls):
+        query = model.Session.query(cls).autoflush(False)
+        return query.order_by(cls.position).all()
 
-def define_hero_slider_table():
-    global hero_slider_table
-    hero_slider_table = sa.Table(
-        "hero_slider",
+    @classmethod
+    def replace_slides(cls, slides):
+        """Store ``slides`` in the given order with a single upsert.
+
+        Slides keep their ``id`` when one is supplied, every slide that is not
+        part of ``slides`` is deleted. The caller owns the transaction.
+        """
+        now = datetime.datetime.utcnow()
+        rows = []
+        for position, slide in enumerate(slides):
+            row = {field: slide.get(field) for field in SLIDE_FIELDS}
+            row.update({
+                "id": slide.get("id") or _make_uuid(),
+                "position": position,
+                "image_url": slide.get("image_url") or "",
+                "text": slide.get("text") or "",
+                "created": now,
+                "modified": now,
+            })
+            rows.append(row)
+
+        model.Session.query(cls).filter(
+            ~cls.id.in_([row["id"] for row in rows])
+        ).delete(synchronize_session=False)
+
+        if rows:
+            statement = insert(hero_slide_table).values(rows)
+            statement = statement.on_conflict_do_update(
+                index_elements=[hero_slide_table.c.id],
+                set_={
+                    field: statement.excluded[field]
+                    for field in SLIDE_FIELDS + ("modified",)
+                },
+            )
+            model.Session.execute(statement)
+        return rows
+
+
+def define_hero_slide_table():
+    global hero_slide_table
+    hero_slide_table = sa.Table(
+        "hero_slide",
         model.meta.metadata,
         sa.Column("id", sa.types.UnicodeText, primary_key=True, default=_make_uuid),
-        sa.Column("image_url_1", sa.types.UnicodeText, default=""),
-        sa.Column("hero_text_1", sa.types.UnicodeText, default=""),
-        sa.Column("image_url_2", sa.types.UnicodeText, default=""),
-        sa.Column("hero_text_2", sa.types.UnicodeText, default=""),
-        sa.Column("image_url_3", sa.types.UnicodeText, default=""),
-        sa.Column("hero_text_3", sa.types.UnicodeText, default=""),
-        sa.Column("image_url_4", sa.types.UnicodeText, default=""),
-        sa.Column("hero_text_4", sa.types.UnicodeText, default=""),
-        sa.Column("image_url_5", sa.types.UnicodeText, default=""),
-        sa.Column("hero_text_5", sa.types.UnicodeText, default=""),
-        sa.Column("created", sa.types.DateTime, default=datetime.datetime.now),
-        sa.Column("modified", sa.types.DateTime, default=datetime.datetime.now),
+        sa.Column("position", sa.types.Integer, nullable=False, default=0),
+        sa.Column("image_url", sa.types.UnicodeText, default=""),
+        sa.Column("text", sa.types.UnicodeText, default=""),
+        sa.Column("width", sa.types.Integer),
+        sa.Column("height", sa.types.Integer),
+        sa.Column("variants", sa.types.JSON),
+        sa.Column("created", sa.types.DateTime, default=datetime.datetime.utcnow),
+        sa.Column("modified", sa.types.DateTime, default=datetime.datetime.utcnow),
+        sa.Index("idx_hero_slide_position", "position"),
         extend_existing=True,
     )
 
-    model.meta.mapper(Hero_Slider, hero_slider_table)
+    model.meta.mapper(Hero_Slide, hero_slide_table)
+    make_dictizer(Hero_Slide)
+
+
+def migrate_legacy_hero_slider():
+    """Copy the slides of the legacy wide ``hero_slider`` row into ``hero_slide``.
+
+    Run by ``heroslideradmin initdb``, it does nothing once ``hero_slide``
+    has slides. Returns the number of migrated slides.
+    """
+    if not legacy_hero_slider_table.exists(bind=model.meta.engine):
+        return 0
+    if model.Session.query(Hero_Slide).count():
+        return 0
+
+    legacy = legacy_hero_slider_table
+    row = model.Session.execute(
+        sa.select([legacy]).order_by(legacy.c.modified.desc()).limit(1)
+    ).first()
+    if row is None:
+        return 0
+
+    slides = []
+    for i in range(1, 6):
+        image_url = row["image_url_{}".format(i)]
+        if image_url:
+            slides.append({
+                "image_url": image_url,
+                "text": row["hero_text_{}".format(i)],
+            })
+
+    Hero_Slide.replace_slides(slides)
+    model.Session.commit()
+    return len(slides)
+
+
+SKIPPED_FIELDS = ("current", "expired_timestamp", "expired_id", "continuity_id")
+
+_dictizers = {}
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _passthrough(value):
+    return value
+
+
+def _column_converter(column):
+    """Pick the converter for a column once, instead of per value."""
+    if isinstance(column.type, sa.types.JSON):
+        return _passthrough
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return text_type
+    if issubclass(python_type, datetime.datetime):
+        return _isoformat
+    if issubclass(python_type, (int, dict, list)):
+        return _passthrough
+    return text_type
+
+
+def make_dictizer(model_class):
+    """Return a dictize function compiled for the mapped ``model_class``.
+
+    The field names and their converters are resolved once, the returned
+    callable behaves like ``table_dictize`` for instances of the class.
+    """
+    dictizer = _dictizers.get(model_class)
+    if dictizer is not None:
+        return dictizer
+
+    table = class_mapper(model_class).mapped_table
+    has_extras = "extras" in table.c
+    has_revision_timestamp = "revision_timestamp" in table.c
+    converters = tuple(
+        (column.name, _column_converter(column))
+        for column in table.c
+        if column.name not in SKIPPED_FIELDS and column.name != "extras"
+    )
+
+    def dictize(obj, context, **kw):
+        result_dict = {}
+        for name, convert in converters:
+            value = getattr(obj, name)
+            result_dict[name] = None if value is None else convert(value)
+        if has_extras and obj.extras:
+            result_dict.update(json.loads(obj.extras))
+
+        result_dict.update(kw)
+
+        if has_revision_timestamp or "revision_timestamp" in kw:
+            context["metadata_modified"] = max(
+                result_dict.get("revision_timestamp") or "",
+                context.get("metadata_modified", "")
+            )
+        else:
+            context.setdefault("metadata_modified", "")
+        return result_dict
+
+    _dictizers[model_class] = dictize
+    return dictize
 
 
 def table_dictize(obj, context, **kw):
     """Get any model object and represent it as a dict"""
-    result_dict = {}
-
     if isinstance(obj, Row):
-        fields = obj.keys()
-    else:
-        ModelClass = obj.__class__
-        table = class_mapper(ModelClass).mapped_table
-        fields = [field.name for field in table.c]
+        return _generic_dictize(obj, obj.keys(), context, **kw)
+    return make_dictizer(obj.__class__)(obj, context, **kw)
+
+
+def _generic_dictize(obj, fields, context, **kw):
+    result_dict = {}
 
     for field in fields:
         name = field
-        if name in ("current", "expired_timestamp", "expired_id"):
-            continue
-        if name == "continuity_id":
+        if name in SKIPPED_FIELDS:
             continue
         value = getattr(obj, name)
         if name == "extras" and value:
@@ -17,31 +17,31 @@ def dataset_count():
 
 
 def get_hero_images():
-    image_list = []
-    result = toolkit.get_action("hero_slider_list")({}, {})
-    if result:
-        for i in range(1, 6):
-            field_name = "image_{}".format(i)
-            image_display_url = result.get("image_display_url_{}".format(i))
-            image_list.append({field_name: image_display_url})
+    image_list = [
+        slide for slide in toolkit.get_action("hero_slider_list")({}, {})
+        if slide.get("image_display_url")
+    ]
 
     if not image_list:
-        image_list.append({"image_1": "/assets/background_BixbyCreekBridge.jpg"})
-        image_list.append({"image_2": "/assets/background_SardineLake.jpg"})
+        image_list.append({"image_display_url": "/assets/background_BixbyCreekBridge.jpg"})
+        image_list.append({"image_display_url": "/assets/background_SardineLake.jpg"})
 
     return image_list
 
 
 def get_hero_text(field_name):
+    """Return the text of a slide given one of its legacy field names.
+
+    ``image_url_1`` and ``hero_text_1`` both refer to the first slide.
+    """
     hero_dict = {}
-    result = toolkit.get_action("hero_slider_list")({}, {})
-    if result:
-        for i in range(1, 6):
-            field_url = "image_url_{}".format(i)
-            hero_text = "hero_text_{}".format(i)
-
-            if field_name in [field_url, hero_text]:
-                hero_dict["hero_text"] = result.get(hero_text)
+    try:
+        position = int(str(field_name).rsplit("_", 1)[-1]) - 1
+    except ValueError:
+        return hero_dict
+    for slide in toolkit.get_action("hero_slider_list")({}, {}):
+        if slide.get("position") == position:
+            hero_dict["hero_text"] = slide.get("text")
     return hero_dict
 
 
@@ -8,6 +8,7 @@ import ckanext.pose_theme.pose_custom_heroslider.actions as actions
 import ckanext.pose_theme.pose_custom_heroslider.auth as auth
 import ckanext.pose_theme.pose_custom_heroslider.db as db
 import ckanext.pose_theme.pose_custom_heroslider.helpers as helpers
+import ckanext.pose_theme.pose_custom_heroslider.uploads as uploads
 
 if toolkit.check_ckan_version(min_version="2.9.0"):
     from ckanext.pose_theme.pose_custom_heroslider.plugin.flask_plugin import (
@@ -28,6 +29,7 @@ class PoseHeroSliderPlugin(MixinPlugin, plugins.SingletonPlugin):
     plugins.implements(plugins.ITemplateHelpers)
     plugins.implements(plugins.IAuthFunctions, inherit=True)
     plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IMiddleware, inherit=True)
 
     # IConfigurer
     def update_config(self, config):
@@ -49,6 +51,14 @@ class PoseHeroSliderPlugin(MixinPlugin, plugins.SingletonPlugin):
     def configure(self, config):
         db.init()
 
+    # IMiddleware
+    def make_middleware(self, app, config):
+        # Counts the bytes of chunked submissions, the Flask app parses the
+        # form for the CSRF check before the view runs
+        if hasattr(app, "wsgi_app"):
+            app.wsgi_app = uploads.RequestSizeLimit(app.wsgi_app)
+        return app
+
     # ITemplateHelpers
     def get_helpers(self):
         return {
@@ -62,7 +72,7 @@ class PoseHeroSliderPlugin(MixinPlugin, plugins.SingletonPlugin):
     def get_auth_functions(self):
         return {
             "hero_slider_update": auth.hero_slider_update,
-            "hero_slider_list": actions.hero_slider_list,
+            "hero_slider_list": auth.hero_slider_list,
         }
 
     # IActions
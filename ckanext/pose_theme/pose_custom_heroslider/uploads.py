@@ -0,0 +1,202 @@
+# encoding: utf-8
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ckan.plugins.toolkit as tk
+from werkzeug.exceptions import RequestEntityTooLarge
+
+
+log = logging.getLogger(__name__)
+
+MEGABYTE = 1024 * 1024
+
+ADMIN_PATH = "/ckan-admin/hero_slider_admin"
+
+IMAGE_TYPES = ("png", "gif", "jpeg", "webp")
+
+
+def get_max_request_size():
+    """Maximum size in MB of a whole hero slider form submission."""
+    max_image_size = int(tk.config.get("ckan.max_image_size", 2))
+    return int(tk.config.get(
+        "ckanext.pose_theme.hero_slider.max_request_size", max_image_size * 5
+    ))
+
+
+def get_upload_workers():
+    return int(tk.config.get("ckanext.pose_theme.hero_slider.upload_workers", 4))
+
+
+def check_request_size(request):
+    """Reject the submission from its headers, before any body is parsed."""
+    max_size = get_max_request_size()
+    if request.content_length and request.content_length > max_size * MEGABYTE:
+        tk.abort(413, tk._("Uploaded images exceed {} MB in total").format(max_size))
+
+
+class LimitedInput(object):
+    """``wsgi.input`` that raises a 413 once more than ``limit`` bytes are read.
+
+    Chunked requests have no Content-Length, so their size is only known
+    while the form parser reads them.
+    """
+
+    def __init__(self, stream, limit):
+        self.stream = stream
+        self.limit = limit
+        self.read_bytes = 0
+
+    def _count(self, data):
+        self.read_bytes += len(data)
+        if self.read_bytes > self.limit:
+            raise RequestEntityTooLarge(
+                "Uploaded images exceed {} MB in total".format(self.limit // MEGABYTE))
+        return data
+
+    def read(self, *args):
+        return self._count(self.stream.read(*args))
+
+    def readline(self, *args):
+        return self._count(self.stream.readline(*args))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+class RequestSizeLimit(object):
+    """WSGI middleware limiting the body of the hero slider form submissions."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") == "POST" and environ.get("PATH_INFO") == ADMIN_PATH:
+            environ["wsgi.input"] = LimitedInput(
+                environ["wsgi.input"], get_max_request_size() * MEGABYTE)
+        return self.app(environ, start_response)
+
+
+def image_type(fileobj):
+    """Type of the image in ``fileobj`` from its first bytes, None if it is not one."""
+    head = fileobj.read(12)
+    fileobj.seek(0)
+    return _image_type(head)
+
+
+def _image_type(head):
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def validate_upload(field_storage):
+    """Return an error message if the uploaded file is not an image.
+
+    The type is read from the content, the mimetype sent by the browser is
+    not trusted.
+    """
+    stream = getattr(field_storage, "stream", None) or getattr(field_storage, "file", None)
+    if stream is None or image_type(stream) not in IMAGE_TYPES:
+        return tk._("Unsupported file {}, a PNG, GIF, JPEG or WebP image is required").format(
+            field_storage.filename)
+
+
+def process_uploads(uploads, max_size):
+    """Store the given ``(slide, upload)`` pairs concurrently.
+
+    Each upload is written by its uploader, which copies the file to storage
+    in fixed size chunks, then its image dimensions are stored on the slide.
+    When an upload fails, the files the other uploads created are removed
+    and the first failure is raised.
+    """
+    with ThreadPoolExecutor(max_workers=get_upload_workers()) as executor:
+        futures = [
+            executor.submit(_process_upload, slide, upload, max_size)
+            for slide, upload in uploads
+        ]
+        created, error = [], None
+        for future in futures:
+            try:
+                created.append(future.result())
+            except Exception as e:
+                error = error or e
+
+    if error is not None:
+        for filepath in created:
+            if filepath:
+                _remove(filepath)
+        # Re-raise in the request thread, e.g. a ValidationError for a file
+        # that is too large
+        raise error
+
+
+def _remove(filepath):
+    try:
+        os.remove(filepath)
+    except OSError as e:
+        log.warning("Could not remove hero slide image %s: %s", filepath, e)
+
+
+def _process_upload(slide, upload, max_size):
+    """Store ``upload``, return its path when this call created the file."""
+    started = time.time()
+    filepath = getattr(upload, "filepath", None)
+    # Content-addressed files that already exist are shared, never removed
+    existed = bool(filepath) and os.path.exists(filepath)
+    upload.upload(max_size)
+    stored = time.time()
+
+    if filepath:
+        size = get_image_size(filepath)
+        if size:
+            slide["width"], slide["height"] = size
+
+    log.info(
+        "Hero slide image %s stored in %.1f ms, processed in %.1f ms",
+        upload.filename, (stored - started) * 1000, (time.time() - stored) * 1000
+    )
+    return None if existed else filepath
+
+
+def get_image_size(path):
+    """Return ``(width, height)`` read from a PNG, GIF or JPEG header.
+
+    Only the first bytes of the file are read, the image is never decoded.
+    """
+    try:
+        with open(path, "rb") as image:
+            head = image.read(26)
+            kind = _image_type(head)
+            if kind == "png":
+                return struct.unpack(">II", head[16:24])
+            if kind == "gif":
+                return struct.unpack("<HH", head[6:10])
+            if kind == "jpeg":
+                return _jpeg_size(image)
+    except (IOError, OSError, struct.error):
+        log.debug("Could not read image size of %s", path)
+    return None
+
+
+def _jpeg_size(image):
+    image.seek(2)
+    while True:
+        marker = image.read(2)
+        if len(marker) < 2 or marker[0:1] != b"\xff":
+            return None
+        code = marker[1]
+        length = struct.unpack(">H", image.read(2))[0]
+        # Start of frame markers, excluding DHT, JPG and DAC
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", image.read(5))
+            return width, height
+        image.seek(length - 2, 1)
@@ -8,6 +8,8 @@ import ckan.lib.navl.dictization_functions as dict_fns
 import ckan.logic as logic
 import ckan.model as model
 
+import ckanext.pose_theme.pose_custom_heroslider.uploads as uploads
+
 
 _ = tk._
 c = tk.c
@@ -16,9 +18,12 @@ log = logging.getLogger(__name__)
 ckan_29_or_higher = tk.check_ckan_version(min_version="2.9.0")
 
 
-def _get_flat_dict(data):
+def _get_flat_dict(*sources):
+    params = {}
+    for data in sources:
+        params.update(logic.parse_params(data))
     data_dict = logic.clean_dict(
-        dict_fns.unflatten(logic.tuplize_dict(logic.parse_params(data)))
+        dict_fns.unflatten(logic.tuplize_dict(params))
     )
     return data_dict
 
@@ -34,9 +39,11 @@ def hero_slider_admin():
     except tk.NotAuthorized:
         tk.abort(401, _("User not authorized to view page"))
 
+    if tk.request.method == "POST":
+        uploads.check_request_size(tk.request)
+
     if ckan_29_or_higher:
-        form_data = _get_flat_dict(tk.request.form)
-        form_data.update(_get_flat_dict(tk.request.files))
+        form_data = _get_flat_dict(tk.request.form, tk.request.files)
     else:
         form_data = _get_flat_dict(tk.request.POST)
 
@@ -47,18 +54,37 @@ def hero_slider_admin():
 
     if tk.request.method == "POST":
         # Upload images to filestore
-        for i in range(1, 6):
-            field_url = "image_url_{}".format(i)
-            image_upload = "image_upload_{}".format(i)
-            clear_upload = "clear_upload_{}".format(i)
+        pending_uploads = []
+        for index, slide in enumerate(form_data.get("slides", [])):
+            image_upload = slide.get("image_upload")
+            if getattr(image_upload, "filename", None):
+                error = uploads.validate_upload(image_upload)
+                if error:
+                    errors["slides__{}__image_upload".format(index)] = [error]
+                    continue
 
             try:
-                upload = uploader.get_uploader("hero", form_data.get(field_url))
+                upload = uploader.get_uploader("hero", slide.get("image_url"))
             except AttributeError:
-                upload = uploader.Upload("hero", form_data.get(field_url))
+                upload = uploader.Upload("hero", slide.get("image_url"))
+
+            upload.update_data_dict(slide, "image_url", "image_upload", "clear_upload")
+            if upload.filename:
+                pending_uploads.append((slide, upload))
+            else:
+                upload.upload(uploader.get_max_image_size())
 
-            upload.update_data_dict(form_data, field_url, image_upload, clear_upload)
-            upload.upload(uploader.get_max_image_size())
+        if errors:
+            h.flash_error(", ".join(
+                message for messages in errors.values() for message in messages
+            ))
+            return tk.redirect_to(h.url_for(admin_route))
+
+        try:
+            uploads.process_uploads(pending_uploads, uploader.get_max_image_size())
+        except tk.ValidationError as e:
+            h.flash_error(e.error_summary)
+            return tk.redirect_to(h.url_for(admin_route))
 
         # Save metadata to DB
         try:
@@ -73,8 +99,8 @@ def hero_slider_admin():
             h.flash_success(_("The hero slider has been updated."))
         return tk.redirect_to(h.url_for(admin_route))
 
-    hero_slider_list = tk.get_action("hero_slider_list")()
+    hero_slider_list = tk.get_action("hero_slider_list")(context, {})
 
-    vars = {"data": hero_slider_list, "errors": errors, "error_summary": error_summary}
+    vars = {"data": {"slides": hero_slider_list}, "errors": errors, "error_summary": error_summary}
 
     return tk.render("admin/manage_hero_slider_admin.html", extra_vars=vars)
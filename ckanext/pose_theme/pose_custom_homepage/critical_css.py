@@ -0,0 +1,243 @@
+"""Extraction of the CSS needed to render the top of the homepage.
+
+``ckan pose-theme build-critical-css`` renders every homepage layout, matches
+the rules of its stylesheets against the elements above the fold and writes
+one file per layout. The homepage inlines that file and loads the complete
+stylesheets without blocking the first paint.
+"""
+import os
+import re
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse
+
+import tinycss2
+from ckan.lib.helpers import literal
+from ckan.lib.uploader import get_storage_path
+from ckan.plugins import toolkit
+from ckan.plugins.toolkit import aslist, config
+
+from ckanext.pose_theme.base.compatibility_controller import BaseCompatibilityController
+from ckanext.pose_theme.base.css_minifier import minify_css
+from ckanext.pose_theme.base.css_pruner import split_selectors
+from ckanext.pose_theme.pose_custom_homepage.constants import CUSTOM_STYLE
+
+CRITICAL_CSS_DIR = 'ckanext.pose_theme.critical_css_dir'
+FOLD_SELECTORS = 'ckanext.pose_theme.critical_css.fold_selectors'
+DEFAULT_FOLD_SELECTORS = ('.account-masthead, .masthead, header, .homepage #content, '
+                          '.homepage [role=main] > :first-child')
+# WSGI environ key of the layout rendered for build_critical_css, a client can
+# not set it, unlike a header or a query parameter
+LAYOUT_ENVIRON = 'ckanext.pose_theme.critical_css.layout'
+
+# State and pseudo elements can not match a static document, the rule is
+# needed when the element without them is above the fold.
+DYNAMIC_PSEUDO = re.compile(
+    r'::?(hover|focus|focus-within|focus-visible|active|visited|link|target|checked|disabled|'
+    r'before|after|first-line|first-letter|placeholder|selection|marker|'
+    r'-webkit-[a-z-]+|-moz-[a-z-]+|-ms-[a-z-]+)(\([^)]*\))?'
+)
+STYLESHEET_LINK = re.compile(r'<link\b[^>]*\brel=["\']stylesheet["\'][^>]*>')
+LINK_HREF = re.compile(r'\bhref=["\']([^"\']+)["\']')
+CSS_URL = re.compile(r'url\((["\']?)([^"\')]+)\1\)')
+# At-rules that are kept as they are when a page uses a stylesheet
+KEPT_AT_RULES = {'font-face', 'charset'}
+GROUPING_AT_RULES = {'media', 'supports'}
+
+
+def get_critical_css_dir():
+    directory = config.get(CRITICAL_CSS_DIR)
+    if directory:
+        return directory
+    storage_path = get_storage_path()
+    if storage_path:
+        return os.path.join(storage_path, 'storage', 'pose_critical_css')
+
+
+def get_critical_css_path(layout):
+    directory = get_critical_css_dir()
+    if directory:
+        return os.path.join(directory, 'layout{}.css'.format(layout))
+
+
+@lru_cache(maxsize=16)
+def _read_critical_css(path, mtime):
+    with open(path, encoding='utf-8') as css_file:
+        return css_file.read()
+
+
+def get_critical_css(layout):
+    """Return the critical CSS of a homepage layout, or '' before it is built."""
+    path = get_critical_css_path(layout)
+    try:
+        mtime = os.path.getmtime(path) if path else None
+    except OSError:
+        return ''
+    return _read_critical_css(path, mtime) if mtime else ''
+
+
+def get_homepage_layout():
+    """Layout of the homepage, or the one ``build_critical_css`` renders."""
+    layout = toolkit.request.environ.get(LAYOUT_ENVIRON)
+    return layout or BaseCompatibilityController.get_data(CUSTOM_STYLE) or '1'
+
+
+def defer_styles():
+    """Load the stylesheets of the current page without blocking its rendering."""
+    toolkit.g.pose_theme_defer_styles = True
+    return ''
+
+
+def defer_stylesheets(html):
+    """Turn stylesheet links into preloads that apply once they are loaded."""
+    def replace(match):
+        href = LINK_HREF.search(match.group(0))
+        if not href:
+            return match.group(0)
+        return ('<link rel="preload" as="style" href="{0}" onload="this.onload=null;this.rel=\'stylesheet\'" />'
+                '<noscript><link rel="stylesheet" href="{0}" /></noscript>').format(href.group(1))
+    return STYLESHEET_LINK.sub(replace, html)
+
+
+def render_assets(next_helper, type_):
+    """Chained ``h.render_assets``, see ``defer_styles``."""
+    html = next_helper(type_)
+    if type_ == 'style' and getattr(toolkit.g, 'pose_theme_defer_styles', False):
+        return literal(defer_stylesheets(html))
+    return html
+
+
+def _import_selector_matcher():
+    try:
+        import lxml.html
+        from lxml.cssselect import CSSSelector
+    except ImportError:
+        raise RuntimeError('Building critical CSS needs the lxml and cssselect packages, '
+                           'install them with "pip install lxml cssselect"')
+    return lxml.html, CSSSelector
+
+
+def get_stylesheet_urls(document):
+    """Local stylesheets of the page, including the ones loaded asynchronously."""
+    urls = []
+    for link in document.iter('link'):
+        rel = (link.get('rel') or '').lower()
+        if rel == 'stylesheet' or (rel == 'preload' and link.get('as') == 'style'):
+            href = link.get('href')
+            if href and not urlparse(href).netloc and href not in urls:
+                urls.append(href)
+    return urls
+
+
+def get_fold_elements(document, CSSSelector):
+    """Elements above the fold, with their ancestors and descendants."""
+    elements = set()
+    for selector in aslist(config.get(FOLD_SELECTORS, DEFAULT_FOLD_SELECTORS), ','):
+        for element in CSSSelector(selector)(document):
+            elements.update(element.iter())
+            elements.update(element.iterancestors())
+    return elements
+
+
+class SelectorMatcher(object):
+    def __init__(self, document, elements, CSSSelector):
+        self.document = document
+        self.elements = elements
+        self.CSSSelector = CSSSelector
+        self._cache = {}
+
+    def matches(self, selector):
+        selector = DYNAMIC_PSEUDO.sub('', selector).strip() or '*'
+        if selector not in self._cache:
+            try:
+                matched = self.CSSSelector(selector)(self.document)
+            except Exception:
+                # Keep what can not be checked rather than break the page
+                self._cache[selector] = True
+            else:
+                self._cache[selector] = any(element in self.elements for element in matched)
+        return self._cache[selector]
+
+
+def _absolute_urls(css, stylesheet_url):
+    def replace(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', '#')) or urlparse(url).scheme or url.startswith('/'):
+            return match.group(0)
+        return 'url({0}{1}{0})'.format(match.group(1), urljoin(stylesheet_url, url))
+    return CSS_URL.sub(replace, css)
+
+
+def _critical_rules(nodes, matcher):
+    critical = []
+    for node in nodes:
+        if node.type == 'qualified-rule':
+            selectors = [tinycss2.serialize(tokens).strip() for tokens in split_selectors(node.prelude)]
+            selectors = [selector for selector in selectors if matcher.matches(selector)]
+            if selectors:
+                critical.append('{}{{{}}}'.format(', '.join(selectors), tinycss2.serialize(node.content)))
+        elif node.type == 'at-rule':
+            if node.lower_at_keyword in KEPT_AT_RULES:
+                critical.append(node.serialize())
+            elif node.lower_at_keyword in GROUPING_AT_RULES and node.content is not None:
+                nested = tinycss2.parse_rule_list(node.content, skip_comments=True, skip_whitespace=True)
+                nested = _critical_rules(nested, matcher)
+                if nested:
+                    critical.append('@{} {}{{{}}}'.format(
+                        node.at_keyword, tinycss2.serialize(node.prelude).strip(), ''.join(nested)))
+    return critical
+
+
+def extract_critical_css(html, stylesheets):
+    """Return the rules of ``stylesheets`` that apply above the fold of ``html``.
+
+    :param stylesheets: ``(url, css)`` pairs, relative URLs inside the CSS are
+        resolved against ``url`` since the result is inlined into the page
+    """
+    lxml_html, CSSSelector = _import_selector_matcher()
+    document = lxml_html.document_fromstring(html)
+    matcher = SelectorMatcher(document, get_fold_elements(document, CSSSelector), CSSSelector)
+
+    critical = []
+    for url, css in stylesheets:
+        nodes = tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True)
+        critical.append(_absolute_urls(''.join(_critical_rules(nodes, matcher)), url))
+    css = minify_css(''.join(critical))[0]
+    # Inlined into a <style> element
+    return css.replace('</', '<\\/')
+
+
+def build_critical_css(client, layout, path='/'):
+    """Render the homepage in ``layout`` and return its critical CSS.
+
+    :param client: a WSGI test client of the CKAN app, used for the page and
+        its stylesheets
+    :returns: the critical CSS and the ``(url, css)`` stylesheets of the page
+    """
+    lxml_html, _ = _import_selector_matcher()
+    # Passed with the request, the config is reset from the database when
+    # the app globals of the process are out of date
+    response = client.get(path, environ_overrides={LAYOUT_ENVIRON: str(layout)})
+    if response.status_code != 200:
+        raise RuntimeError('{} responded with {}'.format(path, response.status))
+
+    html = response.get_data(as_text=True)
+    stylesheets = []
+    for url in get_stylesheet_urls(lxml_html.document_fromstring(html)):
+        css_response = client.get(url)
+        if css_response.status_code == 200:
+            stylesheets.append((url, css_response.get_data(as_text=True)))
+    return extract_critical_css(html, stylesheets), stylesheets
+
+
+def write_critical_css(layout, css):
+    path = get_critical_css_path(layout)
+    if not path:
+        raise RuntimeError('Set ckan.storage_path or {} to build critical CSS'.format(CRITICAL_CSS_DIR))
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = '{}~'.format(path)
+    with open(tmp_path, 'w', encoding='utf-8') as css_file:
+        css_file.write(css)
+    os.rename(tmp_path, path)
+    return path
@@ -2,6 +2,7 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 
 import ckanext.pose_theme.base.helpers as helper
+import ckanext.pose_theme.pose_custom_homepage.critical_css as critical_css
 from ckanext.pose_theme.pose_custom_homepage.constants import CUSTOM_NAMING, CUSTOM_STYLE
 
 if toolkit.check_ckan_version(min_version='2.9.0'):
@@ -39,7 +40,7 @@ class PoseThemeHomepagePlugin(MixinPlugin):
 
     # ITemplateHelpers
     def get_helpers(self):
-        return {
+        helpers = {
             'pose_theme_get_dataset_count': helper.dataset_count,
             'pose_theme_get_showcases': helper.showcases,
             'pose_theme_get_extensions': helper.extensions,
@@ -60,4 +61,10 @@ class PoseThemeHomepagePlugin(MixinPlugin):
             'pose_theme_get_featured_sites': helper.featured_sites,
             'version': helper.version_builder,
             'is_activity_enabled': helper.is_activity_enabled,
+            'pose_theme_get_homepage_layout': critical_css.get_homepage_layout,
+            'pose_theme_get_critical_css': critical_css.get_critical_css,
+            'pose_theme_defer_styles': critical_css.defer_styles,
         }
+        if hasattr(toolkit, 'chained_helper'):
+            helpers['render_assets'] = toolkit.chained_helper(critical_css.render_assets)
+        return helpers
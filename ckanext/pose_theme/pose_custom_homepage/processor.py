@@ -39,33 +39,25 @@ class RecentDatasetsNaming(AbstractParser):
 
 
 class CustomNamingProcessor:
-
-    def __init__(self):
-        self.groups = GroupsNaming()
-        self.showcases = ShowcasesNaming()
-        self.popular_datasets = PopularDatasetsNaming()
-        self.recent_datasets = RecentDatasetsNaming()
-        self.extensions = ExtensionsNaming()
-        self.sites = SitesNaming()
-
-        self.naming_processors = (
-            self.groups,
-            self.showcases,
-            self.extensions,
-            self.sites,
-            self.popular_datasets,
-            self.recent_datasets
-        )
+    """Stateless, the parsers only describe the fields."""
+    naming_processors = (
+        GroupsNaming(),
+        ShowcasesNaming(),
+        ExtensionsNaming(),
+        SitesNaming(),
+        PopularDatasetsNaming(),
+        RecentDatasetsNaming()
+    )
 
     def get_custom_naming(self, data):
         result = {}
         for processor in self.naming_processors:
-            processor.parse_form_data(data)
-            result[processor.form_name] = {
-                "title": processor.title,
-                "value": processor.value,
+            parsed = processor.parse_form_data(data)
+            result[parsed.form_name] = {
+                "title": parsed.title,
+                "value": parsed.value,
             }
         return result
 
 
-custom_naming_processor = CustomNamingProcessor() 
+custom_naming_processor = CustomNamingProcessor()
@@ -1,18 +1,17 @@
 # !/usr/bin/env python
 # encoding: utf-8
 import logging
-import socket
 from datetime import datetime, timezone
 
-from ckan import logic
+from ckan import logic, model
 from ckan.common import asbool
-from ckan.lib import mailer
 from ckan.lib.navl.dictization_functions import unflatten
 from ckan.plugins import PluginImplementations, toolkit
 from pyisemail import is_email
 
 from ckanext.contact import recaptcha
 from ckanext.contact.interfaces import IContact
+from ckanext.pose_theme.routes import email_dns, outbox, recaptcha_client
 
 log = logging.getLogger(__name__)
 
@@ -43,9 +42,16 @@ def validate(data_dict):
         toolkit.asbool(toolkit.config.get('ckanext.contact.check_email', True))
         and data_dict.get('email')
     ):
-        if not is_email(data_dict['email'], check_dns=True):
+        # The domain is checked by email_dns within its time budget
+        dns_status = None
+        if is_email(data_dict['email']):
+            dns_status = email_dns.check_email_domain(data_dict['email'])
+        if dns_status in (None, email_dns.INVALID):
             errors['email'] = ['Email address appears to be invalid']
             error_summary['email'] = 'Email address appears to be invalid'
+        elif dns_status == email_dns.UNKNOWN:
+            # Accepted, the recipients are told the domain was not verified
+            data_dict['email_unverified'] = True
 
     # Validate URL if provided
     if data_dict.get('url'):
@@ -58,7 +64,7 @@ def validate(data_dict):
     if not errors:
         try:
             expected_action = toolkit.config.get('ckanext.contact.recaptcha_v3_action')
-            recaptcha.check_recaptcha(
+            recaptcha_client.check_recaptcha(
                 data_dict.get('g-recaptcha-response', None), expected_action
             )
         except recaptcha.RecaptchaError as e:
@@ -142,6 +148,10 @@ def submit():
             '───────────────────────────────────────────────────',
             f'Name:         {data_dict.get("name", "Not provided")}',
             f'Email:        {data_dict["email"]}',
+        ]
+        if data_dict.get('email_unverified'):
+            body_parts.append('              (the domain of this address could not be verified)')
+        body_parts += [
             f'Organization: {data_dict.get("organization", "Not provided")}',
             '',
             '───────────────────────────────────────────────────',
@@ -195,14 +205,13 @@ def submit():
             emails = [emails]
             names = [names]
 
-        # Send email to all recipients
-        for name, email in zip(names, emails):
-            try:
-                mailer.mail_recipient(name, email, **mail_dict)
-                log.info(f'Contact form email sent successfully to {email}')
-            except (mailer.MailerException, socket.error) as e:
-                log.error(f'Failed to send contact form email to {email}: {str(e)}')
-                email_success = False
+        # Written to the outbox, a background job or the mail worker sends them
+        try:
+            outbox.enqueue(mail_dict, zip(names, emails))
+        except Exception as e:
+            model.Session.rollback()
+            log.error(f'Failed to queue contact form email: {str(e)}')
+            email_success = False
 
     return {
         'success': recaptcha_error is None and len(errors) == 0 and email_success,
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, request
 from ckan.plugins import toolkit
-from ckanext.pose_theme.routes import _helpers
+from ckanext.pose_theme.routes import _helpers, rate_limit
 
 contact_blueprint = Blueprint('pose_contact', __name__)
 
@@ -16,10 +16,20 @@ def form():
     
     # User is authenticated, proceed with form handling
     if request.method == 'POST':
+        # Bursts and repeated submissions are turned away before any validation
+        guard = rate_limit.get_guard()
+        rejection, digest = guard.check(
+            toolkit.current_user.id, rate_limit.get_client_ip(request.environ), request.form
+        )
+        if rejection:
+            return _rejected(rejection)
+
         result = _helpers.submit()
         if result['success']:
             return render_template('contact/success.html')
         else:
+            # Let the user send the same content again once it is fixed
+            guard.release(digest)
             return render_template(
                 'contact/form.html',
                 data=result['data'],
@@ -30,5 +40,21 @@ def form():
     
     return render_template('contact/form.html', data={}, errors={})
 
+def _rejected(rejection):
+    if rejection.reason == rate_limit.DUPLICATE:
+        message = toolkit._('This message has already been sent.')
+        status = 409
+    else:
+        message = toolkit._('Too many messages, please try again later.')
+        status = 429
+    headers = {'Retry-After': str(rejection.retry_after)} if rejection.retry_after else {}
+    page = render_template(
+        'contact/form.html',
+        data=request.form,
+        errors={},
+        error_summary={toolkit._('Contact'): message},
+    )
+    return page, status, headers
+
 def get_blueprints():
     return [contact_blueprint]
\ No newline at end of file
@@ -0,0 +1,211 @@
+# encoding: utf-8
+"""DNS check of contact form email domains within a time budget.
+
+Lookups run in a small thread pool shared by the requests of a worker, the
+request only waits up to ``dns_timeout`` seconds for the answer. Answers are
+cached by domain, domains that exist for longer than domains that do not.
+A lookup that outlives the budget keeps running and caches its answer for
+the next submission from the same domain.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from ckan.plugins import toolkit
+
+log = logging.getLogger(__name__)
+
+VALID = 'valid'
+INVALID = 'invalid'
+# Not answered in time or the lookup failed
+UNKNOWN = 'unknown'
+
+# Wait for the answer up to the timeout budget
+MODE_BLOCK = 'block'
+# Accept straight away unless the domain is already known not to exist
+MODE_LATER = 'later'
+MODE_OFF = 'off'
+MODES = (MODE_BLOCK, MODE_LATER, MODE_OFF)
+
+
+def get_mode():
+    mode = toolkit.config.get('ckanext.pose_theme.contact.email_dns', MODE_BLOCK)
+    if mode not in MODES:
+        log.warning(f'Unknown email DNS mode "{mode}", using "{MODE_BLOCK}"')
+        return MODE_BLOCK
+    return mode
+
+
+def get_timeout():
+    return float(toolkit.config.get('ckanext.pose_theme.contact.dns_timeout', 1.5))
+
+
+def get_positive_ttl():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.dns_positive_ttl', 24 * 60 * 60))
+
+
+def get_negative_ttl():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.dns_negative_ttl', 60 * 60))
+
+
+class DNSResolver(object):
+    """Looks up the MX records of a domain, then its A and AAAA records."""
+
+    RECORD_TYPES = ('MX', 'A', 'AAAA')
+
+    def __init__(self, lifetime=None):
+        import dns.resolver
+        self.dns = dns
+        self.resolver = dns.resolver.Resolver()
+        if lifetime:
+            self.resolver.lifetime = lifetime
+
+    def has_mail_host(self, domain):
+        """Whether mail can be delivered to ``domain``, raises when the lookup fails."""
+        for record_type in self.RECORD_TYPES:
+            try:
+                answer = self.resolver.resolve(domain, record_type)
+            except self.dns.resolver.NXDOMAIN:
+                return False
+            except (self.dns.resolver.NoAnswer, self.dns.resolver.NoNameservers):
+                continue
+            if record_type != 'MX' or any(str(record.exchange) != '.' for record in answer):
+                return True
+        return False
+
+
+class FakeResolver(object):
+    """Resolver answering from a ``{domain: bool}`` dict, for tests.
+
+    Unlisted domains do not exist. ``delay`` seconds are slept before every
+    answer and domains in ``failing`` raise, to simulate a slow or broken
+    resolver.
+    """
+
+    def __init__(self, domains=None, delay=0, failing=()):
+        self.domains = dict(domains or {})
+        self.delay = delay
+        self.failing = set(failing)
+        self.lookups = []
+
+    def has_mail_host(self, domain):
+        self.lookups.append(domain)
+        if self.delay:
+            time.sleep(self.delay)
+        if domain in self.failing:
+            raise OSError(f'Lookup of {domain} failed')
+        return self.domains.get(domain, False)
+
+
+class DomainChecker(object):
+    def __init__(self, resolver, positive_ttl=24 * 60 * 60, negative_ttl=60 * 60, max_workers=4,
+                 max_size=10000):
+        self.resolver = resolver
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pose-email-dns')
+        self._cache = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def cached(self, domain):
+        """Cached status of ``domain``, ``UNKNOWN`` when it is not cached."""
+        entry = self._cache.get(domain)
+        if entry is None:
+            return UNKNOWN
+        status, expires = entry
+        if expires < time.monotonic():
+            self._cache.pop(domain, None)
+            return UNKNOWN
+        return status
+
+    def _lookup(self, domain):
+        try:
+            valid = self.resolver.has_mail_host(domain)
+        except Exception as e:
+            # Not cached, the next submission tries again
+            log.info(f'DNS lookup of {domain} failed: {e}')
+            return UNKNOWN
+        status = VALID if valid else INVALID
+        ttl = self.positive_ttl if valid else self.negative_ttl
+        now = time.monotonic()
+        with self._lock:
+            if len(self._cache) >= self.max_size:
+                self._purge(now)
+            self._cache[domain] = (status, now + ttl)
+        return status
+
+    def _purge(self, now):
+        for domain in [domain for domain, (_, expires) in self._cache.items() if expires < now]:
+            del self._cache[domain]
+        # Still full of live answers, they are looked up again when needed
+        if len(self._cache) >= self.max_size:
+            self._cache.clear()
+
+    def _done(self, domain, future):
+        with self._lock:
+            if self._pending.get(domain) is future:
+                del self._pending[domain]
+
+    def lookup(self, domain):
+        """Start the lookup of ``domain`` unless one is running, return its future."""
+        with self._lock:
+            future = self._pending.get(domain)
+            if future is not None:
+                return future
+            future = self._pending[domain] = self.executor.submit(self._lookup, domain)
+        # Outside of the lock, a finished future runs the callback right away
+        future.add_done_callback(lambda f: self._done(domain, f))
+        return future
+
+    def check(self, domain, timeout=0):
+        """Return the status of ``domain`` waiting at most ``timeout`` seconds."""
+        domain = domain.strip().lower().rstrip('.')
+        status = self.cached(domain)
+        if status != UNKNOWN:
+            return status
+        future = self.lookup(domain)
+        if timeout <= 0:
+            return UNKNOWN
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            log.info(f'DNS lookup of {domain} took longer than {timeout}s')
+            return UNKNOWN
+
+    def clear(self):
+        self._cache.clear()
+
+
+_checker = None
+_checker_lock = threading.Lock()
+
+
+def get_checker():
+    """Domain checker of this worker, built on first use."""
+    global _checker
+    if _checker is None:
+        with _checker_lock:
+            if _checker is None:
+                _checker = DomainChecker(DNSResolver(get_timeout() * 2), get_positive_ttl(), get_negative_ttl())
+    return _checker
+
+
+def set_resolver(resolver):
+    """Replace the resolver of this worker, e.g. by a ``FakeResolver`` in tests."""
+    global _checker
+    with _checker_lock:
+        _checker = DomainChecker(resolver, get_positive_ttl(), get_negative_ttl())
+    return _checker
+
+
+def check_email_domain(email):
+    """Return the DNS status of the domain of ``email`` according to the configured mode."""
+    mode = get_mode()
+    if mode == MODE_OFF or '@' not in email:
+        return VALID
+    domain = email.rsplit('@', 1)[1]
+    timeout = get_timeout() if mode == MODE_BLOCK else 0
+    return get_checker().check(domain, timeout)
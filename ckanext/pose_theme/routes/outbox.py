@@ -0,0 +1,345 @@
+# encoding: utf-8
+"""Outbox of the contact form emails.
+
+The form writes one row per recipient and returns, the rows are sent by a
+background job or by ``ckan pose-theme mail-worker``. A batch of due rows is
+claimed, then sent over a single SMTP connection once the claim is
+committed. A failed row is tried again later with an exponential backoff
+until ``max_attempts`` is reached, the background job schedules the retry.
+Sent rows are deleted after ``sent_retention_days``.
+
+The table is created when the plugin is configured, or by ``ckan pose-theme
+initdb``.
+"""
+import datetime
+import logging
+import smtplib
+import socket
+import uuid
+from email import utils
+from email.message import EmailMessage
+
+import sqlalchemy as sa
+from six import text_type
+
+import ckan.model as model
+from ckan.plugins import toolkit
+
+log = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Enqueue a CKAN background job for every submission
+DELIVERY_JOBS = 'jobs'
+# Leave the rows to ``ckan pose-theme mail-worker``
+DELIVERY_WORKER = 'worker'
+
+contact_outbox_table = None
+
+
+def _make_uuid():
+    return text_type(uuid.uuid4())
+
+
+def get_delivery():
+    return toolkit.config.get('ckanext.pose_theme.contact.delivery', DELIVERY_JOBS)
+
+
+def get_batch_size():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.batch_size', 50))
+
+
+def get_max_attempts():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.max_attempts', 6))
+
+
+def get_retry_delay():
+    """Seconds before the first retry, doubled for every following one."""
+    return int(toolkit.config.get('ckanext.pose_theme.contact.retry_delay', 60))
+
+
+def get_smtp_timeout():
+    """Seconds an SMTP connect or command may take."""
+    return float(toolkit.config.get('ckanext.pose_theme.contact.smtp_timeout', 30))
+
+
+def get_sent_retention():
+    return datetime.timedelta(days=float(toolkit.config.get('ckanext.pose_theme.contact.sent_retention_days', 7)))
+
+
+def get_backoff(attempts):
+    # At most a day between two attempts
+    return datetime.timedelta(seconds=min(get_retry_delay() * 2 ** (attempts - 1), 24 * 60 * 60))
+
+
+def init():
+    if contact_outbox_table is None:
+        define_contact_outbox_table()
+
+    if not contact_outbox_table.exists():
+        contact_outbox_table.create()
+
+
+class ContactOutbox(model.DomainObject):
+    pass
+
+
+def define_contact_outbox_table():
+    global contact_outbox_table
+    contact_outbox_table = sa.Table(
+        'pose_contact_outbox',
+        model.meta.metadata,
+        sa.Column('id', sa.types.UnicodeText, primary_key=True, default=_make_uuid),
+        sa.Column('recipient_name', sa.types.UnicodeText, default=''),
+        sa.Column('recipient_email', sa.types.UnicodeText, nullable=False),
+        sa.Column('subject', sa.types.UnicodeText, default=''),
+        sa.Column('body', sa.types.UnicodeText, default=''),
+        sa.Column('headers', sa.types.JSON),
+        sa.Column('status', sa.types.UnicodeText, nullable=False, default=PENDING),
+        sa.Column('attempts', sa.types.Integer, nullable=False, default=0),
+        sa.Column('last_error', sa.types.UnicodeText),
+        sa.Column('next_attempt', sa.types.DateTime, default=datetime.datetime.utcnow),
+        sa.Column('created', sa.types.DateTime, default=datetime.datetime.utcnow),
+        sa.Column('sent', sa.types.DateTime),
+        sa.Index('idx_pose_contact_outbox_due', 'status', 'next_attempt'),
+        extend_existing=True,
+    )
+
+    model.meta.mapper(ContactOutbox, contact_outbox_table)
+
+
+def enqueue(mail_dict, recipients):
+    """Write one row per ``(name, email)`` of ``recipients`` and schedule their delivery.
+
+    :param mail_dict: the ``subject``, ``body`` and ``headers`` of the email
+    :returns: the ids of the new rows
+    """
+    if contact_outbox_table is None:
+        define_contact_outbox_table()
+    now = datetime.datetime.utcnow()
+    rows = [{
+        'id': _make_uuid(),
+        'recipient_name': name or '',
+        'recipient_email': email,
+        'subject': mail_dict.get('subject', ''),
+        'body': mail_dict.get('body', ''),
+        'headers': mail_dict.get('headers') or {},
+        'status': PENDING,
+        'attempts': 0,
+        'next_attempt': now,
+        'created': now,
+    } for name, email in recipients]
+    if not rows:
+        return []
+    model.Session.execute(contact_outbox_table.insert(), rows)
+    model.Session.commit()
+
+    if get_delivery() == DELIVERY_JOBS:
+        try:
+            toolkit.enqueue_job(deliver_pending, title='Contact form emails')
+        except Exception as e:
+            # The rows stay due, the next job or the mail worker sends them
+            log.error(f'Could not enqueue the contact form emails: {e}')
+    return [row['id'] for row in rows]
+
+
+def schedule_retry(next_attempt):
+    """Enqueue a background job that sends the rows due at ``next_attempt``.
+
+    Scheduled jobs are run by ``ckan jobs worker`` unless it was started
+    with ``--no-scheduler``.
+    """
+    from ckan.lib import jobs
+
+    delay = max(next_attempt - datetime.datetime.utcnow(), datetime.timedelta(0))
+    try:
+        job = jobs.get_queue().enqueue_in(delay, deliver_pending, job_timeout=toolkit.config.get('ckan.jobs.timeout'))
+        job.meta['title'] = 'Contact form emails retry'
+        job.save_meta()
+    except Exception as e:
+        # The rows stay pending, the next submission sends them
+        log.error(f'Could not schedule the retry of the contact form emails: {e}')
+
+
+def build_message(row):
+    """The email of an outbox row, the way ``ckan.lib.mailer`` builds it."""
+    mail_from = toolkit.config.get('smtp.mail_from')
+    reply_to = toolkit.config.get('smtp.reply_to')
+    site_title = toolkit.config.get('ckan.site_title')
+
+    message = EmailMessage()
+    message.set_content(row.body, cte='base64')
+    for key, value in (row.headers or {}).items():
+        if key in message:
+            message.replace_header(key, value)
+        else:
+            message[key] = value
+    message['Subject'] = row.subject
+    message['From'] = f'{site_title} <{mail_from}>'
+    message['To'] = f'{row.recipient_name} <{row.recipient_email}>'
+    message['Date'] = utils.formatdate()
+    if reply_to and not message['Reply-to']:
+        message['Reply-to'] = reply_to
+    return message
+
+
+class SMTPConnection(object):
+    """One SMTP connection configured like the one of ``ckan.lib.mailer``."""
+
+    def __init__(self):
+        self.connection = None
+
+    def open(self):
+        # A reconnect replaces the current connection
+        self.close()
+        config = toolkit.config
+        if 'smtp.test_server' in config:
+            # Tests, as in ckan.lib.mailer
+            server, starttls, user, password = config['smtp.test_server'], False, None, None
+        else:
+            server = config.get('smtp.server', 'localhost')
+            starttls = toolkit.asbool(config.get('smtp.starttls'))
+            user = config.get('smtp.user')
+            password = config.get('smtp.password')
+
+        connection = smtplib.SMTP(timeout=get_smtp_timeout())
+        connection.connect(server)
+        connection.ehlo()
+        if starttls:
+            if not connection.has_extn('STARTTLS'):
+                connection.quit()
+                raise smtplib.SMTPNotSupportedError('SMTP server does not support STARTTLS')
+            connection.starttls()
+            connection.ehlo()
+        if user:
+            connection.login(user, password)
+        self.connection = connection
+        return self
+
+    def send(self, message, recipient):
+        self.connection.send_message(message, toolkit.config.get('smtp.mail_from'), [recipient])
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, socket.error):
+                self.connection.close()
+            self.connection = None
+
+
+def _claim_due(batch_size):
+    """Claim the due rows of a batch and return their ids.
+
+    The rows are locked only long enough to move their ``next_attempt``
+    past the time the batch may take to send, rows locked by another worker
+    are skipped. Rows of a worker that died while sending are due again
+    once their claim expires.
+    """
+    rows = model.Session.query(ContactOutbox).filter(
+        ContactOutbox.status == PENDING,
+        ContactOutbox.next_attempt <= datetime.datetime.utcnow(),
+    ).order_by(ContactOutbox.next_attempt).limit(batch_size).with_for_update(skip_locked=True).all()
+    # Connecting, then every message, each bounded by the SMTP timeout
+    claimed_until = datetime.datetime.utcnow() + datetime.timedelta(
+        seconds=get_smtp_timeout() * (len(rows) + 1))
+    for row in rows:
+        row.next_attempt = claimed_until
+    ids = [row.id for row in rows]
+    model.Session.commit()
+    return ids
+
+
+def _failed(row, error):
+    """Record a failed attempt, return when the row is due again or None when given up."""
+    row.attempts += 1
+    row.last_error = text_type(error)
+    if row.attempts >= get_max_attempts():
+        row.status = FAILED
+        log.error(f'Giving up on the contact form email to {row.recipient_email}: {error}')
+        return None
+    row.next_attempt = datetime.datetime.utcnow() + get_backoff(row.attempts)
+    log.warning(f'Contact form email to {row.recipient_email} failed, attempt {row.attempts}: {error}')
+    return row.next_attempt
+
+
+def deliver_batch(batch_size=None):
+    """Send one batch of due emails over a single connection.
+
+    In ``jobs`` delivery, a retry is scheduled for the rows that failed and
+    are tried again later.
+
+    :returns: ``(sent, failed)`` counts of the batch
+    """
+    if contact_outbox_table is None:
+        define_contact_outbox_table()
+    ids = _claim_due(batch_size or get_batch_size())
+    if not ids:
+        return 0, 0
+    rows = model.Session.query(ContactOutbox).filter(
+        ContactOutbox.id.in_(ids)).order_by(ContactOutbox.created).all()
+
+    sent = 0
+    retries = []
+    smtp = SMTPConnection()
+    try:
+        smtp.open()
+    except (smtplib.SMTPException, socket.error) as e:
+        retries = [_failed(row, e) for row in rows]
+        rows = []
+
+    try:
+        for index, row in enumerate(rows):
+            try:
+                smtp.send(build_message(row), row.recipient_email)
+            except smtplib.SMTPServerDisconnected as e:
+                retries.append(_failed(row, e))
+                try:
+                    # The rest of the batch gets a new connection
+                    smtp.open()
+                except (smtplib.SMTPException, socket.error) as e:
+                    retries.extend(_failed(left, e) for left in rows[index + 1:])
+                    break
+            except (smtplib.SMTPException, socket.error) as e:
+                retries.append(_failed(row, e))
+            else:
+                row.status = SENT
+                row.sent = datetime.datetime.utcnow()
+                sent += 1
+                log.info(f'Contact form email sent successfully to {row.recipient_email}')
+    finally:
+        smtp.close()
+        model.Session.commit()
+
+    retries = [next_attempt for next_attempt in retries if next_attempt is not None]
+    if retries and get_delivery() == DELIVERY_JOBS:
+        schedule_retry(min(retries))
+    return sent, len(ids) - sent
+
+
+def purge_sent():
+    """Delete the sent rows older than ``sent_retention_days``, return how many."""
+    if contact_outbox_table is None:
+        define_contact_outbox_table()
+    deleted = model.Session.execute(contact_outbox_table.delete().where(sa.and_(
+        contact_outbox_table.c.status == SENT,
+        contact_outbox_table.c.sent < datetime.datetime.utcnow() - get_sent_retention(),
+    ))).rowcount
+    model.Session.commit()
+    return deleted
+
+
+def deliver_pending(batch_size=None):
+    """Send every due email, batch after batch. Background job entry point."""
+    total_sent = total_failed = 0
+    while True:
+        sent, failed = deliver_batch(batch_size)
+        total_sent += sent
+        total_failed += failed
+        # Stop when the batch was empty or only failed, failures are not due yet
+        if not sent:
+            break
+    purge_sent()
+    return total_sent, total_failed
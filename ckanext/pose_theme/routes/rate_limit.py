@@ -0,0 +1,310 @@
+# encoding: utf-8
+"""Rate limit and duplicate suppression of contact form submissions.
+
+Every submission takes a token from the bucket of its user and, when
+``ip_rate_limit`` is enabled, from the bucket of its IP address. A bucket
+refills at a steady rate up to its burst size. A submission with the same
+content as one of the same user in the last ``dedup_window`` seconds is
+rejected. Both run before the validation, the DNS lookup, the recaptcha
+check and the email.
+
+The ``memory`` backend counts per worker process, the ``redis`` backend
+shares the buckets between all workers through the Redis of CKAN.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import Counter, namedtuple
+
+from ckan.plugins import toolkit
+
+log = logging.getLogger(__name__)
+
+BACKEND_MEMORY = 'memory'
+BACKEND_REDIS = 'redis'
+
+RATE_LIMITED_USER = 'rate_limited_user'
+RATE_LIMITED_IP = 'rate_limited_ip'
+DUPLICATE = 'duplicate'
+REJECTIONS = (RATE_LIMITED_USER, RATE_LIMITED_IP, DUPLICATE)
+
+# Fields that make two submissions the same
+CONTENT_FIELDS = ('name', 'email', 'organization', 'subject', 'url', 'content')
+
+# Buckets and claims kept by the memory backend before the idle ones are purged
+MAX_MEMORY_KEYS = 10000
+
+Limit = namedtuple('Limit', ['burst', 'per_second'])
+Rejection = namedtuple('Rejection', ['reason', 'retry_after'])
+
+
+def get_backend_name():
+    return toolkit.config.get('ckanext.pose_theme.contact.rate_limit_backend', BACKEND_MEMORY)
+
+
+def get_user_limit():
+    return Limit(
+        int(toolkit.config.get('ckanext.pose_theme.contact.rate_limit_burst', 5)),
+        float(toolkit.config.get('ckanext.pose_theme.contact.rate_limit_per_hour', 10)) / 3600,
+    )
+
+
+def is_ip_rate_limit_enabled():
+    # Off by default, behind a proxy every client shares the address of the
+    # proxy unless trusted_proxies is set
+    return toolkit.asbool(toolkit.config.get('ckanext.pose_theme.contact.ip_rate_limit', False))
+
+
+def get_trusted_proxies():
+    """Number of proxies in front of CKAN that set ``X-Forwarded-For``."""
+    return int(toolkit.config.get('ckanext.pose_theme.contact.trusted_proxies', 0))
+
+
+def get_client_ip(environ):
+    """IP address of the client of a request.
+
+    With ``trusted_proxies`` set to n, the n-th address from the end of
+    ``X-Forwarded-For`` is used, the way werkzeug's ``ProxyFix(x_for=n)``
+    does. Addresses before it were set by the client and can be forged.
+    """
+    trusted = get_trusted_proxies()
+    if trusted:
+        forwarded = [value.strip() for value in environ.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        if len(forwarded) >= trusted and forwarded[-trusted]:
+            return forwarded[-trusted]
+    return environ.get('REMOTE_ADDR')
+
+
+def get_ip_limit():
+    return Limit(
+        int(toolkit.config.get('ckanext.pose_theme.contact.ip_rate_limit_burst', 20)),
+        float(toolkit.config.get('ckanext.pose_theme.contact.ip_rate_limit_per_hour', 40)) / 3600,
+    )
+
+
+def get_dedup_window():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.dedup_window', 10 * 60))
+
+
+def content_hash(user_id, data_dict):
+    """Digest of the normalized content of a submission of ``user_id``."""
+    digest = hashlib.sha256(str(user_id).encode('utf-8'))
+    for field in CONTENT_FIELDS:
+        value = ' '.join(str(data_dict.get(field) or '').split()).lower()
+        digest.update(b'\0' + value.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class MemoryBackend(object):
+    """Buckets, dedup window and counters in the memory of this process.
+
+    :param clock: returns the current time in seconds, tests pass a fake one
+    :param max_keys: number of buckets, and of claims, above which the full
+        buckets and the expired claims are dropped
+    """
+
+    def __init__(self, clock=time.monotonic, max_keys=MAX_MEMORY_KEYS):
+        self.clock = clock
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._claims = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        """Take a token from the bucket ``key``, return the seconds to wait when it is empty."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (limit.burst, now, limit))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now, limit)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now, limit)
+                wait = (1 - tokens) / limit.per_second if limit.per_second else float('inf')
+            if len(self._buckets) > self.max_keys:
+                self._purge_full_buckets(now)
+            return wait
+
+    def _purge_full_buckets(self, now):
+        # A full bucket is the same as a missing one
+        for full in [key for key, (tokens, updated, limit) in self._buckets.items()
+                     if tokens + (now - updated) * limit.per_second >= limit.burst]:
+            del self._buckets[full]
+
+    def claim(self, key, window):
+        """Mark ``key`` as seen for ``window`` seconds, False when it already is."""
+        now = self.clock()
+        with self._lock:
+            if self._claims.get(key, now) > now:
+                return False
+            self._claims[key] = now + window
+            if len(self._claims) > self.max_keys:
+                for expired in [k for k, expires in self._claims.items() if expires <= now]:
+                    del self._claims[expired]
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._claims.pop(key, None)
+
+    def refund(self, key, limit):
+        """Give back the token taken from the bucket ``key``."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated, _ = self._buckets[key]
+                self._buckets[key] = (min(limit.burst, tokens + 1), updated, limit)
+
+    def increment(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def counters(self):
+        with self._lock:
+            return {name: self._counters[name] for name in REJECTIONS}
+
+
+# Token bucket updated atomically, with the clock of the Redis server so that
+# web servers with drifting clocks share the same buckets.
+TAKE_SCRIPT = """
+-- Writes after TIME need effects replication before Redis 5
+redis.replicate_commands()
+local burst = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+elseif rate > 0 then
+    wait = (1 - tokens) / rate
+else
+    wait = -1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+if rate > 0 then
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+end
+return tostring(wait)
+"""
+
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[1]), tokens + 1)))
+end
+"""
+
+
+class RedisBackend(object):
+    """Buckets, dedup window and counters shared by every worker of the site."""
+
+    def __init__(self, redis=None, prefix=None):
+        if redis is None:
+            from ckan.lib.redis import connect_to_redis
+            redis = connect_to_redis()
+        self.redis = redis
+        self.prefix = prefix or 'pose_theme:{}:contact:'.format(toolkit.config.get('ckan.site_id'))
+        self._take = redis.register_script(TAKE_SCRIPT)
+        self._refund = redis.register_script(REFUND_SCRIPT)
+
+    def take(self, key, limit):
+        wait = float(self._take(keys=[self.prefix + 'bucket:' + key], args=[limit.burst, limit.per_second]))
+        return float('inf') if wait < 0 else wait
+
+    def refund(self, key, limit):
+        self._refund(keys=[self.prefix + 'bucket:' + key], args=[limit.burst])
+
+    def claim(self, key, window):
+        return bool(self.redis.set(self.prefix + 'seen:' + key, 1, nx=True, ex=max(1, int(window))))
+
+    def release(self, key):
+        self.redis.delete(self.prefix + 'seen:' + key)
+
+    def increment(self, counter):
+        self.redis.hincrby(self.prefix + 'rejections', counter, 1)
+
+    def counters(self):
+        stored = self.redis.hgetall(self.prefix + 'rejections')
+        stored = {(name.decode() if isinstance(name, bytes) else name): int(count)
+                  for name, count in stored.items()}
+        return {name: stored.get(name, 0) for name in REJECTIONS}
+
+
+class SubmissionGuard(object):
+    """Rate limit and duplicate checks, ``ip_limit`` None disables the IP bucket."""
+
+    def __init__(self, backend, user_limit, ip_limit, dedup_window):
+        self.backend = backend
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.dedup_window = dedup_window
+
+    def _reject(self, reason, retry_after):
+        self.backend.increment(reason)
+        log.info(f'Contact form submission rejected: {reason}')
+        return Rejection(reason, None if math.isinf(retry_after) else int(math.ceil(retry_after)))
+
+    def check(self, user_id, remote_ip, data_dict):
+        """Return ``(rejection, digest)``, the digest is claimed when accepted.
+
+        Release the digest when the submission fails afterwards so that it
+        can be sent again with the same content.
+        """
+        # Duplicates first, they do not use up the tokens of the user
+        digest = content_hash(user_id or remote_ip, data_dict)
+        if not self.backend.claim(digest, self.dedup_window):
+            return self._reject(DUPLICATE, self.dedup_window), None
+
+        taken = []
+        for reason, key, limit in ((RATE_LIMITED_USER, user_id and 'user:{}'.format(user_id), self.user_limit),
+                                   (RATE_LIMITED_IP, remote_ip and 'ip:{}'.format(remote_ip), self.ip_limit)):
+            if not key or limit is None:
+                continue
+            wait = self.backend.take(key, limit)
+            if wait:
+                # A rejected submission does not use up the tokens of the other buckets
+                for taken_key, taken_limit in taken:
+                    self.backend.refund(taken_key, taken_limit)
+                self.backend.release(digest)
+                return self._reject(reason, wait), None
+            taken.append((key, limit))
+        return None, digest
+
+    def release(self, digest):
+        if digest:
+            self.backend.release(digest)
+
+    def counters(self):
+        return self.backend.counters()
+
+
+_guard = None
+_guard_lock = threading.Lock()
+
+
+def get_guard():
+    """Submission guard of this worker, built on first use."""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                backend = RedisBackend() if get_backend_name() == BACKEND_REDIS else MemoryBackend()
+                ip_limit = get_ip_limit() if is_ip_rate_limit_enabled() else None
+                _guard = SubmissionGuard(backend, get_user_limit(), ip_limit, get_dedup_window())
+    return _guard
+
+
+def set_guard(guard):
+    """Replace the guard of this worker, e.g. by one with a fake clock in tests."""
+    global _guard
+    with _guard_lock:
+        _guard = guard
+    return guard
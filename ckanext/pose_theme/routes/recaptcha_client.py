@@ -0,0 +1,163 @@
+# encoding: utf-8
+"""Verification of recaptcha tokens over a pooled, time-bounded connection.
+
+``ckanext.contact.recaptcha.check_recaptcha`` opens a new HTTPS connection
+without a timeout for every submission. The client of this module keeps its
+connections to the verification endpoint open between submissions, bounds
+the connect and read time and decides whether a submission is accepted when
+the endpoint can not be reached. Tokens already seen by the worker are
+rejected without a request, the endpoint rejects the ones used elsewhere.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ckan.plugins import toolkit
+from ckanext.contact.recaptcha import RecaptchaError
+from ckanext.pose_theme.routes import rate_limit
+
+log = logging.getLogger(__name__)
+
+VERIFY_URL = 'https://www.google.com/recaptcha/api/siteverify'
+# Tokens expire two minutes after they are issued
+REPLAY_TTL = 5 * 60
+
+
+def get_verify_url():
+    return toolkit.config.get('ckanext.pose_theme.contact.recaptcha_verify_url', VERIFY_URL)
+
+
+def get_timeouts():
+    return (
+        float(toolkit.config.get('ckanext.pose_theme.contact.recaptcha_connect_timeout', 2)),
+        float(toolkit.config.get('ckanext.pose_theme.contact.recaptcha_read_timeout', 3)),
+    )
+
+
+def is_fail_open():
+    return toolkit.asbool(toolkit.config.get('ckanext.pose_theme.contact.recaptcha_fail_open', False))
+
+
+def get_pool_size():
+    return int(toolkit.config.get('ckanext.pose_theme.contact.recaptcha_pool_size', 4))
+
+
+class ReplayCache(object):
+    """Hashes of the tokens seen in the last ``ttl`` seconds."""
+
+    def __init__(self, ttl=REPLAY_TTL, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        for key in [key for key, expires in self._seen.items() if expires < now]:
+            del self._seen[key]
+
+    def add(self, token):
+        """Remember ``token``, return False when it was already seen."""
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        now = time.monotonic()
+        with self._lock:
+            expires = self._seen.get(key)
+            if expires is not None and expires >= now:
+                return False
+            if len(self._seen) >= self.max_size:
+                self._purge(now)
+            self._seen[key] = now + self.ttl
+            return True
+
+
+class RecaptchaClient(object):
+    """Verifies tokens against ``verify_url`` over a pool of kept-alive connections.
+
+    :param fail_open: accept the submission when the endpoint can not be
+        reached or answers with an error, instead of rejecting it
+    """
+
+    def __init__(self, secret, verify_url=VERIFY_URL, timeouts=(2, 3), fail_open=False, pool_size=4):
+        self.secret = secret
+        self.verify_url = verify_url
+        self.timeouts = timeouts
+        self.fail_open = fail_open
+        self.replays = ReplayCache()
+        self.session = requests.Session()
+        # No retries, a second attempt would exceed the time budget
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _unavailable(self, error):
+        if self.fail_open:
+            log.warning(f'Recaptcha verification unavailable, accepting the submission: {error}')
+            return
+        log.warning(f'Recaptcha verification unavailable, rejecting the submission: {error}')
+        raise RecaptchaError(toolkit._('Recaptcha verification unavailable'))
+
+    def verify(self, token, expected_action, remote_ip=None):
+        """Raise RecaptchaError unless ``token`` is valid for ``expected_action``."""
+        if not token:
+            raise RecaptchaError('missing-input-response')
+        if not self.replays.add(token):
+            raise RecaptchaError('timeout-or-duplicate')
+
+        data = {'secret': self.secret, 'response': token}
+        if remote_ip:
+            data['remoteip'] = remote_ip
+        try:
+            response = self.session.post(self.verify_url, data=data, timeout=self.timeouts)
+            response.raise_for_status()
+            result = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return self._unavailable(e)
+
+        if not result.get('success'):
+            raise RecaptchaError(', '.join(result.get('error-codes', [])))
+        if expected_action != result.get('action'):
+            raise RecaptchaError(toolkit._('Action mismatch'))
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Recaptcha client of this worker, built on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RecaptchaClient(
+                    toolkit.config.get('ckanext.contact.recaptcha_v3_secret'), get_verify_url(),
+                    get_timeouts(), is_fail_open(), get_pool_size())
+    return _client
+
+
+def set_client(client):
+    """Replace the client of this worker, e.g. by one pointing at a local endpoint in tests."""
+    global _client
+    with _client_lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _client = client
+    return client
+
+
+def check_recaptcha(token, expected_action):
+    """Drop-in replacement of ``ckanext.contact.recaptcha.check_recaptcha``."""
+    key = toolkit.config.get('ckanext.contact.recaptcha_v3_key', False)
+    secret = toolkit.config.get('ckanext.contact.recaptcha_v3_secret', False)
+    if not key or not secret:
+        # recaptcha not enabled
+        return
+    # The address the rate limit counts, the client behind trusted proxies
+    remote_ip = rate_limit.get_client_ip(toolkit.request.environ)
+    get_client().verify(token, expected_action, remote_ip)
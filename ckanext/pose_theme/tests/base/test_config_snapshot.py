@@ -0,0 +1,37 @@
+import pytest
+
+from ckanext.pose_theme.base.config_snapshot import ConfigSnapshot, parse_config_value
+
+KEY = 'ckanext.pose_theme.test_snapshot'
+
+
+@pytest.mark.parametrize('raw, value', [
+    (None, None),
+    ('', None),
+    ("{'layout_type': 'custom'}", {'layout_type': 'custom'}),
+    ({'layout_type': 'custom'}, {'layout_type': 'custom'}),
+    ('not a literal', None),
+])
+def test_parse_config_value(raw, value):
+    assert parse_config_value(raw) == value
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config(KEY, "{'title': 'First'}")
+def test_snapshot_is_built_once_per_revision(ckan_config):
+    built = []
+
+    def build(value):
+        built.append(value)
+        return object()
+
+    snapshot = ConfigSnapshot(KEY, build)
+    first = snapshot.get()
+    assert snapshot.get() is first
+    assert built == [{'title': 'First'}]
+
+    ckan_config[KEY] = "{'title': 'Second'}"
+    assert snapshot.get() is not first
+    del ckan_config[KEY]
+    snapshot.get()
+    assert built == [{'title': 'First'}, {'title': 'Second'}, None]
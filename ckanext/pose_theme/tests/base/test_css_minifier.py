@@ -0,0 +1,52 @@
+import gzip
+
+from ckanext.pose_theme.base.css_minifier import compress, minify_css, serialize_rules
+
+
+def test_minify_css_removes_comments_and_whitespace():
+    css, errors = minify_css('/* c */ a , b > c:not(.x, .y) { margin : 0 auto ; width: calc(1px + 2%) }')
+    assert css == 'a,b>c:not(.x,.y){margin:0 auto;width:calc(1px + 2%)}'
+    assert errors == []
+
+
+def test_minify_css_keeps_descendant_pseudo_class_and_important():
+    css, _ = minify_css('a :hover { color: red !important }')
+    assert css == 'a :hover{color:red!important}'
+
+
+def test_minify_css_deduplicates_selectors():
+    css, _ = minify_css('a{color:red} a{margin:0} b{color:blue} a{color:red;margin:0} a{color:red} b{color:blue}')
+    assert css == 'a{color:red;margin:0}a{margin:0;color:red}b{color:blue}'
+
+
+def test_minify_css_minifies_nested_rules():
+    css, _ = minify_css('@media (max-width: 10px) { a { color: red } a { margin: 0 } }')
+    assert css == '@media (max-width:10px){a{color:red;margin:0}}'
+
+
+def test_minify_css_reports_syntax_errors():
+    css, errors = minify_css('a {color: red} b {: blue}')
+    assert css == 'a{color:red}'
+    assert len(errors) == 1
+    assert errors[0].startswith('Line 1')
+
+
+def test_serialize_rules():
+    css = serialize_rules([('body, .site-footer', {'background': '#07305c', 'color': '#ffffff'})])
+    assert css == 'body,.site-footer{background:#07305c;color:#ffffff}'
+
+
+def test_compress_is_deterministic():
+    data = b'a{color:red}' * 10
+    assert compress(data)['gzip'] == compress(data)['gzip']
+    assert gzip.decompress(compress(data)['gzip']) == data
+
+
+def test_minify_css_keeps_keyframes():
+    css, _ = minify_css('@keyframes spin { from { opacity: 0 } 50% { opacity: .5 } }')
+    assert css == '@keyframes spin{from{opacity:0}50%{opacity:.5}}'
+
+
+def test_minify_css_keeps_the_case_of_custom_properties():
+    css, _ = minify_css(':root { --Brand: red; --brand: blue; COLOR: var(--Brand) }')
+    assert css == ':root{--Brand:red;--brand:blue;color:var(--Brand)}'
@@ -0,0 +1,61 @@
+import os
+
+import yaml
+
+from ckanext.pose_theme.base.css_pruner import ASSETS_DIR, collect_used_names, prune_bundles, prune_css, rebase_urls
+
+
+def test_prune_css_removes_unused_selectors():
+    css = '.used .unused, .used:not(.unused){color:red} #unused{color:blue} div{margin:0}'
+    pruned, removed = prune_css(css, {'used'}, safelist=())
+    assert pruned == '.used:not(.unused){color:red}div{margin:0}'
+    assert removed == 2
+
+
+def test_prune_css_keeps_safelisted_and_at_rules():
+    css = ('.slick-slide{float:left}@media (min-width: 1px){.unused{color:red}.used{color:blue}}'
+           '@font-face{font-family:X}@keyframes spin{to{transform:rotate(1turn)}}')
+    pruned, removed = prune_css(css, {'used'}, safelist=('slick-*',))
+    assert pruned == ('.slick-slide{float:left}@media (min-width:1px){.used{color:blue}}'
+                      '@font-face{font-family:X}@keyframes spin{to{transform:rotate(1turn)}}')
+    assert removed == 1
+
+
+def test_collect_used_names(tmpdir):
+    tmpdir.join('page.html').write('<div class="hero layout-{{ n }}" id="main"></div>')
+    tmpdir.join('module.js').write('el.classList.add("is-open");')
+    tmpdir.join('style.css').write('.ignored{}')
+    names = collect_used_names([str(tmpdir)])
+    assert {'hero', 'layout-', 'main', 'is-open'} <= names
+    assert 'ignored' not in names
+
+
+def test_rebase_urls():
+    css = ('.a{background:url(../icons/a.svg)}.b{background:url("/img/b.jpg")}'
+           ".c{background:url('data:image/png;base64,AA==')}.d{background:url(https://example.com/d.png)}")
+    assert rebase_urls(css, 'css/style.css') == (
+        '.a{background:url(/icons/a.svg)}.b{background:url("/img/b.jpg")}'
+        ".c{background:url('data:image/png;base64,AA==')}.d{background:url(https://example.com/d.png)}")
+
+
+def test_prune_bundles_writes_the_lean_bundle(tmpdir):
+    output_dir = str(tmpdir.join('lean'))
+    report = prune_bundles(set(), (), output_dir)
+    results = report['pose_theme/main-css']
+    assert sorted(os.listdir(output_dir)) == ['style.lean.css', 'theme.lean.css', 'webassets.yml']
+    assert all(result.lean_size < result.size for result in results)
+
+    with open(os.path.join(output_dir, 'webassets.yml')) as webassets_file:
+        bundle = yaml.safe_load(webassets_file)['main-css']
+    # The stylesheets that are not pruned are used from the package
+    assert bundle['contents'] == [
+        os.path.join(ASSETS_DIR, 'vendor/spectrum/css/spectrum.css'),
+        'theme.lean.css',
+        'style.lean.css',
+        os.path.join(ASSETS_DIR, 'css/custom_properties.css'),
+    ]
+
+
+def test_prune_bundles_dry_run(tmpdir):
+    prune_bundles(set(), (), str(tmpdir.join('lean')), dry_run=True)
+    assert not tmpdir.join('lean').check()
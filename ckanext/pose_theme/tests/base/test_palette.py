@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from ckanext.pose_theme.base import palette
+
+
+def test_parse_color_keeps_full_precision():
+    assert palette.parse_color('#165cab') == (22 / 255.0, 92 / 255.0, 171 / 255.0)
+    assert palette.parse_color('White') == (1.0, 1.0, 1.0)
+    with pytest.raises(ValueError):
+        palette.parse_color('not-a-color')
+
+
+def test_contrast_matrix():
+    matrix = palette.contrast_matrix(['#ffffff', 'black', '#165cab'])
+    assert matrix.shape == (3, 3)
+    assert np.allclose(matrix, matrix.T)
+    assert np.allclose(np.diag(matrix), 1)
+    assert matrix[0, 1] == pytest.approx(21)
+
+
+def test_batch_contrast():
+    ratios = palette.batch_contrast([['#ffffff', '#000000'], ['#777777', '#777777']], [(0, 1)])
+    assert ratios.shape == (2, 1)
+    assert ratios[:, 0] == pytest.approx([21, 1])
+
+
+def test_nearest_passing_color():
+    suggestion = palette.nearest_passing_color('#eeeeee', '#ffffff', palette.AA)
+    assert palette.contrast_matrix([suggestion, '#ffffff'])[0, 1] >= palette.AA
+    assert palette.nearest_passing_color('#000000', '#ffffff') == '#000000'
+
+
+def test_failing_pairs():
+    colors = {'background': '#ffffff', 'text': '#eeeeee', 'link': '#000000', 'empty': ''}
+    failing = palette.failing_pairs(
+        colors, [('background', 'text'), ('background', 'link'), ('background', 'empty')])
+    assert [failure['pair'] for failure in failing] == [['background', 'text']]
+    assert failing[0]['ratio'] == 1.16
+    assert failing[0]['suggestion'].startswith('#')
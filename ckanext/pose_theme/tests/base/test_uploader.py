@@ -0,0 +1,38 @@
+import hashlib
+import io
+import os
+import time
+
+import ckanext.pose_theme.base.uploader as uploader
+from ckanext.pose_theme.base.uploader import file_digest, is_content_addressed
+
+
+def test_file_digest_rewinds_file():
+    fileobj = io.BytesIO(b'hero image' * 10000)
+    assert file_digest(fileobj) == hashlib.sha256(b'hero image' * 10000).hexdigest()
+    assert fileobj.tell() == 0
+
+
+def test_is_content_addressed():
+    digest = hashlib.sha256(b'hero image').hexdigest()
+    assert is_content_addressed(digest + '.png')
+    assert is_content_addressed('/uploads/hero/' + digest + '.jpg')
+    assert is_content_addressed(digest)
+    assert not is_content_addressed('2023-01-01-120000.000000hero.png')
+    assert not is_content_addressed(digest + '.png~1234')
+    assert not is_content_addressed(None)
+
+
+def test_unreferenced_uploads_have_a_minimum_age(monkeypatch, tmp_path):
+    directory = tmp_path / 'storage' / 'uploads' / 'hero'
+    directory.mkdir(parents=True)
+    old, new, used = (hashlib.sha256(name).hexdigest() + '.png' for name in (b'old', b'new', b'used'))
+    for name in (old, new, used):
+        (directory / name).write_bytes(b'image')
+    os.utime(str(directory / old), (time.time() - 7200, time.time() - 7200))
+
+    monkeypatch.setattr(uploader.uploader, 'get_storage_path', lambda: str(tmp_path))
+    monkeypatch.setattr(uploader, 'content_addressed_upload_types', lambda: ['hero'])
+    monkeypatch.setattr(uploader, 'referenced_uploads', lambda: {used})
+    assert sorted(uploader.unreferenced_uploads()) == sorted([str(directory / old), str(directory / new)])
+    assert list(uploader.unreferenced_uploads(min_age=3600)) == [str(directory / old)]
@@ -0,0 +1,34 @@
+import pytest
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+from ckan.plugins.toolkit import NotAuthorized, ValidationError
+
+
+@pytest.mark.usefixtures('clean_db', 'with_request_context')
+def test_palette_check_returns_failing_pairs():
+    sysadmin = factories.Sysadmin()
+    result = helpers.call_action(
+        'pose_theme_palette_check', context={'user': sysadmin['name'], 'ignore_auth': False},
+        colors={'account-header-background-color': '#ffffff'})
+
+    assert result['minimum_ratio'] == 3.0
+    assert [failure['pair'] for failure in result['failing']] == [
+        ['account-header-background-color', 'account-header-text-color']
+    ]
+    assert result['failing'][0]['suggestion']
+
+
+@pytest.mark.usefixtures('clean_db', 'with_request_context')
+def test_palette_check_validates_colors():
+    with pytest.raises(ValidationError):
+        helpers.call_action('pose_theme_palette_check', colors={'footer-text-color': 'nope'})
+    with pytest.raises(ValidationError):
+        helpers.call_action('pose_theme_palette_check', level='A')
+
+
+@pytest.mark.usefixtures('clean_db', 'with_request_context')
+def test_palette_check_is_sysadmin_only():
+    user = factories.User()
+    with pytest.raises(NotAuthorized):
+        helpers.call_action('pose_theme_palette_check',
+                            context={'user': user['name'], 'ignore_auth': False})
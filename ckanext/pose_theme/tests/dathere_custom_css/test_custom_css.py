@@ -1,5 +1,9 @@
+import re
+
 import pytest
+import ckan.tests.helpers as helpers
 
+from ckanext.pose_theme.pose_custom_css.plugin import get_custom_css_url
 from ckanext.pose_theme.tests.helpers import do_get, do_post
 
 CUSTOM_CSS_URL = "/ckan-admin/custom_css"
@@ -20,29 +24,40 @@ DEFAULT_DATA = {
 }
 
 DEFAULT_CUSTOM_CSS = (
-    '.account-masthead {background: #165cab}',
-    '.account-masthead .account ul li a:hover {background: #1f76d8}',
-    '.account-masthead .account ul li a {color: #ffffff}',
-    '.masthead {background: #ffffff}',
+    '.account-masthead{background:#165cab}',
+    '.account-masthead .account ul li a:hover{background:#1f76d8}',
+    '.account-masthead .account ul li a{color:#ffffff}',
+    '.masthead{background:#ffffff}',
     '.masthead .navigation .nav-pills li a:hover,.masthead .navigation .nav-pills li.active a,'
-    '.navbar-toggle {background-color: #1f76d8}',
-    '.navbar .nav>li>a,.masthead .nav>li>a,.navbar hgroup>h1>a,.navbar hgroup>h2 {color: #07305c}',
-    '.module-heading {background: #165cab}',
-    '.module-heading,.module-heading .action {color: #ffffff}',
-    'body, .site-footer, .footer-column-form .cke_reset {background: #07305c}',
-    '.site-footer a,.site-footer a:hover,.footer-column-form .cke_reset a {color: #ffffff}',
-    '.site-footer,.site-footer label,.site-footer small,.footer-column-form .cke_reset {color: #ffffff}'
+    '.navbar-toggle{background-color:#1f76d8}',
+    '.navbar .nav>li>a,.masthead .nav>li>a,.navbar hgroup>h1>a,.navbar hgroup>h2{color:#07305c}',
+    '.module-heading{background:#165cab}',
+    '.module-heading,.module-heading .action{color:#ffffff}',
+    'body,.site-footer,.footer-column-form .cke_reset{background:#07305c}',
+    '.site-footer a,.site-footer a:hover,.footer-column-form .cke_reset a{color:#ffffff}',
+    '.site-footer,.site-footer label,.site-footer small,.footer-column-form .cke_reset{color:#ffffff}'
 )
 
 
-def check_custom_css_page_html(response, expected_form_data, expected_css_data, errors=()):
+def get_page_css(app, response):
+    """Return the custom CSS of a page, linked as a file or inlined."""
+    match = re.search(r'<link rel="stylesheet" href="([^"]*/pose_custom_css/[0-9a-f]{32}\.css)"', response.body)
+    if not match:
+        return response.body
+    css_response = app.get(match.group(1))
+    assert 'immutable' in css_response.headers['Cache-Control']
+    return css_response.body
+
+
+def check_custom_css_page_html(app, response, expected_form_data, expected_css_data, errors=()):
     assert response, 'Response is empty.'
+    page_css = get_page_css(app, response)
     assert len(expected_form_data.keys()) == response.body.count('pose-theme-color-picker')
     for key, value in expected_form_data.items():
         assert 'name="{0}" id="{0}" value="{1}"'.format(
             key, value) in response.body, 'Missed form field for "{}".'.format(key)
     for line in expected_css_data:
-        assert line in response.body, 'CSS line "{}" missed in result html.'.format(line)
+        assert line in page_css, 'CSS line "{}" missed in result html.'.format(line)
     if errors:
         for error_message in errors:
             assert error_message in response.body, 'Error message "{}" not in HTML.'.format(error_message)
@@ -59,21 +74,21 @@ def test_get_custom_css_page_with_not_sysadmin_user(app):
 @pytest.mark.usefixtures("clean_db", "with_request_context")
 def test_get_custom_css_page_with_default_data(app):
     response = do_get(app, CUSTOM_CSS_URL, is_sysadmin=True)
-    check_custom_css_page_html(response, expected_form_data=DEFAULT_DATA.copy(), expected_css_data=DEFAULT_CUSTOM_CSS)
+    check_custom_css_page_html(app, response, expected_form_data=DEFAULT_DATA.copy(), expected_css_data=DEFAULT_CUSTOM_CSS)
 
 
 @pytest.mark.usefixtures("clean_db", "with_request_context")
 def test_post_custom_css_page_with_changed_color(app):
     data = DEFAULT_DATA.copy()
     data['account-header-background-color'] = '#07305c'
-    unexpected_custom_css = '.account-masthead {background: #165cab}'
+    unexpected_custom_css = '.account-masthead{background:#165cab}'
     expected_custom_css = list(DEFAULT_CUSTOM_CSS)
     expected_custom_css.remove(unexpected_custom_css)
-    expected_custom_css.append('.account-masthead {background: #07305c}')
+    expected_custom_css.append('.account-masthead{background:#07305c}')
     response = do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=data)
 
-    check_custom_css_page_html(response, expected_form_data=data, expected_css_data=expected_custom_css)
-    assert unexpected_custom_css not in response
+    check_custom_css_page_html(app, response, expected_form_data=data, expected_css_data=expected_custom_css)
+    assert unexpected_custom_css not in get_page_css(app, response)
 
 
 @pytest.mark.usefixtures("clean_db", "with_request_context")
@@ -81,7 +96,7 @@ def test_post_custom_css_page_with_changed_color_respond_with_contrast_connected
     data = DEFAULT_DATA.copy()
     data['account-header-background-color'] = '#ffffff'
 
-    unexpected_custom_css = '.account-masthead {background: #ffffff}'
+    unexpected_custom_css = '.account-masthead{background:#ffffff}'
 
     expected_custom_css = list(DEFAULT_CUSTOM_CSS)
 
@@ -89,23 +104,64 @@ def test_post_custom_css_page_with_changed_color_respond_with_contrast_connected
     messages = [
         'Account Header Background Color and Account Header Text Color: Contrast ratio is not high enough.'
     ]
-    check_custom_css_page_html(response, expected_form_data=data, expected_css_data=expected_custom_css,
+    check_custom_css_page_html(app, response, expected_form_data=data, expected_css_data=expected_custom_css,
                                errors=messages)
-    assert unexpected_custom_css not in response
+    assert unexpected_custom_css not in get_page_css(app, response)
 
 
 @pytest.mark.usefixtures("clean_db", "with_request_context")
 def test_reset_changed_custom_css(app):
     data = DEFAULT_DATA.copy()
     data['account-header-background-color'] = '#07305c'
-    unexpected_custom_css = '.account-masthead {background: #165cab}'
+    unexpected_custom_css = '.account-masthead{background:#165cab}'
     expected_custom_css = list(DEFAULT_CUSTOM_CSS)
     expected_custom_css.remove(unexpected_custom_css)
-    expected_custom_css.append('.account-masthead {background: #07305c}')
+    expected_custom_css.append('.account-masthead{background:#07305c}')
     response = do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=data)
-    assert unexpected_custom_css not in response
+    assert unexpected_custom_css not in get_page_css(app, response)
 
     reset_response = do_post(app, RESET_CUSTOM_CSS_URL, data={})
-    check_custom_css_page_html(reset_response,
+    check_custom_css_page_html(app, reset_response,
                                expected_form_data=DEFAULT_DATA.copy(),
                                expected_css_data=DEFAULT_CUSTOM_CSS)
+
+
+@pytest.mark.usefixtures("clean_db", "with_request_context")
+def test_post_custom_css_page_minifies_site_custom_css(app):
+    data = DEFAULT_DATA.copy()
+    data['ckan.site_custom_css'] = '/* links */\na , b {\n    color : red ;\n}\na,b {color: red}'
+    response = do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=data)
+
+    page_css = get_page_css(app, response)
+    assert page_css.count('a,b{color:red}') == 1
+    assert '/* links */' not in page_css
+    assert 'id="custom-css-stats"' in response.body
+
+
+@pytest.mark.usefixtures("clean_db", "with_request_context")
+def test_post_custom_css_page_rejects_invalid_site_custom_css(app):
+    data = DEFAULT_DATA.copy()
+    data['ckan.site_custom_css'] = 'a {color: red} b {: blue}'
+    response = do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=data)
+
+    assert 'Expected &lt;ident&gt; for declaration name' in response.body
+    assert 'color:red' not in get_page_css(app, do_get(app, CUSTOM_CSS_URL, is_sysadmin=True))
+
+
+@pytest.mark.usefixtures("clean_db", "with_request_context")
+def test_site_custom_css_changed_outside_the_page_is_published(app):
+    do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=DEFAULT_DATA.copy())
+
+    # E.g. the config page of CKAN core
+    helpers.call_action('config_option_update', {'ignore_auth': True}, **{'ckan.site_custom_css': 'a {color: blue}'})
+    page_css = get_page_css(app, app.get('/'))
+    assert 'a{color:blue}' in page_css
+    assert DEFAULT_CUSTOM_CSS[0] in page_css
+
+
+@pytest.mark.usefixtures("clean_db", "with_request_context")
+def test_site_custom_css_is_inlined_until_published(app, ckan_config, monkeypatch):
+    do_post(app, CUSTOM_CSS_URL, is_sysadmin=True, data=DEFAULT_DATA.copy())
+
+    monkeypatch.setitem(ckan_config, 'ckan.site_custom_css', 'a {color: green}')
+    assert get_custom_css_url() is None
@@ -0,0 +1,46 @@
+import pytest
+from ckan.plugins.toolkit import ValidationError
+
+from ckanext.pose_theme.pose_custom_css.processor import (
+    AccountHeaderBackGroundColor, custom_style_processor
+)
+
+
+def test_parser_does_not_keep_parsed_value():
+    parser = AccountHeaderBackGroundColor()
+    parsed = parser.parse_form_data({'account-header-background-color': '#000000'})
+    assert parsed.value == '#000000'
+    assert parser.parse_form_data({}).value == '#165cab'
+    with pytest.raises(AttributeError):
+        parser.value = '#000000'
+
+
+def test_get_custom_css_is_memoized_and_returns_copies():
+    data = {'account-header-background-color': '#07305c'}
+    raw_css, css_metadata = custom_style_processor.get_custom_css(data)
+    css_metadata['account-header-background-color']['value'] = 'changed'
+
+    cached_css, cached_metadata = custom_style_processor.get_custom_css(dict(data))
+    assert cached_css == raw_css
+    assert cached_metadata['account-header-background-color']['value'] == '#07305c'
+
+
+def test_check_contrast_only_depends_on_its_input():
+    with pytest.raises(ValidationError):
+        custom_style_processor.check_contrast({'account-header-background-color': '#ffffff'})
+    custom_style_processor.check_contrast({})
+
+
+def test_get_custom_css_in_variables_mode():
+    raw_css, _ = custom_style_processor.get_custom_css(
+        {'account-header-background-color': '#07305c'}, mode='variables')
+    assert raw_css.startswith(':root{--pose-account-bg:#07305c;--pose-account-hover-bg:#1f76d8;')
+    assert raw_css.count('{') == 1
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.custom_css_mode', 'variables')
+def test_get_custom_css_uses_configured_mode():
+    raw_css, _ = custom_style_processor.get_custom_css({})
+    assert raw_css.startswith(':root{')
+    assert '.account-masthead' not in raw_css
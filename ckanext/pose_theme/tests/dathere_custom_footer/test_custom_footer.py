@@ -100,3 +100,21 @@ def test_reset_custom_footer_form_after_some_footer_modification(app):
         'content_2': ''
     }
     check_custom_footer_page_html(reset_response, **expected_data)
+
+
+@pytest.mark.usefixtures("clean_db", "with_request_context")
+def test_page_footer_shows_saved_footer(app):
+    data = {
+        'layout_type': 'custom',
+        'content_0': '<p class="saved-footer">First revision</p>',
+        'content_1': '',
+        'content_2': '',
+    }
+    do_post(app, CUSTOM_FOOTER_URL, data, is_sysadmin=True)
+    assert 'First revision' in app.get('/dataset').body
+
+    data['content_0'] = '<p class="saved-footer">Second revision</p>'
+    do_post(app, CUSTOM_FOOTER_URL, data, is_sysadmin=True)
+    body = app.get('/dataset').body
+    assert 'Second revision' in body
+    assert 'First revision' not in body
@@ -0,0 +1,80 @@
+import pytest
+
+from ckanext.pose_theme.pose_custom_footer import fragment
+from ckanext.pose_theme.pose_custom_footer.constants import CONFIG_KEY
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    calls = []
+
+    def render(layout_type):
+        calls.append(layout_type)
+        return '<footer>{} {}</footer>'.format(layout_type, len(calls))
+
+    monkeypatch.setattr(fragment, '_render', render)
+    monkeypatch.setattr(fragment, '_fragments', (object(), {}))
+    return calls
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config(CONFIG_KEY, str({'layout_type': 'custom', 'content_0': '<b>Saved</b>'}))
+def test_footer_snapshot_serves_markup_of_current_revision(ckan_config):
+    snapshot = fragment.get_footer_snapshot()
+    assert snapshot.get('layout_type') == 'custom'
+    assert snapshot.get('content_0').__html__() == '<b>Saved</b>'
+    assert snapshot.get('content_1') == ''
+    assert fragment.get_footer_snapshot() is snapshot
+
+    ckan_config[CONFIG_KEY] = str({'layout_type': 'default', 'content_0': '<i>New</i>'})
+    assert fragment.get_footer_snapshot().get('content_0') == '<i>New</i>'
+
+
+@pytest.mark.usefixtures('ckan_config', 'with_request_context')
+@pytest.mark.ckan_config(CONFIG_KEY, str({'layout_type': 'custom', 'content_0': 'First'}))
+def test_footer_is_rendered_once_per_revision(ckan_config, rendered):
+    assert fragment.render_footer() == '<footer>custom 1</footer>'
+    assert fragment.render_footer() == '<footer>custom 1</footer>'
+    assert rendered == ['custom']
+
+    # Saved by another worker
+    ckan_config[CONFIG_KEY] = str({'layout_type': 'default', 'content_0': 'Second'})
+    assert fragment.render_footer() == '<footer>default 2</footer>'
+    assert rendered == ['custom', 'default']
+
+
+@pytest.mark.usefixtures('ckan_config', 'with_request_context')
+@pytest.mark.ckan_config(CONFIG_KEY, str({'layout_type': 'custom', 'content_0': 'First'}))
+def test_footer_of_an_older_revision_is_not_served(ckan_config, monkeypatch):
+    first = ckan_config[CONFIG_KEY]
+    second = str({'layout_type': 'custom', 'content_0': 'Second'})
+
+    def render(layout_type):
+        config = ckan_config[CONFIG_KEY]
+        if config == first:
+            # Saved by another worker, and rendered by another thread, before this render ends
+            ckan_config[CONFIG_KEY] = second
+            assert fragment.render_footer() == second
+        return config
+
+    monkeypatch.setattr(fragment, '_render', render)
+    monkeypatch.setattr(fragment, '_fragments', (object(), {}))
+    assert fragment.render_footer() == first
+    assert fragment.render_footer() == second
+
+
+@pytest.mark.usefixtures('ckan_config', 'with_request_context')
+def test_footer_is_rendered_again_when_the_site_title_changes(ckan_config, monkeypatch, rendered):
+    fragment.render_footer()
+    monkeypatch.setitem(ckan_config, 'ckan.site_title', 'Renamed catalog')
+    fragment.render_footer()
+    fragment.render_footer()
+    assert rendered == ['default', 'default']
+
+
+@pytest.mark.usefixtures('ckan_config', 'with_request_context')
+@pytest.mark.ckan_config(fragment.FOOTER_CACHE, 'false')
+def test_footer_cache_can_be_disabled(rendered):
+    fragment.render_footer()
+    fragment.render_footer()
+    assert rendered == ['default', 'default']
@@ -0,0 +1,69 @@
+import ast
+import timeit
+
+import bleach
+import pytest
+from ckan.lib.helpers import literal
+
+from ckanext.pose_theme.pose_custom_footer.constants import (
+    CONFIG_KEY, ALLOWED_ATTRIBUTES, ALLOWED_CSS_PROPERTIES, ALLOWED_TAGS_SET
+)
+from ckanext.pose_theme.pose_custom_footer.fragment import get_footer_snapshot
+from ckanext.pose_theme.pose_custom_footer.sanitizer import clean_footer, clean_html
+
+COLUMN = ('<p class="lead">Contact <a href="https://example.com" onclick="steal()">us</a></p>'
+          '<img src="/logo.png" style="width: 20px; position: fixed"><script>alert(1)</script>')
+
+
+def test_clean_html_removes_forbidden_markup():
+    assert clean_html(COLUMN) == (
+        '<p class="lead">Contact <a href="https://example.com">us</a></p>'
+        '<img src="/logo.png" style="width: 20px;">&lt;script&gt;alert(1)&lt;/script&gt;'
+    )
+    assert clean_html(None) == ''
+
+
+def test_clean_footer_sanitizes_every_column():
+    custom_footer = clean_footer({'layout_type': 'custom', 'content_0': COLUMN, 'content_3': '<b>4</b>'})
+    assert custom_footer['layout_type'] == 'custom'
+    assert custom_footer['content_0'] == clean_html(COLUMN)
+    assert custom_footer['content_1'] == ''
+    assert custom_footer['content_3'] == '<b>4</b>'
+
+
+@pytest.mark.benchmark
+@pytest.mark.usefixtures('ckan_config')
+def test_large_footer_benchmark(ckan_config, monkeypatch, record_property):
+    """Sanitizing and serving a large footer, against the former cleaner and parse per call.
+
+    Deselected by default, run with ``pytest -m benchmark``. The timings are
+    recorded as properties of the test, e.g. in the ``--junitxml`` report.
+    """
+    data = {'layout_type': 'custom'}
+    for index in range(4):
+        data['content_{}'.format(index)] = COLUMN * 500
+
+    def per_call():
+        from bleach.css_sanitizer import CSSSanitizer
+        for index in range(4):
+            css_sanitizer = CSSSanitizer(allowed_css_properties=ALLOWED_CSS_PROPERTIES)
+            bleach.clean(data['content_{}'.format(index)], tags=ALLOWED_TAGS_SET,
+                         attributes=ALLOWED_ATTRIBUTES, css_sanitizer=css_sanitizer)
+
+    record_property('footer_bytes', sum(len(value) for value in data.values()))
+    record_property('shared_cleaner_ms', min(timeit.repeat(lambda: clean_footer(data), number=1, repeat=3)) * 1000)
+    record_property('cleaner_per_call_ms', min(timeit.repeat(per_call, number=1, repeat=3)) * 1000)
+    assert '<script>' not in ''.join(clean_footer(data).values())
+
+    monkeypatch.setitem(ckan_config, CONFIG_KEY, str(clean_footer(data)))
+
+    def parse_per_call():
+        for index in range(4):
+            literal(ast.literal_eval(ckan_config[CONFIG_KEY])['content_{}'.format(index)])
+
+    def snapshot():
+        for index in range(4):
+            get_footer_snapshot().get('content_{}'.format(index))
+
+    record_property('parse_per_call_ms', min(timeit.repeat(parse_per_call, number=10, repeat=3)) * 100)
+    record_property('snapshot_ms', min(timeit.repeat(snapshot, number=10, repeat=3)) * 100)
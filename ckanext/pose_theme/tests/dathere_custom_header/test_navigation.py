@@ -0,0 +1,45 @@
+import pytest
+
+from ckanext.pose_theme.pose_custom_header.navigation import HeaderSnapshot, get_header_snapshot
+
+HEADER = {
+    'layout_type': 'compressed',
+    'links': [
+        {'position': '10', 'title': 'About', 'url': '/about'},
+        {'position': '2', 'title': 'Datasets & <more>', 'url': '/dataset'},
+        {'position': '3', 'title': 'Home', 'url': '/'},
+        {'position': '4', 'title': 'Example', 'url': 'https://example.com/dataset'},
+    ]
+}
+
+
+def test_snapshot_sorts_and_escapes_links():
+    snapshot = HeaderSnapshot(HEADER)
+    assert snapshot.layout_type == 'compressed'
+    assert snapshot.render('/nowhere') == (
+        '<li><a href="/dataset">Datasets &amp; &lt;more&gt;</a></li>'
+        '<li><a href="/">Home</a></li>'
+        '<li><a href="https://example.com/dataset">Example</a></li>'
+        '<li><a href="/about">About</a></li>'
+    )
+
+
+@pytest.mark.parametrize('path, active', [
+    ('/dataset', 0),
+    ('/dataset/', 0),
+    ('/dataset/my-dataset/resource/1', 0),
+    ('/datasets', None),
+    ('/', 1),
+    ('/about', 3),
+    ('/organization', None),
+])
+def test_snapshot_marks_longest_path_prefix_active(path, active):
+    assert HeaderSnapshot(HEADER).active_index(path) == active
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.custom_header.data', str(HEADER))
+def test_snapshot_is_compiled_once_per_revision():
+    snapshot = get_header_snapshot()
+    assert get_header_snapshot() is snapshot
+    assert snapshot.layout_type == 'compressed'
@@ -0,0 +1,106 @@
+import datetime
+
+import pytest
+import ckan.model as model
+
+from ckanext.pose_theme.pose_custom_heroslider import db
+
+
+def _slide():
+    if db.hero_slide_table is None:
+        db.define_hero_slide_table()
+    now = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    return db.Hero_Slide(
+        id='slide-1', position=2, image_url='hero.jpg', text=None,
+        width=1600, height=400, variants={'webp': 'hero.webp'}, created=now, modified=now
+    )
+
+
+def test_compiled_dictizer_matches_generic_dictize():
+    slide = _slide()
+    fields = [column.name for column in db.hero_slide_table.c]
+    generic_context, compiled_context = {}, {}
+
+    expected = db._generic_dictize(slide, fields, generic_context, extra='value')
+    result = db.make_dictizer(db.Hero_Slide)(slide, compiled_context, extra='value')
+
+    assert result == expected
+    assert result['created'] == '2024-01-02T03:04:05'
+    assert result['text'] is None
+    assert compiled_context == generic_context
+
+
+def test_dictizer_is_compiled_once_per_class():
+    _slide()
+    assert db.make_dictizer(db.Hero_Slide) is db.make_dictizer(db.Hero_Slide)
+
+
+@pytest.fixture
+def hero_slide_table():
+    db.init()
+    yield
+    model.Session.rollback()
+    model.Session.query(db.Hero_Slide).delete()
+    model.Session.commit()
+
+
+@pytest.fixture
+def legacy_table():
+    db.legacy_hero_slider_table.create(bind=model.meta.engine, checkfirst=True)
+    yield db.legacy_hero_slider_table
+    db.legacy_hero_slider_table.drop(bind=model.meta.engine)
+
+
+def _stored():
+    return [(slide.position, slide.image_url, slide.text) for slide in db.Hero_Slide.get_slides()]
+
+
+@pytest.mark.usefixtures('clean_db', 'hero_slide_table')
+def test_replace_slides_keeps_ids_and_order():
+    first, second = db.Hero_Slide.replace_slides([
+        {'image_url': 'a.jpg', 'text': 'A'},
+        {'image_url': 'b.jpg', 'text': None},
+    ])
+    model.Session.commit()
+    assert _stored() == [(0, 'a.jpg', 'A'), (1, 'b.jpg', '')]
+
+    # Swap the slides, drop none and add one
+    db.Hero_Slide.replace_slides([
+        {'id': second['id'], 'image_url': 'b.jpg', 'text': 'B'},
+        {'id': first['id'], 'image_url': 'a.jpg', 'text': 'A'},
+        {'image_url': 'c.jpg', 'text': 'C', 'width': 1600, 'height': 400},
+    ])
+    model.Session.commit()
+    slides = db.Hero_Slide.get_slides()
+    assert [slide.id for slide in slides[:2]] == [second['id'], first['id']]
+    assert _stored() == [(0, 'b.jpg', 'B'), (1, 'a.jpg', 'A'), (2, 'c.jpg', 'C')]
+    assert (slides[2].width, slides[2].height) == (1600, 400)
+
+    db.Hero_Slide.replace_slides([{'id': first['id'], 'image_url': 'a.jpg'}])
+    model.Session.commit()
+    assert _stored() == [(0, 'a.jpg', '')]
+
+    db.Hero_Slide.replace_slides([])
+    model.Session.commit()
+    assert _stored() == []
+
+
+@pytest.mark.usefixtures('clean_db', 'hero_slide_table')
+def test_migrate_legacy_hero_slider(legacy_table):
+    assert db.migrate_legacy_hero_slider() == 0
+
+    model.Session.execute(legacy_table.insert().values(
+        id='old', image_url_1='old.jpg', hero_text_1='Old', modified=datetime.datetime(2020, 1, 1)))
+    model.Session.execute(legacy_table.insert().values(
+        id='new', image_url_1='one.jpg', hero_text_1='One', image_url_3='three.jpg',
+        modified=datetime.datetime(2021, 1, 1)))
+    model.Session.commit()
+
+    assert db.migrate_legacy_hero_slider() == 2
+    assert _stored() == [(0, 'one.jpg', 'One'), (1, 'three.jpg', '')]
+
+    # The slides of hero_slide are never replaced again
+    db.Hero_Slide.replace_slides([{'image_url': 'edited.jpg'}])
+    model.Session.commit()
+    assert db.migrate_legacy_hero_slider() == 0
+    assert _stored() == [(0, 'edited.jpg', '')]
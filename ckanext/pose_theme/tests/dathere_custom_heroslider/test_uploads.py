@@ -0,0 +1,90 @@
+import io
+import os
+import struct
+
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from ckanext.pose_theme.pose_custom_heroslider import uploads
+
+PNG = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">II", 1600, 400) + b"\x08\x02"
+GIF = b"GIF89a" + struct.pack("<HH", 320, 200) + b"\x00" * 16
+# An APP0 segment before the start of frame
+JPEG = (
+    b"\xff\xd8"
+    + b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + b"\x00" * 9
+    + b"\xff\xc0" + struct.pack(">HBHH", 17, 8, 480, 640) + b"\x00" * 12
+)
+
+
+@pytest.mark.parametrize("content, size", [
+    (PNG, (1600, 400)),
+    (GIF, (320, 200)),
+    (JPEG, (640, 480)),
+    (b"<svg xmlns='http://www.w3.org/2000/svg'/>", None),
+    (b"\xff\xd8\xff\xe0\x00", None),
+])
+def test_get_image_size(tmp_path, content, size):
+    path = tmp_path / "image"
+    path.write_bytes(content)
+    assert uploads.get_image_size(str(path)) == size
+
+
+def test_get_image_size_of_missing_file(tmp_path):
+    assert uploads.get_image_size(str(tmp_path / "missing")) is None
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_validate_upload_reads_the_content():
+    upload = FileStorage(io.BytesIO(PNG), filename="hero.txt", content_type="text/plain")
+    assert uploads.validate_upload(upload) is None
+    assert upload.stream.tell() == 0
+
+    upload = FileStorage(io.BytesIO(b"<script>"), filename="hero.png", content_type="image/png")
+    assert "hero.png" in uploads.validate_upload(upload)
+
+
+def test_limited_input():
+    stream = uploads.LimitedInput(io.BytesIO(b"line\n" * 4), 12)
+    assert stream.read(5) == b"line\n"
+    assert stream.readline() == b"line\n"
+    with pytest.raises(RequestEntityTooLarge):
+        stream.read()
+
+
+class FakeUpload(object):
+    def __init__(self, directory, name, content, error=None):
+        self.filename = name
+        self.filepath = os.path.join(directory, name)
+        self.content = content
+        self.error = error
+
+    def upload(self, max_size):
+        if self.error:
+            raise self.error
+        with open(self.filepath, "wb") as f:
+            f.write(self.content)
+
+
+@pytest.mark.usefixtures("ckan_config")
+def test_process_uploads_stores_the_image_sizes(tmp_path):
+    slides = [{}, {}]
+    uploads.process_uploads([
+        (slides[0], FakeUpload(str(tmp_path), "a.png", PNG)),
+        (slides[1], FakeUpload(str(tmp_path), "b.gif", GIF)),
+    ], 2)
+    assert slides == [{"width": 1600, "height": 400}, {"width": 320, "height": 200}]
+
+
+@pytest.mark.usefixtures("ckan_config")
+def test_failed_upload_removes_the_files_of_the_request(tmp_path):
+    (tmp_path / "shared.png").write_bytes(PNG)
+    with pytest.raises(ValueError):
+        uploads.process_uploads([
+            ({}, FakeUpload(str(tmp_path), "new.png", PNG)),
+            ({}, FakeUpload(str(tmp_path), "big.png", PNG, ValueError("too large"))),
+            ({}, FakeUpload(str(tmp_path), "shared.png", PNG)),
+        ], 2)
+    # Files stored before the request are kept
+    assert sorted(os.listdir(str(tmp_path))) == ["shared.png"]
@@ -0,0 +1,65 @@
+import pytest
+import ckan.tests.helpers as helpers
+from werkzeug.test import Client
+
+from ckanext.pose_theme.pose_custom_homepage.constants import CUSTOM_STYLE
+from ckanext.pose_theme.pose_custom_homepage.critical_css import (
+    build_critical_css, defer_stylesheets, extract_critical_css
+)
+
+HTML = '''
+<html><body>
+  <div class="account-masthead"><a class="login">Log in</a></div>
+  <div class="homepage layout-1">
+    <div role="main">
+      <section class="hero"><h1>Title</h1></section>
+      <div class="flex-container"><div class="showcase"></div></div>
+    </div>
+  </div>
+  <footer class="site-footer"></footer>
+</body></html>
+'''
+
+
+def test_extract_critical_css_keeps_rules_above_the_fold():
+    css = (
+        '@font-face{font-family:X;src:url(../fonts/x.woff2)}'
+        'body{margin:0}'
+        '.account-masthead a:hover, .missing{color:red}'
+        '.hero h1::after{content:"</style>"}'
+        '.showcase, .site-footer{color:blue}'
+        '@media (min-width: 1px){.hero{padding:0}.showcase{padding:1px}}'
+        'a:not(.x, .y){color:green}'
+    )
+    critical = extract_critical_css(HTML, [('/webassets/pose_theme/main.css', css)])
+
+    assert critical == (
+        '@font-face{font-family:X;src:url(/webassets/fonts/x.woff2)}'
+        'body{margin:0}'
+        '.account-masthead a:hover{color:red}'
+        '.hero h1::after{content:"<\\/style>"}'
+        '@media (min-width:1px){.hero{padding:0}}'
+        'a:not(.x,.y){color:green}'
+    )
+
+
+def test_defer_stylesheets():
+    html = defer_stylesheets('<link href="/webassets/main.css" rel="stylesheet"/>')
+    assert html.startswith('<link rel="preload" as="style" href="/webassets/main.css"')
+    assert '<noscript><link rel="stylesheet" href="/webassets/main.css" /></noscript>' in html
+
+
+@pytest.mark.usefixtures('clean_db', 'clean_index', 'with_plugins')
+@pytest.mark.ckan_config('ckan.plugins', 'scheming_datasets pose_theme pose_custom_homepage pose_custom_showcase')
+@pytest.mark.ckan_config('scheming.dataset_schemas',
+                         'ckanext.pose_theme.custom_themes.pose_theme:extension.yaml '
+                         'ckanext.pose_theme.custom_themes.pose_theme:site.yaml')
+def test_build_renders_the_layout_rather_than_the_stored_one(app):
+    pytest.importorskip('lxml.cssselect')
+    # Read back from the database whenever the process reloads its config
+    helpers.call_action('config_option_update', {CUSTOM_STYLE: 2})
+
+    css, stylesheets = build_critical_css(Client(app.flask_app), 1)
+    urls = [url for url, _ in stylesheets]
+    assert '/css/layout1.css' in urls
+    assert '/css/layout2.css' not in urls
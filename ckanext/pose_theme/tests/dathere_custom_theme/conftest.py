@@ -0,0 +1,23 @@
+from collections import namedtuple
+
+import pytest
+
+Row = namedtuple('Row', ['resource_id', 'id', 'type', 'comment'])
+
+
+class FakeConnection(object):
+    """Connection to the datastore database answering the column comment query from ``rows``."""
+
+    def __init__(self, rows):
+        self.rows = [Row(*row) for row in rows]
+        self.queries = []
+
+    def execute(self, query, params):
+        self.queries.append(sorted(params['resource_ids']))
+        return [row for row in self.rows if row.resource_id in params['resource_ids']]
+
+
+@pytest.fixture
+def datastore_connection():
+    """Build a ``FakeConnection`` of ``(resource_id, id, type, comment)`` rows."""
+    return FakeConnection
@@ -0,0 +1,137 @@
+import datetime
+
+import pytest
+import ckan.model as model
+import ckan.tests.factories as factories
+from ckanext.activity.model import Activity
+
+import ckanext.pose_theme.custom_themes.pose_theme.activity_cleanup as activity_cleanup
+from ckanext.pose_theme.custom_themes.pose_theme.cli import pose_theme
+
+
+def _activity_types():
+    return sorted(data['package']['type'] for data, in model.Session.query(Activity.data)
+                  if 'package' in (data or {}))
+
+
+@pytest.fixture
+def activities():
+    for _ in range(5):
+        factories.Dataset(type='application')
+    factories.Dataset()
+    assert _activity_types() == ['application'] * 5 + ['dataset']
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db', 'activities')
+@pytest.mark.ckan_config("ckan.plugins", "activity pose_theme")
+class TestCleanupActivities(object):
+
+    def test_batches(self):
+        criterion = activity_cleanup.package_type() == 'application'
+        batches = list(activity_cleanup.delete_in_batches(criterion, batch_size=2))
+        assert [len(ids) for ids in batches] == [2, 2, 1]
+        assert batches[0][-1] < batches[1][0]
+        assert _activity_types() == ['dataset']
+
+    def test_dry_run(self, cli):
+        result = cli.invoke(pose_theme, ['cleanup-activities', 'application', '--dry-run'])
+        assert not result.exit_code, result.output
+        assert '5 activity record(s) would be deleted' in result.output
+        assert len(_activity_types()) == 6
+
+    def test_cleanup(self, cli):
+        result = cli.invoke(pose_theme, ['cleanup-activities', 'application', '--batch-size', '2', '--yes'])
+        assert not result.exit_code, result.output
+        assert 'Successfully deleted 5 activity record(s)' in result.output
+        assert _activity_types() == ['dataset']
+
+    def test_resume_after(self, cli):
+        criterion = activity_cleanup.package_type() == 'application'
+        first = activity_cleanup.find_batch(criterion, batch_size=2)
+
+        result = cli.invoke(pose_theme, ['cleanup-activities', 'application', '--after', first[-1], '--yes'])
+        assert not result.exit_code, result.output
+        assert 'Successfully deleted 3 activity record(s)' in result.output
+        assert activity_cleanup.find_batch(criterion) == first
+
+    def test_with_index(self, cli):
+        result = cli.invoke(pose_theme, ['activity-index'])
+        assert not result.exit_code, result.output
+        assert activity_cleanup.has_index()
+        try:
+            result = cli.invoke(pose_theme, ['cleanup-activities', 'application', '--yes'])
+            assert 'No index' not in result.output
+            assert _activity_types() == ['dataset']
+        finally:
+            cli.invoke(pose_theme, ['activity-index', '--drop'])
+        assert not activity_cleanup.has_index()
+
+
+def test_parse_policy():
+    assert activity_cleanup.parse_policy('extension:180d, site:52w dataset:keep  report:12h') == {
+        'extension': datetime.timedelta(days=180),
+        'site': datetime.timedelta(weeks=52),
+        'dataset': None,
+        'report': datetime.timedelta(hours=12),
+    }
+    assert activity_cleanup.parse_policy('') == {}
+
+
+@pytest.mark.parametrize('policy', ['extension', 'extension:', 'extension:6m', ':180d', 'extension:-1d'])
+def test_parse_invalid_policy(policy):
+    with pytest.raises(ValueError):
+        activity_cleanup.parse_policy(policy)
+
+
+def test_format_age():
+    assert activity_cleanup.format_age(datetime.timedelta(weeks=2)) == '14d'
+    assert activity_cleanup.format_age(datetime.timedelta(hours=36)) == '36h'
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db')
+@pytest.mark.ckan_config("ckan.plugins", "activity pose_theme")
+class TestPruneActivities(object):
+
+    @pytest.fixture
+    def aged(self):
+        """Activities of application, site and dataset datasets, 400 and 10 days old."""
+        now = datetime.datetime.utcnow()
+        for dataset_type in ('application', 'site', 'dataset'):
+            for age in (400, 10):
+                dataset = factories.Dataset(type=dataset_type)
+                model.Session.query(Activity).filter(Activity.object_id == dataset['id']).update(
+                    {'timestamp': now - datetime.timedelta(days=age)}, synchronize_session=False)
+        model.Session.commit()
+
+    @pytest.mark.usefixtures('aged')
+    def test_prune(self, cli):
+        result = cli.invoke(pose_theme, ['prune-activities', '--policy', 'application:180d, site:1d, dataset:keep',
+                                         '--batch-size', '1', '--sleep', '0'])
+        assert not result.exit_code, result.output
+        assert 'application: deleted 1 activity record(s) older than 180d' in result.output
+        assert 'site: deleted 2 activity record(s) older than 1d' in result.output
+        assert 'dataset: kept' in result.output
+        assert 'Total: deleted 3 activity record(s)' in result.output
+        assert _activity_types() == ['application', 'dataset', 'dataset']
+
+    @pytest.mark.usefixtures('aged')
+    @pytest.mark.ckan_config('ckanext.pose_theme.activity_retention', 'site:180d')
+    def test_prune_from_config_dry_run(self, cli):
+        result = cli.invoke(pose_theme, ['prune-activities', '--dry-run'])
+        assert not result.exit_code, result.output
+        assert 'site: would delete 1 activity record(s)' in result.output
+        assert len(_activity_types()) == 6
+
+    def test_invalid_policy(self, cli):
+        result = cli.invoke(pose_theme, ['prune-activities', '--policy', 'site:soon'])
+        assert result.exit_code == 2
+        assert 'Invalid age "soon"' in result.output
+
+    def test_one_run_at_a_time(self, cli):
+        lock = activity_cleanup.PruneLock()
+        assert lock.acquire()
+        try:
+            result = cli.invoke(pose_theme, ['prune-activities', '--policy', 'site:1d'])
+            assert 'already being pruned' in result.output
+        finally:
+            lock.release()
@@ -0,0 +1,79 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+import ckan.model as model
+import ckan.plugins.toolkit as toolkit
+
+import ckanext.pose_theme.custom_themes.pose_theme.bench as bench
+from ckanext.pose_theme.custom_themes.pose_theme.cli import pose_theme
+
+
+def test_percentile():
+    values = [5, 1, 4, 2, 3, 10, 6, 7, 9, 8]
+    assert bench.percentile(values, 50) == 5
+    assert bench.percentile(values, 95) == 10
+    assert bench.percentile([3], 95) == 3
+    assert bench.percentile([], 50) is None
+
+
+def test_counts_reset():
+    counts = bench.Counts()
+    counts.add_sql(None, None, 'SELECT 1', {}, None, False)
+    counts.add_action('package_show')
+    counts.add_solr()
+    assert (counts.sql, counts.solr, dict(counts.actions)) == (1, 1, {'package_show': 1})
+    counts.reset()
+    assert (counts.sql, counts.solr, dict(counts.actions)) == (0, 0, {})
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db', 'clean_index')
+@pytest.mark.ckan_config('ckan.plugins', 'scheming_datasets pose_theme pose_custom_homepage pose_custom_showcase')
+@pytest.mark.ckan_config('scheming.dataset_schemas',
+                         'ckanext.pose_theme.custom_themes.pose_theme:extension.yaml '
+                         'ckanext.pose_theme.custom_themes.pose_theme:site.yaml')
+class TestBench(object):
+
+    def test_instrumented(self):
+        with bench.instrumented() as counts:
+            toolkit.get_action('package_search')({}, {'q': '*:*'})
+            model.Session.execute('SELECT 1')
+        assert counts.actions['package_search'] == 1
+        assert counts.solr >= 1
+        assert counts.sql >= 1
+
+        # Everything is put back
+        toolkit.get_action('package_search')({}, {'q': '*:*'})
+        assert counts.actions['package_search'] == 1
+
+    def test_seed_is_idempotent(self):
+        counts = {'organizations': 2, 'groups': 1, 'datasets': 2, 'extensions': 4, 'sites': 1, 'showcases': 0}
+        assert bench.seed(counts) == {'organizations': 2, 'groups': 1, 'datasets': 2, 'extensions': 4, 'sites': 1}
+        assert bench.seed(counts) == {}
+
+        featured = toolkit.get_action('package_search')({}, {
+            'q': 'type:extension', 'fq': 'extras_is_featured:TRUE'})
+        assert [extension['name'] for extension in featured['results']] == ['bench-extension-0']
+
+        assert bench.purge() == 10
+        assert not model.Session.query(model.Package).filter(model.Package.name.like('bench-%')).count()
+
+    def test_bench_command(self, app, cli, tmp_path):
+        output = str(tmp_path / 'bench.json')
+        args = ['bench', '--organizations', '1', '--groups', '1', '--datasets', '2', '--extensions', '2',
+                '--sites', '2', '--showcases', '0', '--runs', '3', '--warmup', '1', '-o', output]
+        # The app of the ckan command
+        result = cli.invoke(pose_theme, args, obj=SimpleNamespace(app=app.app))
+        assert not result.exit_code, result.output
+
+        with open(output) as f:
+            report = json.load(f)
+        assert report['meta']['runs'] == 3
+        assert report['meta']['catalog']['extension'] == 2
+        assert list(report['pages']) == list(bench.PAGES)
+        for page in report['pages'].values():
+            assert page['status'] == 200
+            assert page['p50_ms'] <= page['p95_ms']
+            assert page['sql_queries'] > 0
+        assert report['pages']['/extension/']['solr_calls'] >= 1
+        assert report['pages']['/extension/']['actions']['package_search'] >= 1
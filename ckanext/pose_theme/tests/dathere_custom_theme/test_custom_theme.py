@@ -4,7 +4,7 @@ import ckan.tests.factories as factories
 
 
 @pytest.mark.usefixtures('with_plugins', 'clean_db')
-@pytest.mark.ckan_config("ckan.plugins", "datastore pose_custom_theme")
+@pytest.mark.ckan_config("ckan.plugins", "datastore pose_theme")
 class TestDataDictionaryDownload(object):
 
     def test_data_dictionary_download_basic(self, app):
@@ -21,3 +21,76 @@ class TestDataDictionaryDownload(object):
             "column,type,label,description\r\n"
             "book,text,,\r\n" == response.get_data(as_text=True)
         )
+
+    def test_data_dictionary_download_formats(self, app):
+        resource = factories.Resource()
+        helpers.call_action("datastore_create", resource_id=resource["id"], force=True, fields=[
+            {"id": "book", "type": "text", "info": {"label": "Book", "notes": "Title of the book"}},
+        ])
+
+        url = f'/datastore/dictionary_download/{resource["id"]}'
+        response = app.get(url, query_string={"bom": "true"})
+        assert response.get_data().startswith(b"\xef\xbb\xbf")
+
+        response = app.get(url, query_string={"format": "json"})
+        assert response.json == [
+            {"id": "book", "type": "text", "label": "Book", "description": "Title of the book"}]
+
+        response = app.get(url, query_string={"format": "tableschema"})
+        assert response.json == {"fields": [
+            {"name": "book", "type": "string", "title": "Book", "description": "Title of the book"}]}
+        assert "table-schema.json" in response.headers["Content-disposition"]
+
+        app.get(url, query_string={"format": "pdf"}, status=400)
+
+    def test_data_dictionary_download_not_modified(self, app):
+        resource = factories.Resource()
+        helpers.call_action("datastore_create", resource_id=resource["id"], force=True, fields=[
+            {"id": "book", "type": "text"},
+        ])
+
+        url = f'/datastore/dictionary_download/{resource["id"]}'
+        etag = app.get(url).headers["ETag"]
+        response = app.get(url, headers={"If-None-Match": etag}, status=304)
+        assert not response.get_data()
+
+        helpers.call_action("datastore_create", resource_id=resource["id"], force=True, fields=[
+            {"id": "book", "type": "text", "info": {"notes": "Title of the book"}},
+        ])
+        response = app.get(url, headers={"If-None-Match": etag}, status=200)
+        assert response.headers["ETag"] != etag
+
+    def test_resource_page_download_button(self, app):
+        dataset = factories.Dataset()
+        labelled = factories.Resource(package_id=dataset["id"])
+        plain = factories.Resource(package_id=dataset["id"])
+        helpers.call_action("datastore_create", resource_id=labelled["id"], force=True, fields=[
+            {"id": "book", "type": "text", "info": {"label": "Book"}},
+        ])
+        helpers.call_action("datastore_create", resource_id=plain["id"], force=True, fields=[
+            {"id": "book", "type": "text"},
+        ])
+
+        response = app.get(f'/dataset/{dataset["name"]}/resource/{labelled["id"]}')
+        assert "Data Dictionary Download" in response.get_data(as_text=True)
+        response = app.get(f'/dataset/{dataset["name"]}/resource/{plain["id"]}')
+        assert "Data Dictionary Download" not in response.get_data(as_text=True)
+
+
+@pytest.mark.usefixtures('with_plugins')
+@pytest.mark.ckan_config("ckan.plugins", "pose_theme")
+def test_content_addressed_uploads_are_cached_forever(ckan_config, monkeypatch, tmp_path, make_app):
+    monkeypatch.setitem(ckan_config, 'ckan.storage_path', str(tmp_path))
+    name = 'a' * 64 + '.png'
+    for upload_to in ('hero', 'user'):
+        directory = tmp_path / 'storage' / 'uploads' / upload_to
+        directory.mkdir(parents=True)
+        (directory / name).write_bytes(b'image')
+    app = make_app()
+
+    # Served by CKAN core, the theme only sets the cache headers
+    response = app.get(f'/uploads/hero/{name}')
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    response = app.get(f'/uploads/user/{name}')
+    assert response.headers.get('Cache-Control') != 'public, max-age=31536000, immutable'
+    app.get('/uploads/hero/' + 'b' * 64 + '.png', status=404)
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_availability as dictionary_availability
+
+@pytest.fixture
+def connection(datastore_connection):
+    dictionary_availability.clear()
+    yield datastore_connection([
+        ('labelled', '_id', 'int4', None),
+        ('labelled', 'book', 'text', json.dumps({'_info': {'label': 'Book', 'notes': ''}})),
+        ('plain', '_id', 'int4', None),
+        ('plain', 'book', 'text', None),
+        ('described', 'book', 'text', json.dumps({'_info': {'label': '', 'notes': 'Title'}})),
+    ])
+    dictionary_availability.clear()
+
+
+def _package(**last_modified):
+    return {'name': 'books', 'resources': [
+        {'id': resource_id, 'datastore_active': True, 'last_modified': last_modified.get(resource_id)}
+        for resource_id in ('labelled', 'plain', 'described')
+    ] + [{'id': 'file', 'datastore_active': False}]}
+
+
+def test_one_query_for_all_the_resources(connection):
+    found = dictionary_availability.resources_with_dictionary(_package(), connection)
+    assert found == {'labelled', 'described'}
+    assert connection.queries == [['described', 'labelled', 'plain']]
+
+
+def test_cached_until_the_resource_is_modified(connection):
+    dictionary_availability.resources_with_dictionary(_package(), connection)
+    assert dictionary_availability.resources_with_dictionary(_package(), connection) == {'labelled', 'described'}
+    assert len(connection.queries) == 1
+
+    dictionary_availability.resources_with_dictionary(_package(plain='2024-05-01T10:00:00'), connection)
+    assert connection.queries[1] == ['plain']
+
+
+def test_cache_ttl(connection, ckan_config, monkeypatch):
+    monkeypatch.setitem(ckan_config, 'ckanext.pose_theme.data_dictionary_cache_ttl', 0)
+    dictionary_availability.resources_with_dictionary(_package(), connection)
+    dictionary_availability.resources_with_dictionary(_package(), connection)
+    assert len(connection.queries) == 2
+
+
+def test_datastore_unavailable(connection):
+    class BrokenConnection(object):
+        def execute(self, query, params):
+            raise RuntimeError('datastore is down')
+
+    assert dictionary_availability.resources_with_dictionary(_package(), BrokenConnection()) == set()
+    # Nothing cached, the next page looks the resources up again
+    assert dictionary_availability.resources_with_dictionary(_package(), connection) == {'labelled', 'described'}
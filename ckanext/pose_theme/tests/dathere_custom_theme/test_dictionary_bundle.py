@@ -0,0 +1,96 @@
+import io
+import json
+import zipfile
+
+import pytest
+import ckan.tests.helpers as helpers
+import ckan.tests.factories as factories
+
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_bundle as dictionary_bundle
+
+@pytest.fixture
+def connection(datastore_connection):
+    return datastore_connection([
+        ('res-1', '_id', 'int4', None),
+        ('res-1', 'book', 'text', json.dumps({'_info': {'label': 'Book', 'notes': 'Title'}})),
+        ('res-1', 'pages', 'int4', 'not json'),
+        # Comments of CKAN 2.9
+        ('res-2', 'city', 'text', json.dumps({'label': 'City', 'notes': ''})),
+    ])
+
+
+def test_datastore_fields_in_one_query(connection):
+    fields = dictionary_bundle.datastore_fields(['res-1', 'res-2', 'gone'], connection)
+    assert len(connection.queries) == 1
+    assert fields == {
+        'res-1': [
+            {'id': '_id', 'type': 'int4', 'info': {}},
+            {'id': 'book', 'type': 'text', 'info': {'label': 'Book', 'notes': 'Title'}},
+            {'id': 'pages', 'type': 'int4', 'info': {}},
+        ],
+        'res-2': [{'id': 'city', 'type': 'text', 'info': {'label': 'City', 'notes': ''}}],
+    }
+
+
+def test_datastore_fields_without_resources(datastore_connection):
+    assert dictionary_bundle.datastore_fields([], datastore_connection([])) == {}
+
+
+def test_zip_of_the_dictionaries(connection):
+    pairs = [
+        ({'name': 'books'}, {'id': 'res-1'}),
+        ({'name': 'cities'}, {'id': 'res-2'}),
+        ({'name': 'cities'}, {'id': 'gone'}),
+    ]
+    entries = dictionary_bundle.dictionary_entries(pairs, 'csv', connection)
+    chunks = list(dictionary_bundle.iter_zip(entries, 'csv'))
+    # One chunk per entry and the central directory
+    assert len(chunks) == 3
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None
+    assert archive.namelist() == [
+        'books/res-1-data-dictionary.csv',
+        'cities/res-2-data-dictionary.csv',
+    ]
+    assert archive.read('books/res-1-data-dictionary.csv').decode('utf-8') == (
+        'column,type,label,description\r\n'
+        'book,text,Book,Title\r\n'
+        'pages,int4,,\r\n'
+    )
+
+
+def test_zip_of_the_table_schemas(connection):
+    entries = dictionary_bundle.dictionary_entries([({'name': 'books'}, {'id': 'res-1'})], 'tableschema', connection)
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(dictionary_bundle.iter_zip(entries, 'tableschema'))))
+    assert json.loads(archive.read('books/res-1-table-schema.json')) == {'fields': [
+        {'name': 'book', 'type': 'string', 'title': 'Book', 'description': 'Title'},
+        {'name': 'pages', 'type': 'integer'},
+    ]}
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db')
+@pytest.mark.ckan_config("ckan.plugins", "datastore pose_theme")
+class TestDictionaryBundleDownload(object):
+
+    def test_organization_zip(self, app):
+        organization = factories.Organization()
+        for name in ('first', 'second'):
+            dataset = factories.Dataset(name=name, owner_org=organization['id'])
+            resource = factories.Resource(package_id=dataset['id'])
+            helpers.call_action("datastore_create", resource_id=resource["id"], force=True, fields=[
+                {"id": "book", "type": "text", "info": {"label": "Book", "notes": name}},
+            ])
+        factories.Resource(package_id=dataset['id'])
+
+        response = app.get(f'/datastore/dictionary_export/organization/{organization["name"]}')
+        assert response.headers['Content-Type'] == 'application/zip'
+        archive = zipfile.ZipFile(io.BytesIO(response.get_data()))
+        names = archive.namelist()
+        assert [name.split('/')[0] for name in names] == ['first', 'second']
+        assert archive.read(names[1]).decode('utf-8').endswith('book,text,Book,second\r\n')
+
+    def test_private_dataset(self, app):
+        organization = factories.Organization()
+        dataset = factories.Dataset(owner_org=organization['id'], private=True)
+        app.get(f'/datastore/dictionary_export/dataset/{dataset["name"]}', status=404)
@@ -0,0 +1,112 @@
+import codecs
+import io
+import json
+
+import pytest
+
+import ckanext.pose_theme.custom_themes.pose_theme.dictionary_export as dictionary_export
+
+DATASTORE_FIELDS = [
+    {'id': '_id', 'type': 'int'},
+    {'id': 'city', 'type': 'text', 'info': {'label': 'Città', 'notes': 'Name, with "quotes"'}},
+    {'id': 'population', 'type': 'int8', 'info': {'label': '', 'notes': '=SUM(A1:A2)'}},
+    {'id': 'tags', 'type': '_text'},
+    {'id': 'shape', 'type': 'geometry'},
+]
+
+
+@pytest.fixture
+def fields():
+    return dictionary_export.dictionary_fields(DATASTORE_FIELDS)
+
+
+def _export(fmt, fields, bom=False):
+    return b''.join(dictionary_export.export(fmt, fields, bom))
+
+
+def test_dictionary_fields_leave_out_internal_columns(fields):
+    assert [field['id'] for field in fields] == ['city', 'population', 'tags', 'shape']
+    assert fields[2] == {'id': 'tags', 'type': '_text', 'label': '', 'description': ''}
+
+
+def test_csv(fields):
+    assert _export('csv', fields).decode('utf-8') == (
+        'column,type,label,description\r\n'
+        'city,text,Città,"Name, with ""quotes"""\r\n'
+        "population,int8,,'=SUM(A1:A2)\r\n"
+        'tags,_text,,\r\n'
+        'shape,geometry,,\r\n'
+    )
+
+
+@pytest.mark.parametrize('value, cell', [
+    ('=1+1', "'=1+1"),
+    ('+1', "'+1"),
+    ('-1', "'-1"),
+    ('@SUM(A1)', "'@SUM(A1)"),
+    ('\tx', "'\tx"),
+    ('Total = 1', 'Total = 1'),
+    ('', ''),
+])
+def test_csv_cell_escapes_formulas(value, cell):
+    assert dictionary_export.csv_cell(value) == cell
+
+
+def test_csv_bom(fields):
+    data = _export('csv', fields, bom=True)
+    assert data.startswith(codecs.BOM_UTF8)
+    assert data.decode('utf-8-sig') == _export('csv', fields).decode('utf-8')
+
+
+def test_csv_is_streamed_in_chunks():
+    many = [{'id': 'column_{}'.format(i), 'type': 'text', 'label': '', 'description': 'x' * 100}
+            for i in range(1000)]
+    chunks = list(dictionary_export.export('csv', many))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 2 * dictionary_export.CHUNK_SIZE for chunk in chunks)
+
+
+def test_json(fields):
+    assert json.loads(_export('json', fields).decode('utf-8')) == fields
+    assert 'Città'.encode('utf-8') in _export('json', fields)
+
+
+def test_json_empty():
+    assert json.loads(_export('json', [])) == []
+
+
+def test_table_schema(fields):
+    assert json.loads(_export('tableschema', fields).decode('utf-8')) == {'fields': [
+        {'name': 'city', 'type': 'string', 'title': 'Città', 'description': 'Name, with "quotes"'},
+        {'name': 'population', 'type': 'integer', 'description': '=SUM(A1:A2)'},
+        {'name': 'tags', 'type': 'array'},
+        {'name': 'shape', 'type': 'any'},
+    ]}
+
+
+def test_xlsx(fields):
+    openpyxl = pytest.importorskip('openpyxl')
+    workbook = openpyxl.load_workbook(io.BytesIO(_export('xlsx', fields)))
+    rows = list(workbook['Data dictionary'].values)
+    assert rows[0] == ('column', 'type', 'label', 'description')
+    assert rows[1] == ('city', 'text', 'Città', 'Name, with "quotes"')
+    # Text, not a formula
+    assert workbook['Data dictionary']['D3'].data_type == 's'
+    assert rows[2][3] == '=SUM(A1:A2)'
+
+
+def test_etag_follows_the_field_definitions(fields):
+    etag = dictionary_export.fields_etag('res', fields, 'csv')
+    assert etag == dictionary_export.fields_etag('res', [dict(field) for field in fields], 'csv')
+    assert etag != dictionary_export.fields_etag('res', fields, 'json')
+    assert etag != dictionary_export.fields_etag('res', fields, 'csv', bom=True)
+
+    changed = [dict(field) for field in fields]
+    changed[0]['description'] = 'Name of the city'
+    assert etag != dictionary_export.fields_etag('res', changed, 'csv')
+
+
+def test_unknown_format(fields):
+    assert not dictionary_export.is_available('pdf')
+    with pytest.raises(ValueError):
+        dictionary_export.export('pdf', fields)
@@ -0,0 +1,65 @@
+import os
+
+import pytest
+from jinja2 import DictLoader, Environment, FileSystemBytecodeCache
+
+import ckanext.pose_theme.custom_themes.pose_theme.warmup as warmup
+
+
+class FakeFlaskApp(object):
+    def __init__(self, templates):
+        self.jinja_env = Environment(loader=DictLoader(templates))
+
+
+@pytest.fixture
+def flask_app():
+    return FakeFlaskApp({
+        'page.html': '<p>{% block content %}{% endblock %}</p>',
+        'home/index.html': '{% extends "page.html" %}{% block content %}Hi{% endblock %}',
+        'broken.html': '{% block content %}',
+        'email.txt': 'Hello',
+    })
+
+
+def test_bytecode_cache_dir(ckan_config, monkeypatch, tmp_path):
+    monkeypatch.setitem(ckan_config, 'cache_dir', str(tmp_path))
+    assert warmup.get_bytecode_cache_dir() == os.path.join(str(tmp_path), 'pose_theme_jinja')
+    monkeypatch.setitem(ckan_config, warmup.BYTECODE_CACHE_DIR, 'false')
+    assert warmup.get_bytecode_cache_dir() is None
+
+
+def test_prime_templates_fills_the_bytecode_cache(flask_app, ckan_config, monkeypatch, tmp_path):
+    monkeypatch.setitem(ckan_config, warmup.BYTECODE_CACHE_DIR, str(tmp_path / 'jinja'))
+    assert warmup.install_bytecode_cache(flask_app) == str(tmp_path / 'jinja')
+    assert isinstance(flask_app.jinja_env.bytecode_cache, FileSystemBytecodeCache)
+
+    assert warmup.prime_templates(flask_app) == '2 compiled, 1 skipped'
+    assert len(os.listdir(str(tmp_path / 'jinja'))) == 2
+
+    # A new worker loads the compiled templates
+    other = FakeFlaskApp({'page.html': '<p>{% block content %}{% endblock %}</p>'})
+    warmup.install_bytecode_cache(other)
+    assert other.jinja_env.get_template('page.html').render() == '<p></p>'
+
+
+def test_timed_step_keeps_the_error():
+    def fail():
+        raise RuntimeError('Solr is down')
+
+    step = warmup._timed('statistics', fail)
+    assert step.name == 'statistics'
+    assert step.detail is None
+    assert str(step.error) == 'Solr is down'
+    assert step.seconds >= 0
+
+
+@pytest.mark.usefixtures('with_plugins', 'clean_db', 'clean_index')
+@pytest.mark.ckan_config('ckan.plugins', 'scheming_datasets pose_theme pose_custom_homepage pose_custom_showcase')
+@pytest.mark.ckan_config('scheming.dataset_schemas',
+                         'ckanext.pose_theme.custom_themes.pose_theme:extension.yaml '
+                         'ckanext.pose_theme.custom_themes.pose_theme:site.yaml')
+def test_warm(app):
+    steps = warmup.warm(app.app)
+    assert [step.name for step in steps] == [
+        'templates', 'homepage', 'extension listing', 'site listing', 'statistics']
+    assert not [step for step in steps if step.error]
@@ -0,0 +1,98 @@
+# encoding: utf-8
+"""Local stand-in of the recaptcha verification endpoint, for tests.
+
+Tokens are answered from ``tokens``, ``{token: action}``, unknown tokens
+fail with ``invalid-input-response``. Keep-alive connections are honoured,
+``connections`` counts the ones that were opened. The routes tests start
+one with the ``recaptcha_server`` fixture.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class _VerifyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without this every answer on
+    # a kept-alive connection waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.standin.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        standin = self.server.standin
+        length = int(self.headers.get('Content-Length') or 0)
+        form = parse_qs(self.rfile.read(length).decode('utf-8'))
+        token = form.get('response', [''])[0]
+        standin.requests.append(form)
+        if standin.delay:
+            time.sleep(standin.delay)
+
+        if standin.status != 200:
+            body = b'{}'
+            status = standin.status
+        else:
+            status = 200
+            if token in standin.tokens:
+                result = {'success': True, 'action': standin.tokens[token], 'score': 0.9}
+            else:
+                result = {'success': False, 'error-codes': ['invalid-input-response']}
+            body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that gave up waiting, see the timeouts of RecaptchaClient
+        pass
+
+
+class LocalRecaptchaServer(object):
+    """Verification endpoint on a free local port.
+
+    :param delay: seconds to wait before every answer
+    :param status: HTTP status of every answer, e.g. 503 for an outage
+    """
+
+    def __init__(self, tokens=None, delay=0, status=200, host='127.0.0.1', port=0):
+        self.tokens = dict(tokens or {})
+        self.delay = delay
+        self.status = status
+        self.requests = []
+        self.connections = 0
+        self._server = _Server((host, port), _VerifyHandler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def verify_url(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}/recaptcha/api/siteverify'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,99 @@
+# encoding: utf-8
+"""Minimal SMTP server that keeps the messages it receives, for tests.
+
+Only the commands ``smtplib`` sends without authentication or TLS are
+understood. The ``smtp_server`` fixture of the routes tests starts one and
+points ``smtp.test_server`` at it.
+"""
+import email
+import socketserver
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('utf-8') + b'\r\n')
+
+    def handle(self):
+        server = self.server.standin
+        server.connections += 1
+        self.reply('220 localhost pose-theme test SMTP')
+        envelope = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('HELO', 'EHLO'):
+                self.reply('250 localhost')
+            elif verb == 'MAIL':
+                envelope = {'from': command.split(':', 1)[1].strip(), 'to': []}
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                envelope['to'].append(command.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                if server.fail_next > 0:
+                    server.fail_next -= 1
+                    self.reply('451 Temporary failure, try again later')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    # Undo the dot stuffing of lines starting with a dot
+                    data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                envelope['message'] = email.message_from_bytes(b''.join(data))
+                server.messages.append(envelope)
+                envelope = None
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer(object):
+    """SMTP stand-in listening on a free local port.
+
+    :param fail_next: number of following messages answered with a temporary
+        failure, to exercise retries
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, fail_next=0):
+        self.messages = []
+        self.connections = 0
+        self.fail_next = fail_next
+        self._server = _ThreadingTCPServer((host, port), _SMTPHandler)
+        self._server.standin = self
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address
+        return '{}:{}'.format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
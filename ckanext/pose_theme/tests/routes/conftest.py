@@ -0,0 +1,49 @@
+import pytest
+
+from ckanext.pose_theme.routes import email_dns
+from ckanext.pose_theme.tests.local_recaptcha import LocalRecaptchaServer
+from ckanext.pose_theme.tests.local_smtp import LocalSMTPServer
+
+
+@pytest.fixture
+def email_resolver(monkeypatch):
+    """Replace the resolver of the email DNS check during the test.
+
+    Call it with the resolver, e.g. ``email_resolver(FakeResolver(...))``.
+    The checker of the worker is restored afterwards.
+    """
+    checkers = []
+    monkeypatch.setattr(email_dns, '_checker', email_dns._checker)
+
+    def set_resolver(resolver):
+        checkers.append(email_dns.set_resolver(resolver))
+        return checkers[-1]
+    yield set_resolver
+    for checker in checkers:
+        checker.executor.shutdown(wait=False)
+
+
+@pytest.fixture
+def smtp_server(ckan_config, monkeypatch):
+    """Local SMTP server the contact form emails are delivered to."""
+    with LocalSMTPServer() as server:
+        monkeypatch.setitem(ckan_config, 'smtp.test_server', server.address)
+        monkeypatch.setitem(ckan_config, 'smtp.mail_from', 'catalog@example.com')
+        yield server
+
+
+@pytest.fixture
+def recaptcha_server():
+    """Start local recaptcha verification endpoints, stopped after the test.
+
+    Call it with the arguments of ``LocalRecaptchaServer``, e.g.
+    ``recaptcha_server({'good-token': 'contact'}, delay=0.5)``.
+    """
+    servers = []
+
+    def start(*args, **kwargs):
+        servers.append(LocalRecaptchaServer(*args, **kwargs).start())
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from ckanext.pose_theme.routes import email_dns
+from ckanext.pose_theme.routes.email_dns import (
+    DomainChecker, FakeResolver, INVALID, UNKNOWN, VALID, check_email_domain
+)
+
+
+def test_checker_caches_answers():
+    resolver = FakeResolver({'example.com': True})
+    checker = DomainChecker(resolver)
+    assert checker.check('example.com', timeout=1) == VALID
+    assert checker.check('Example.COM.', timeout=1) == VALID
+    assert checker.check('missing.example', timeout=1) == INVALID
+    assert checker.check('missing.example', timeout=1) == INVALID
+    assert resolver.lookups == ['example.com', 'missing.example']
+
+
+def test_negative_answers_expire_first():
+    resolver = FakeResolver({'example.com': True})
+    checker = DomainChecker(resolver, positive_ttl=60, negative_ttl=0)
+    checker.check('example.com', timeout=1)
+    checker.check('missing.example', timeout=1)
+    time.sleep(0.01)
+    assert checker.cached('example.com') == VALID
+    assert checker.cached('missing.example') == UNKNOWN
+
+
+def test_cache_is_purged_when_full():
+    resolver = FakeResolver({'a.example': True, 'b.example': True, 'c.example': True})
+    checker = DomainChecker(resolver, negative_ttl=-1, max_size=2)
+    checker.check('missing.example', timeout=1)
+    checker.check('a.example', timeout=1)
+    # The expired answer makes room
+    checker.check('b.example', timeout=1)
+    assert sorted(checker._cache) == ['a.example', 'b.example']
+    # Only live answers left
+    checker.check('c.example', timeout=1)
+    assert sorted(checker._cache) == ['c.example']
+    checker.executor.shutdown()
+
+
+def test_slow_lookup_returns_within_budget_and_caches_later():
+    checker = DomainChecker(FakeResolver({'slow.example': True}, delay=0.3))
+    started = time.monotonic()
+    assert checker.check('slow.example', timeout=0.05) == UNKNOWN
+    assert time.monotonic() - started < 0.25
+    # A second submission during the lookup does not start another one
+    assert checker.check('slow.example', timeout=0) == UNKNOWN
+    checker.lookup('slow.example').result()
+    assert checker.check('slow.example') == VALID
+    assert checker.resolver.lookups == ['slow.example']
+
+
+def test_failed_lookups_are_not_cached():
+    resolver = FakeResolver(failing={'broken.example'})
+    checker = DomainChecker(resolver)
+    assert checker.check('broken.example', timeout=1) == UNKNOWN
+    assert checker.check('broken.example', timeout=1) == UNKNOWN
+    assert resolver.lookups == ['broken.example', 'broken.example']
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.email_dns', 'later')
+def test_validate_later_mode_does_not_wait(email_resolver):
+    email_resolver(FakeResolver({'example.com': True}, delay=0.2))
+    assert check_email_domain('someone@example.com') == UNKNOWN
+    email_dns.get_checker().lookup('example.com').result()
+    assert check_email_domain('someone@example.com') == VALID
+    assert check_email_domain('someone@missing.example') == UNKNOWN
+    email_dns.get_checker().lookup('missing.example').result()
+    assert check_email_domain('someone@missing.example') == INVALID
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.email_dns', 'off')
+def test_off_mode_skips_lookups(email_resolver):
+    resolver = FakeResolver()
+    email_resolver(resolver)
+    assert check_email_domain('someone@missing.example') == VALID
+    assert resolver.lookups == []
@@ -0,0 +1,148 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import ckan.model as model
+
+from ckanext.pose_theme.routes import _helpers, outbox
+
+MAIL = {'subject': 'General Inquiry', 'body': 'Hello', 'headers': {'reply-to': 'sender@example.com'}}
+FORM = {'name': 'Sender', 'email': 'sender@example.com', 'subject': 'general', 'content': 'Hello'}
+
+
+@pytest.fixture
+def outbox_table():
+    outbox.init()
+
+
+@pytest.fixture
+def no_outbox_table():
+    """The database of a site upgraded without running initdb."""
+    outbox.init()
+    outbox.contact_outbox_table.drop()
+
+
+def _row(email):
+    return SimpleNamespace(recipient_name='Admin', recipient_email=email,
+                           subject=MAIL['subject'], body=MAIL['body'], headers=MAIL['headers'])
+
+
+@pytest.mark.usefixtures('ckan_config')
+def test_messages_share_one_connection(smtp_server):
+    smtp = outbox.SMTPConnection().open()
+    for email in ('a@example.com', 'b@example.com', 'c@example.com'):
+        smtp.send(outbox.build_message(_row(email)), email)
+    smtp.close()
+
+    assert smtp_server.connections == 1
+    assert [message['to'] for message in smtp_server.messages] == [
+        ['<a@example.com>'], ['<b@example.com>'], ['<c@example.com>']]
+    message = smtp_server.messages[0]['message']
+    assert message['Subject'] == 'General Inquiry'
+    assert message['reply-to'] == 'sender@example.com'
+    assert message.get_payload(decode=True) == b'Hello\n'
+
+
+@pytest.mark.usefixtures('clean_db', 'outbox_table', 'ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+def test_enqueued_emails_are_sent_in_one_batch(smtp_server):
+    ids = outbox.enqueue(MAIL, [('Admin', 'a@example.com'), ('Editor', 'b@example.com')])
+    assert smtp_server.messages == []
+
+    assert outbox.deliver_pending() == (2, 0)
+    assert smtp_server.connections == 1
+    rows = model.Session.query(outbox.ContactOutbox).filter(outbox.ContactOutbox.id.in_(ids)).all()
+    assert {row.status for row in rows} == {outbox.SENT}
+    assert outbox.deliver_pending() == (0, 0)
+
+
+@pytest.mark.usefixtures('clean_db', 'outbox_table', 'ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.max_attempts', '2')
+def test_failed_emails_are_retried_with_backoff(smtp_server):
+    smtp_server.fail_next = 1
+    [row_id] = outbox.enqueue(MAIL, [('Admin', 'a@example.com')])
+
+    assert outbox.deliver_pending() == (0, 1)
+    row = model.Session.query(outbox.ContactOutbox).get(row_id)
+    assert row.status == outbox.PENDING
+    assert row.attempts == 1
+    assert row.next_attempt > datetime.datetime.utcnow()
+    # Not due yet
+    assert outbox.deliver_pending() == (0, 0)
+
+    row.next_attempt = datetime.datetime.utcnow()
+    model.Session.commit()
+    assert outbox.deliver_pending() == (1, 0)
+    assert len(smtp_server.messages) == 1
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.smtp_timeout', '5')
+def test_reconnect_closes_the_previous_connection(smtp_server):
+    smtp = outbox.SMTPConnection().open()
+    first = smtp.connection
+    assert first.timeout == 5
+    smtp.open()
+    assert first.sock is None
+    assert smtp.connection is not first
+    smtp.close()
+    assert smtp_server.connections == 2
+
+
+@pytest.mark.usefixtures('clean_db', 'outbox_table', 'ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+def test_claimed_rows_are_not_due_for_other_workers():
+    ids = outbox.enqueue(MAIL, [('Admin', 'a@example.com'), ('Editor', 'b@example.com')])
+    assert sorted(outbox._claim_due(10)) == sorted(ids)
+    # Committed, another worker skips them until the claim expires
+    assert outbox._claim_due(10) == []
+
+
+@pytest.mark.usefixtures('clean_db', 'outbox_table', 'ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+def test_failed_emails_schedule_a_retry_job(smtp_server, ckan_config, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr(outbox, 'schedule_retry', scheduled.append)
+    smtp_server.fail_next = 1
+    [row_id] = outbox.enqueue(MAIL, [('Admin', 'a@example.com')])
+
+    monkeypatch.setitem(ckan_config, 'ckanext.pose_theme.contact.delivery', 'jobs')
+    assert outbox.deliver_pending() == (0, 1)
+    row = model.Session.query(outbox.ContactOutbox).get(row_id)
+    assert scheduled == [row.next_attempt]
+
+
+@pytest.mark.usefixtures('clean_db', 'outbox_table', 'ckan_config')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.sent_retention_days', '1')
+def test_sent_emails_are_purged_after_the_retention(smtp_server):
+    old_id, new_id = outbox.enqueue(MAIL, [('Admin', 'a@example.com'), ('Editor', 'b@example.com')])
+    assert outbox.deliver_pending() == (2, 0)
+
+    row = model.Session.query(outbox.ContactOutbox).get(old_id)
+    row.sent = datetime.datetime.utcnow() - datetime.timedelta(days=2)
+    model.Session.commit()
+    assert outbox.purge_sent() == 1
+    assert model.Session.query(outbox.ContactOutbox).get(old_id) is None
+    assert model.Session.query(outbox.ContactOutbox).get(new_id).status == outbox.SENT
+
+
+@pytest.mark.usefixtures('clean_db', 'no_outbox_table', 'with_plugins')
+@pytest.mark.ckan_config('ckan.plugins', 'pose_theme')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.delivery', 'worker')
+@pytest.mark.ckan_config('ckanext.contact.check_email', 'false')
+@pytest.mark.ckan_config('ckanext.contact.mail_to', 'admin@example.com')
+def test_form_is_queued_without_initdb(app):
+    # The plugin created the table when it was loaded
+    with app.flask_app.test_request_context('/contact', method='POST', data=FORM):
+        result = _helpers.submit()
+    assert result['success'], result
+    [row] = model.Session.query(outbox.ContactOutbox).all()
+    assert row.recipient_email == 'admin@example.com'
+
+
+def test_backoff_doubles_up_to_a_day():
+    assert [outbox.get_backoff(attempts).total_seconds() for attempts in (1, 2, 3)] == [60, 120, 240]
+    assert outbox.get_backoff(30).total_seconds() == 24 * 60 * 60
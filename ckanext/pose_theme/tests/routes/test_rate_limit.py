@@ -0,0 +1,175 @@
+import pytest
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+from ckan.lib.redis import connect_to_redis
+from ckan.plugins.toolkit import NotAuthorized
+
+from ckanext.pose_theme.routes.rate_limit import (
+    DUPLICATE, RATE_LIMITED_IP, RATE_LIMITED_USER, Limit, MemoryBackend, RedisBackend, SubmissionGuard,
+    content_hash, get_client_ip
+)
+
+SUBMISSION = {'name': 'Ada', 'email': 'ada@example.com', 'subject': 'general', 'content': 'Hello there'}
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _guard(backend=None, clock=None):
+    return SubmissionGuard(backend or MemoryBackend(clock or FakeClock()),
+                           user_limit=Limit(2, 1.0 / 60), ip_limit=Limit(3, 1.0 / 60), dedup_window=600)
+
+
+def _submission(index):
+    return dict(SUBMISSION, content='Message {}'.format(index))
+
+
+def test_user_bucket_allows_burst_then_refills():
+    clock = FakeClock()
+    guard = _guard(clock=clock)
+    assert guard.check('user-1', '10.0.0.1', _submission(1))[0] is None
+    assert guard.check('user-1', '10.0.0.1', _submission(2))[0] is None
+
+    rejection, digest = guard.check('user-1', '10.0.0.1', _submission(3))
+    assert rejection.reason == RATE_LIMITED_USER
+    assert rejection.retry_after == 60
+    assert digest is None
+
+    clock.now += 60
+    assert guard.check('user-1', '10.0.0.1', _submission(4))[0] is None
+
+
+def test_ip_bucket_is_shared_by_users():
+    guard = _guard()
+    for user in ('user-1', 'user-2', 'user-3'):
+        assert guard.check(user, '10.0.0.1', _submission(user))[0] is None
+    assert guard.check('user-4', '10.0.0.1', _submission(4))[0].reason == RATE_LIMITED_IP
+    assert guard.check('user-4', '10.0.0.2', _submission(4))[0] is None
+
+
+def test_ip_rejection_gives_the_user_token_back():
+    guard = _guard()
+    for user in ('user-1', 'user-2', 'user-3'):
+        assert guard.check(user, '10.0.0.1', _submission(user))[0] is None
+    for index in range(3):
+        assert guard.check('user-4', '10.0.0.1', _submission(index))[0].reason == RATE_LIMITED_IP
+    # The burst of the user is still there
+    assert guard.check('user-4', '10.0.0.2', _submission(4))[0] is None
+    assert guard.check('user-4', '10.0.0.2', _submission(5))[0] is None
+    assert guard.check('user-4', '10.0.0.2', _submission(6))[0].reason == RATE_LIMITED_USER
+
+
+def test_ip_bucket_can_be_disabled():
+    guard = SubmissionGuard(MemoryBackend(FakeClock()), user_limit=Limit(2, 1.0 / 60), ip_limit=None,
+                            dedup_window=600)
+    for user in ('user-1', 'user-2', 'user-3', 'user-4'):
+        assert guard.check(user, '127.0.0.1', _submission(user))[0] is None
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.parametrize('trusted, forwarded, client_ip', [
+    ('0', '203.0.113.7', '127.0.0.1'),
+    ('1', '198.51.100.1, 203.0.113.7', '203.0.113.7'),
+    ('2', '198.51.100.1, 203.0.113.7', '198.51.100.1'),
+    # Fewer addresses than trusted proxies, the header is not trusted
+    ('2', '203.0.113.7', '127.0.0.1'),
+    ('1', '', '127.0.0.1'),
+])
+def test_client_ip_behind_trusted_proxies(ckan_config, monkeypatch, trusted, forwarded, client_ip):
+    monkeypatch.setitem(ckan_config, 'ckanext.pose_theme.contact.trusted_proxies', trusted)
+    environ = {'REMOTE_ADDR': '127.0.0.1', 'HTTP_X_FORWARDED_FOR': forwarded}
+    assert get_client_ip(environ) == client_ip
+
+
+def test_full_buckets_are_purged_above_max_keys():
+    clock = FakeClock()
+    backend = MemoryBackend(clock, max_keys=2)
+    limit = Limit(2, 1.0 / 60)
+    backend.take('user:1', limit)
+    backend.take('user:2', limit)
+    clock.now += 60
+    # user:1 and user:2 are full again, user:3 has just been used
+    backend.take('user:3', limit)
+    assert list(backend._buckets) == ['user:3']
+
+    backend.take('user:3', limit)
+    backend.take('user:4', limit)
+    backend.take('user:5', limit)
+    assert sorted(backend._buckets) == ['user:3', 'user:4', 'user:5']
+    assert backend.take('user:3', limit) > 0
+
+
+def test_same_content_is_rejected_within_window():
+    clock = FakeClock()
+    guard = _guard(clock=clock)
+    assert guard.check('user-1', '10.0.0.1', SUBMISSION)[0] is None
+    # Whitespace and case do not make a message different
+    same = dict(SUBMISSION, content='  hello   THERE ')
+    clock.now += 120
+    assert guard.check('user-1', '10.0.0.1', same)[0].reason == DUPLICATE
+    # Another user may send the same text
+    assert guard.check('user-2', '10.0.0.2', same)[0] is None
+
+    clock.now += 600
+    assert guard.check('user-1', '10.0.0.1', SUBMISSION)[0] is None
+
+
+def test_released_content_can_be_sent_again():
+    guard = _guard()
+    rejection, digest = guard.check('user-1', '10.0.0.1', SUBMISSION)
+    guard.release(digest)
+    assert guard.check('user-1', '10.0.0.1', SUBMISSION)[0] is None
+
+
+def test_rejections_are_counted():
+    guard = _guard()
+    guard.check('user-1', '10.0.0.1', SUBMISSION)
+    guard.check('user-1', '10.0.0.1', SUBMISSION)
+    guard.check('user-1', '10.0.0.1', _submission(1))
+    guard.check('user-1', '10.0.0.1', _submission(2))
+    assert guard.counters() == {RATE_LIMITED_USER: 1, RATE_LIMITED_IP: 0, DUPLICATE: 1}
+
+
+def test_content_hash_depends_on_user_and_fields():
+    assert content_hash('user-1', SUBMISSION) == content_hash('user-1', dict(SUBMISSION, ignored='x'))
+    assert content_hash('user-1', SUBMISSION) != content_hash('user-2', SUBMISSION)
+    assert content_hash('user-1', SUBMISSION) != content_hash('user-1', dict(SUBMISSION, subject='other'))
+
+
+@pytest.mark.usefixtures('clean_redis')
+def test_redis_backend_shares_buckets():
+    first = _guard(RedisBackend(connect_to_redis(), prefix='pose_theme:test:'))
+    second = _guard(RedisBackend(connect_to_redis(), prefix='pose_theme:test:'))
+    assert first.check('user-1', '10.0.0.1', _submission(1))[0] is None
+    assert second.check('user-1', '10.0.0.1', _submission(1))[0].reason == DUPLICATE
+    assert second.check('user-1', '10.0.0.1', _submission(2))[0] is None
+    assert first.check('user-1', '10.0.0.1', _submission(3))[0].reason == RATE_LIMITED_USER
+    assert first.counters() == {RATE_LIMITED_USER: 1, RATE_LIMITED_IP: 0, DUPLICATE: 1}
+
+
+@pytest.mark.usefixtures('clean_redis')
+def test_redis_backend_refunds_tokens():
+    backend = RedisBackend(connect_to_redis(), prefix='pose_theme:test:')
+    limit = Limit(1, 1.0 / 3600)
+    assert backend.take('user:1', limit) == 0
+    assert backend.take('user:1', limit) > 0
+    backend.refund('user:1', limit)
+    backend.refund('user:1', limit)
+    # Never more than the burst
+    assert backend.take('user:1', limit) == 0
+    assert backend.take('user:1', limit) > 0
+
+
+@pytest.mark.usefixtures('clean_db', 'with_request_context')
+def test_rejections_action_is_sysadmin_only():
+    user = factories.User()
+    with pytest.raises(NotAuthorized):
+        helpers.call_action('pose_theme_contact_rejections',
+                            context={'user': user['name'], 'ignore_auth': False})
+    result = helpers.call_action('pose_theme_contact_rejections')
+    assert set(result) == {RATE_LIMITED_USER, RATE_LIMITED_IP, DUPLICATE, 'backend'}
@@ -0,0 +1,72 @@
+import pytest
+
+from ckanext.contact.recaptcha import RecaptchaError
+
+from ckanext.pose_theme.routes import recaptcha_client
+from ckanext.pose_theme.routes.recaptcha_client import RecaptchaClient, ReplayCache
+
+
+@pytest.fixture
+def server(recaptcha_server):
+    return recaptcha_server({'good-token': 'contact', 'other-token': 'contact'})
+
+
+def test_valid_token_passes_and_connection_is_reused(server):
+    client = RecaptchaClient('secret', server.verify_url)
+    client.verify('good-token', 'contact', '10.0.0.1')
+    client.verify('other-token', 'contact')
+    assert server.connections == 1
+    assert server.requests[0] == {'secret': ['secret'], 'response': ['good-token'], 'remoteip': ['10.0.0.1']}
+
+
+@pytest.mark.usefixtures('ckan_config')
+@pytest.mark.ckan_config('ckanext.contact.recaptcha_v3_key', 'key')
+@pytest.mark.ckan_config('ckanext.contact.recaptcha_v3_secret', 'secret')
+@pytest.mark.ckan_config('ckanext.pose_theme.contact.trusted_proxies', '1')
+def test_check_recaptcha_sends_the_client_ip_behind_proxies(app, server, monkeypatch):
+    monkeypatch.setattr(recaptcha_client, '_client', RecaptchaClient('secret', server.verify_url))
+    environ = {'REMOTE_ADDR': '127.0.0.1', 'HTTP_X_FORWARDED_FOR': '203.0.113.7'}
+    with app.flask_app.test_request_context('/contact', method='POST', environ_base=environ):
+        recaptcha_client.check_recaptcha('good-token', 'contact')
+    assert server.requests[0]['remoteip'] == ['203.0.113.7']
+
+
+def test_invalid_token_and_wrong_action_are_rejected(server):
+    client = RecaptchaClient('secret', server.verify_url)
+    with pytest.raises(RecaptchaError, match='invalid-input-response'):
+        client.verify('bad-token', 'contact')
+    with pytest.raises(RecaptchaError):
+        client.verify('good-token', 'login')
+
+
+def test_replayed_token_is_rejected_without_request(server):
+    client = RecaptchaClient('secret', server.verify_url)
+    client.verify('good-token', 'contact')
+    with pytest.raises(RecaptchaError, match='timeout-or-duplicate'):
+        client.verify('good-token', 'contact')
+    assert len(server.requests) == 1
+
+
+@pytest.mark.parametrize('fail_open', [True, False])
+def test_slow_endpoint_follows_failure_policy(recaptcha_server, fail_open):
+    server = recaptcha_server({'good-token': 'contact'}, delay=0.5)
+    client = RecaptchaClient('secret', server.verify_url, timeouts=(0.5, 0.1), fail_open=fail_open)
+    if fail_open:
+        client.verify('good-token', 'contact')
+    else:
+        with pytest.raises(RecaptchaError):
+            client.verify('good-token', 'contact')
+
+
+def test_endpoint_errors_follow_failure_policy(recaptcha_server):
+    server = recaptcha_server(status=503)
+    RecaptchaClient('secret', server.verify_url, fail_open=True).verify('token-1', 'contact')
+    with pytest.raises(RecaptchaError):
+        RecaptchaClient('secret', server.verify_url).verify('token-2', 'contact')
+
+
+def test_replay_cache_forgets_expired_tokens():
+    cache = ReplayCache(ttl=-1)
+    assert cache.add('token')
+    assert cache.add('token')
+